@@ -0,0 +1,181 @@
+"""Настройка общего кеша и сбор статистики попаданий.
+
+Бэкенд выбирается URL-ом из переменной окружения YATUBE_CACHE_URL:
+
+    locmem://                     - память процесса (по умолчанию)
+    file:///var/tmp/yatube-cache  - файлы, общие для всех воркеров
+    memcached://127.0.0.1:11211   - memcached (нужен python-memcached)
+    redis://127.0.0.1:6379/1      - Redis (нужен django-redis)
+    dummy://                      - без кеширования
+
+Параметры timeout и key_prefix передаются в строке запроса URL.
+Любой бэкенд оборачивается в StatsCache, который считает попадания.
+"""
+import threading
+from urllib.parse import parse_qs, urlsplit
+
+from django.core.cache import caches
+from django.core.cache.backends.base import DEFAULT_TIMEOUT, BaseCache
+from django.core.exceptions import ImproperlyConfigured
+from django.utils.module_loading import import_string
+
+BACKENDS = {
+    'locmem': 'django.core.cache.backends.locmem.LocMemCache',
+    'file': 'django.core.cache.backends.filebased.FileBasedCache',
+    'memcached': 'django.core.cache.backends.memcached.MemcachedCache',
+    'redis': 'django_redis.cache.RedisCache',
+    'dummy': 'django.core.cache.backends.dummy.DummyCache',
+}
+
+_MISSING = object()
+
+
+class CacheStats:
+    """Счётчики операций кеша, общие для всех потоков процесса."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._counts = dict.fromkeys(
+            ('hits', 'misses', 'sets', 'deletes'), 0)
+
+    def count(self, name, value=1):
+        with self._lock:
+            self._counts[name] += value
+
+    def snapshot(self):
+        with self._lock:
+            stats = dict(self._counts)
+        reads = stats['hits'] + stats['misses']
+        stats['hit_ratio'] = stats['hits'] / reads if reads else 0.0
+        return stats
+
+    def reset(self):
+        with self._lock:
+            for name in self._counts:
+                self._counts[name] = 0
+
+
+# Django создаёт экземпляр бэкенда на каждый поток,
+# поэтому статистика хранится на уровне модуля
+_stats = {}
+_stats_lock = threading.Lock()
+
+
+def cache_config(url):
+    """Строит описание кеша для settings.CACHES по URL."""
+    parts = urlsplit(url)
+    if parts.scheme not in BACKENDS:
+        raise ImproperlyConfigured(f'Неизвестный бэкенд кеша: {url}')
+    if parts.scheme == 'file':
+        location = parts.netloc + parts.path
+    elif parts.scheme == 'redis':
+        location = f'redis://{parts.netloc}{parts.path}'
+    elif parts.scheme == 'memcached':
+        location = parts.netloc.split(',')
+    else:
+        location = parts.netloc
+    config = {
+        'BACKEND': 'core.cache.StatsCache',
+        'WRAPPED': BACKENDS[parts.scheme],
+        'LOCATION': location,
+    }
+    query = {key: values[-1] for key, values in parse_qs(parts.query).items()}
+    if 'timeout' in query:
+        config['TIMEOUT'] = int(query['timeout'])
+    if 'key_prefix' in query:
+        config['KEY_PREFIX'] = query['key_prefix']
+    return config
+
+
+class StatsCache(BaseCache):
+    """Прокси над настоящим бэкендом, считающий попадания и промахи
+    текущего процесса."""
+
+    def __init__(self, location, params):
+        params = dict(params)
+        wrapped = params.pop('WRAPPED')
+        super().__init__(params)
+        self._cache = import_string(wrapped)(location, params)
+        with _stats_lock:
+            self._stats = _stats.setdefault(
+                (wrapped, str(location), self.key_prefix), CacheStats())
+        # Импорт здесь: модуль кеша читается ещё при загрузке настроек
+        from .instrumentation import current
+        self._current_metrics = current
+
+    def _count(self, name, value=1):
+        self._stats.count(name, value)
+        metrics = self._current_metrics()
+        if metrics is not None:
+            metrics.count_cache(name, value)
+
+    def stats(self):
+        """Счётчики операций и доля попаданий в текущем процессе."""
+        stats = self._stats.snapshot()
+        stats['backend'] = type(self._cache).__name__
+        return stats
+
+    def reset_stats(self):
+        self._stats.reset()
+
+    def get(self, key, default=None, version=None):
+        value = self._cache.get(key, _MISSING, version=version)
+        if value is _MISSING:
+            self._count('misses')
+            return default
+        self._count('hits')
+        return value
+
+    def get_many(self, keys, version=None):
+        keys = list(keys)
+        found = self._cache.get_many(keys, version=version)
+        self._count('hits', len(found))
+        self._count('misses', len(keys) - len(found))
+        return found
+
+    def add(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        added = self._cache.add(key, value, timeout, version=version)
+        if added:
+            self._count('sets')
+        return added
+
+    def set(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        self._count('sets')
+        return self._cache.set(key, value, timeout, version=version)
+
+    def set_many(self, data, timeout=DEFAULT_TIMEOUT, version=None):
+        self._count('sets', len(data))
+        return self._cache.set_many(data, timeout, version=version)
+
+    def touch(self, key, timeout=DEFAULT_TIMEOUT, version=None):
+        return self._cache.touch(key, timeout, version=version)
+
+    def delete(self, key, version=None):
+        self._count('deletes')
+        return self._cache.delete(key, version=version)
+
+    def delete_many(self, keys, version=None):
+        keys = list(keys)
+        self._count('deletes', len(keys))
+        return self._cache.delete_many(keys, version=version)
+
+    def has_key(self, key, version=None):
+        return self._cache.has_key(key, version=version)
+
+    def incr(self, key, delta=1, version=None):
+        return self._cache.incr(key, delta, version=version)
+
+    def decr(self, key, delta=1, version=None):
+        return self._cache.decr(key, delta, version=version)
+
+    def clear(self):
+        return self._cache.clear()
+
+    def close(self, **kwargs):
+        return self._cache.close(**kwargs)
+
+
+def get_cache_stats(alias='default'):
+    """Статистика кеша или None, если он не обёрнут в StatsCache."""
+    backend = caches[alias]
+    return backend.stats() if isinstance(backend, StatsCache) else None
@@ -0,0 +1,293 @@
+"""Метрики производительности запросов.
+
+Для каждого запроса считаются время ответа и статус. Для доли
+запросов settings.INSTRUMENTATION_SAMPLE_RATE дополнительно
+собираются время и число SQL-запросов, попадания и промахи кеша и
+время рендера шаблонов: эти замеры вешают обёртки на каждый запрос
+к БД, поэтому включаются выборочно. Детали выборочного запроса
+отдаются клиенту в заголовке Server-Timing; время и число SQL-запросов
+в нём видны только при DEBUG и сотрудникам.
+
+Метрики копятся в памяти процесса и отдаются в текстовом формате
+Prometheus, каждый воркер отдаёт свои.
+
+В режиме профилирования шаблонов (settings.TEMPLATE_PROFILING)
+загрузчик ProfilingLoader засекает рендер каждого шаблона, включая
+include и extends: полное время и собственное, без вложенных шаблонов.
+"""
+import random
+import threading
+import time
+from collections import defaultdict
+from contextlib import ExitStack
+
+from django.conf import settings
+from django.db import connections
+from django.template.backends.django import DjangoTemplates
+from django.template.loaders import cached
+
+# Границы корзин гистограммы времени ответа, в секундах
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+
+_local = threading.local()
+
+
+def current():
+    """Замеры выборочного запроса текущего потока или None."""
+    return getattr(_local, 'metrics', None)
+
+
+class RequestMetrics:
+    """Замеры одного выборочного запроса."""
+
+    def __init__(self):
+        self.queries = 0
+        self.db_time = 0.0
+        self.cache_hits = 0
+        self.cache_misses = 0
+        self.template_time = 0.0
+        self._template_depth = 0
+
+    def __call__(self, execute, sql, params, many, context):
+        """execute_wrapper: время и число SQL-запросов."""
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.db_time += time.perf_counter() - started
+            self.queries += 1
+
+    def count_cache(self, name, value=1):
+        if name == 'hits':
+            self.cache_hits += value
+        elif name == 'misses':
+            self.cache_misses += value
+
+    def server_timing(self, total, with_db=False):
+        parts = [f'total;dur={total * 1000:.1f}']
+        if with_db:
+            parts.append(
+                f'db;dur={self.db_time * 1000:.1f};'
+                f'desc="{self.queries} queries"')
+        parts.append(
+            f'cache;desc="hits={self.cache_hits} misses={self.cache_misses}"')
+        parts.append(f'tpl;dur={self.template_time * 1000:.1f}')
+        return ', '.join(parts)
+
+
+class Registry:
+    """Накопленные метрики процесса по именам view."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self.requests = defaultdict(int)
+            self.buckets = defaultdict(lambda: [0] * len(BUCKETS))
+            self.durations = defaultdict(float)
+            self.counts = defaultdict(int)
+            self.sampled = defaultdict(lambda: defaultdict(float))
+            # Имя шаблона -> [рендеров, полное время, собственное время]
+            self.templates = defaultdict(lambda: [0, 0.0, 0.0])
+
+    def observe(self, view, method, status, duration, metrics=None):
+        with self._lock:
+            self.requests[(view, method, status)] += 1
+            self.durations[view] += duration
+            self.counts[view] += 1
+            buckets = self.buckets[view]
+            for index, bound in enumerate(BUCKETS):
+                if duration <= bound:
+                    buckets[index] += 1
+            if metrics is not None:
+                sampled = self.sampled[view]
+                sampled['requests'] += 1
+                sampled['queries'] += metrics.queries
+                sampled['db_seconds'] += metrics.db_time
+                sampled['cache_hits'] += metrics.cache_hits
+                sampled['cache_misses'] += metrics.cache_misses
+                sampled['template_seconds'] += metrics.template_time
+
+    def observe_template(self, name, duration, own):
+        with self._lock:
+            stats = self.templates[name]
+            stats[0] += 1
+            stats[1] += duration
+            stats[2] += own
+
+    def template_profile(self):
+        """Шаблоны по убыванию собственного времени рендера."""
+        with self._lock:
+            return sorted(
+                ((name, *stats) for name, stats in self.templates.items()),
+                key=lambda row: row[3], reverse=True,
+            )
+
+    def render(self):
+        """Метрики в текстовом формате Prometheus."""
+        with self._lock:
+            lines = [
+                '# TYPE yatube_requests_total counter',
+                *(
+                    f'yatube_requests_total{{view="{view}",'
+                    f'method="{method}",status="{status}"}} {count}'
+                    for (view, method, status), count
+                    in sorted(self.requests.items())
+                ),
+                '# TYPE yatube_request_duration_seconds histogram',
+            ]
+            for view in sorted(self.counts):
+                for bound, count in zip(BUCKETS, self.buckets[view]):
+                    lines.append(
+                        'yatube_request_duration_seconds_bucket'
+                        f'{{view="{view}",le="{bound}"}} {count}')
+                lines.extend((
+                    'yatube_request_duration_seconds_bucket'
+                    f'{{view="{view}",le="+Inf"}} {self.counts[view]}',
+                    'yatube_request_duration_seconds_sum'
+                    f'{{view="{view}"}} {self.durations[view]:.6f}',
+                    'yatube_request_duration_seconds_count'
+                    f'{{view="{view}"}} {self.counts[view]}',
+                ))
+            for name in (
+                'requests', 'queries', 'db_seconds', 'cache_hits',
+                'cache_misses', 'template_seconds',
+            ):
+                lines.append(f'# TYPE yatube_sampled_{name}_total counter')
+                lines.extend(
+                    f'yatube_sampled_{name}_total{{view="{view}"}} '
+                    f'{values[name]:g}'
+                    for view, values in sorted(self.sampled.items())
+                )
+            if self.templates:
+                lines.extend((
+                    '# TYPE yatube_template_renders_total counter',
+                    '# TYPE yatube_template_seconds_total counter',
+                    '# TYPE yatube_template_own_seconds_total counter',
+                ))
+            for name, (count, total, own) in sorted(self.templates.items()):
+                lines.extend((
+                    f'yatube_template_renders_total{{template="{name}"}} '
+                    f'{count}',
+                    f'yatube_template_seconds_total{{template="{name}"}} '
+                    f'{total:.6f}',
+                    f'yatube_template_own_seconds_total{{template="{name}"}} '
+                    f'{own:.6f}',
+                ))
+        return '\n'.join(lines) + '\n'
+
+
+registry = Registry()
+
+
+def shows_db_timing(request):
+    """Время SQL выдаёт устройство базы, его видят только свои."""
+    user = getattr(request, 'user', None)
+    return settings.DEBUG or bool(user and user.is_staff)
+
+
+def view_name(request):
+    match = getattr(request, 'resolver_match', None)
+    return match.view_name if match else 'unresolved'
+
+
+class InstrumentationMiddleware:
+    """Замеряет каждый запрос и подробно - выборочные."""
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        metrics = None
+        if random.random() < settings.INSTRUMENTATION_SAMPLE_RATE:
+            metrics = _local.metrics = RequestMetrics()
+        started = time.perf_counter()
+        try:
+            with ExitStack() as stack:
+                if metrics is not None:
+                    for connection in connections.all():
+                        stack.enter_context(
+                            connection.execute_wrapper(metrics))
+                response = self.get_response(request)
+        finally:
+            _local.metrics = None
+        duration = time.perf_counter() - started
+        registry.observe(
+            view_name(request), request.method, response.status_code,
+            duration, metrics,
+        )
+        if metrics is not None:
+            response['Server-Timing'] = metrics.server_timing(
+                duration, shows_db_timing(request))
+        return response
+
+
+class InstrumentedTemplate:
+    """Шаблон, засекающий время рендера для выборочного запроса."""
+
+    def __init__(self, template):
+        self._wrapped = template
+
+    def __getattr__(self, name):
+        return getattr(self._wrapped, name)
+
+    def render(self, context=None, request=None):
+        metrics = current()
+        if metrics is None:
+            return self._wrapped.render(context, request)
+        # Вложенные render_to_string входят во время внешнего рендера
+        metrics._template_depth += 1
+        started = time.perf_counter()
+        try:
+            return self._wrapped.render(context, request)
+        finally:
+            metrics._template_depth -= 1
+            if not metrics._template_depth:
+                metrics.template_time += time.perf_counter() - started
+
+
+class InstrumentedDjangoTemplates(DjangoTemplates):
+    """Бэкенд шаблонов Django с замером времени рендера."""
+
+    def from_string(self, template_code):
+        return InstrumentedTemplate(super().from_string(template_code))
+
+    def get_template(self, template_name):
+        return InstrumentedTemplate(super().get_template(template_name))
+
+
+def _profile(template):
+    """Засекает каждый _render шаблона: через него идут и render,
+    и include, и рендер родителя в extends. Блоки дочернего шаблона
+    рендерятся внутри родителя и входят в его собственное время."""
+    def render(context):
+        stack = _local.__dict__.setdefault('template_stack', [])
+        # Вершина стека копит время вложенных шаблонов
+        stack.append(0.0)
+        started = time.perf_counter()
+        try:
+            # Метод класса ищется при вызове: тестовый раннер Django
+            # подменяет его, чтобы собирать response.templates
+            return type(template)._render(template, context)
+        finally:
+            duration = time.perf_counter() - started
+            nested = stack.pop()
+            if stack:
+                stack[-1] += duration
+            registry.observe_template(
+                template.name or '<string>', duration, duration - nested)
+    template._render = render
+    template.profiled = True
+    return template
+
+
+class ProfilingLoader(cached.Loader):
+    """Кеширующий загрузчик, профилирующий загруженные шаблоны."""
+
+    def get_template(self, template_name, skip=None):
+        template = super().get_template(template_name, skip)
+        if not getattr(template, 'profiled', False):
+            _profile(template)
+        return template
@@ -0,0 +1,32 @@
+import sqlite3
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+
+
+class Command(BaseCommand):
+    help = (
+        'Копирует основную базу SQLite в файлы реплик '
+        '(settings.DATABASE_REPLICAS) для локальной проверки чтения с реплик'
+    )
+
+    def handle(self, *args, **options):
+        primary = connections['default']
+        if primary.vendor != 'sqlite':
+            raise CommandError(
+                'Реплики других СУБД настраиваются репликацией самой СУБД')
+        if not settings.DATABASE_REPLICAS:
+            raise CommandError('Реплики не заданы: укажите YATUBE_REPLICAS')
+        source = sqlite3.connect(primary.settings_dict['NAME'])
+        try:
+            for alias in settings.DATABASE_REPLICAS:
+                target = sqlite3.connect(settings.DATABASES[alias]['NAME'])
+                try:
+                    # Онлайн-копия: писатели основной базы не блокируются
+                    source.backup(target)
+                finally:
+                    target.close()
+                self.stdout.write(f'{alias}: скопирована')
+        finally:
+            source.close()
@@ -0,0 +1,62 @@
+import logging
+from contextlib import ExitStack
+
+from django.conf import settings
+from django.db import connections
+
+logger = logging.getLogger(__name__)
+
+
+class QueryBudgetExceeded(Exception):
+    """View выполнил больше SQL-запросов, чем ему разрешено."""
+
+
+def query_budget(limit):
+    """Задаёт view собственный бюджет SQL-запросов."""
+    def decorator(view_func):
+        view_func.query_budget = limit
+        return view_func
+    return decorator
+
+
+class QueryCounter:
+    """Обёртка execute_wrapper, считающая выполненные запросы."""
+
+    def __init__(self):
+        self.count = 0
+
+    def __call__(self, execute, sql, params, many, context):
+        self.count += 1
+        return execute(sql, params, many, context)
+
+
+class QueryBudgetMiddleware:
+    """Считает SQL-запросы каждого запроса и пишет в лог
+    (или падает в строгом режиме), если view превысил бюджет."""
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        if settings.QUERY_BUDGET is None:
+            return self.get_response(request)
+        request.query_budget = settings.QUERY_BUDGET
+        counter = QueryCounter()
+        with ExitStack() as stack:
+            for connection in connections.all():
+                stack.enter_context(connection.execute_wrapper(counter))
+            response = self.get_response(request)
+        if counter.count > request.query_budget:
+            message = (
+                f'{request.path}: {counter.count} SQL-запросов '
+                f'при бюджете {request.query_budget}'
+            )
+            if settings.QUERY_BUDGET_STRICT:
+                raise QueryBudgetExceeded(message)
+            logger.warning(message)
+        return response
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        budget = getattr(view_func, 'query_budget', None)
+        if budget is not None and hasattr(request, 'query_budget'):
+            request.query_budget = budget
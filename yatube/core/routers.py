@@ -0,0 +1,105 @@
+"""Чтение лент с реплик базы данных.
+
+View, помеченные replica_reads, читают с одной из реплик
+settings.DATABASE_REPLICAS, все записи и остальные view работают
+с основной базой. Пользователь, который что-то записал, на
+REPLICA_PIN_SECONDS "прилипает" к основной базе (cookie), чтобы
+видеть свои изменения, пока реплики догоняют.
+
+Запрос читает с одной реплики, выбранной при входе во view, чтобы
+разные части страницы не расходились из-за разного отставания.
+
+Страницы, которые попадают в кеш лент, собираются по основной базе:
+отставшая реплика иначе закешировала бы старые данные под новой
+версией области до следующего изменения. По той же причине страница
+с ETag по недавно изменённым областям читается с основной базы
+(read_primary): иначе клиент получил бы старое тело под новым ETag
+и дальше получал бы на него 304.
+"""
+import random
+import threading
+from contextlib import contextmanager
+from functools import wraps
+
+from django.conf import settings
+
+PRIMARY = 'default'
+PIN_COOKIE = 'db_pin'
+SAFE_METHODS = ('GET', 'HEAD', 'OPTIONS')
+
+_local = threading.local()
+
+
+def replica_reads(view_func):
+    """Разрешает view читать с реплик, если пользователь
+    не привязан к основной базе после записи."""
+    @wraps(view_func)
+    def wrapper(request, *args, **kwargs):
+        previous = getattr(_local, 'replica', None)
+        replicas = settings.DATABASE_REPLICAS
+        _local.replica = None
+        if replicas and not getattr(request, 'db_pinned', False):
+            _local.replica = random.choice(replicas)
+        try:
+            return view_func(request, *args, **kwargs)
+        finally:
+            _local.replica = previous
+    return wrapper
+
+
+@contextmanager
+def primary_reads():
+    """Временно читает с основной базы внутри replica_reads."""
+    previous = getattr(_local, 'replica', None)
+    _local.replica = None
+    try:
+        yield
+    finally:
+        _local.replica = previous
+
+
+def read_primary():
+    """До конца текущего replica_reads читает с основной базы."""
+    _local.replica = None
+
+
+class ReplicaRouter:
+    def db_for_read(self, model, **hints):
+        replica = getattr(_local, 'replica', None)
+        if replica and not getattr(_local, 'wrote', False):
+            return replica
+        return PRIMARY
+
+    def db_for_write(self, model, **hints):
+        # После записи и до конца запроса чтения идут в основную базу
+        _local.wrote = True
+        return PRIMARY
+
+    def allow_relation(self, obj1, obj2, **hints):
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        return db not in settings.DATABASE_REPLICAS
+
+
+class ReplicaPinningMiddleware:
+    """Привязывает к основной базе пользователей, которые недавно
+    что-то записали."""
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        request.db_pinned = PIN_COOKIE in request.COOKIES
+        _local.wrote = False
+        try:
+            response = self.get_response(request)
+            wrote = _local.wrote
+        finally:
+            _local.wrote = False
+        if wrote or request.method not in SAFE_METHODS:
+            response.set_cookie(
+                PIN_COOKIE, '1', max_age=settings.REPLICA_PIN_SECONDS,
+                httponly=True, samesite='Lax',
+            )
+        return response
@@ -0,0 +1,21 @@
+"""Настройка соединений SQLite.
+
+Каждое новое соединение получает PRAGMA из settings.SQLITE_PRAGMAS.
+journal_mode=WAL позволяет читателям не ждать писателя,
+synchronous=NORMAL в режиме WAL сохраняет целостность базы и реже
+вызывает fsync, cache_size и mmap_size держат горячие страницы
+в памяти, а busy_timeout заставляет писателей ждать блокировку,
+а не сразу падать с "database is locked".
+"""
+from django.conf import settings
+from django.db.backends.signals import connection_created
+from django.dispatch import receiver
+
+
+@receiver(connection_created)
+def configure_sqlite(sender, connection, **kwargs):
+    if connection.vendor != 'sqlite':
+        return
+    with connection.cursor() as cursor:
+        for name, value in settings.SQLITE_PRAGMAS.items():
+            cursor.execute(f'PRAGMA {name} = {value}')
@@ -0,0 +1,311 @@
+import tempfile
+
+import fakeredis
+from django.contrib.auth.models import AnonymousUser
+from django.core.cache import cache
+from django.core.exceptions import ImproperlyConfigured
+from django.db import connection
+from django.http import HttpResponse
+from django.template import Context, Engine, engines
+from django.template.loaders.cached import Loader as CachedLoader
+from django.test import (RequestFactory, SimpleTestCase, TestCase,
+                         modify_settings, override_settings)
+from django.urls import resolve, reverse
+
+from posts import cache as feed_cache
+from posts.views import FEED_QUERY_BUDGET
+from posts.models import Group, User
+
+from .cache import StatsCache, cache_config
+from .instrumentation import registry
+from .routers import (PIN_COOKIE, PRIMARY, ReplicaPinningMiddleware,
+                      ReplicaRouter, primary_reads, replica_reads)
+from .middleware import (QueryBudgetExceeded, QueryBudgetMiddleware,
+                         query_budget)
+
+
+@query_budget(1)
+def two_queries_view(request):
+    Group.objects.count()
+    Group.objects.count()
+    return HttpResponse()
+
+
+@override_settings(QUERY_BUDGET=30)
+class QueryBudgetMiddlewareTests(TestCase):
+    def setUp(self):
+        self.request = RequestFactory().get('/')
+        self.middleware = QueryBudgetMiddleware(self.get_response)
+
+    def get_response(self, request):
+        self.middleware.process_view(request, two_queries_view, (), {})
+        return two_queries_view(request)
+
+    @override_settings(QUERY_BUDGET_STRICT=True)
+    def test_strict_mode_raises_over_budget(self):
+        """В строгом режиме превышение бюджета view роняет запрос"""
+        with self.assertRaises(QueryBudgetExceeded):
+            self.middleware(self.request)
+
+    @override_settings(QUERY_BUDGET_STRICT=False)
+    def test_over_budget_is_logged(self):
+        """Без строгого режима превышение бюджета пишется в лог"""
+        with self.assertLogs('core.middleware', 'WARNING'):
+            self.middleware(self.request)
+
+    @override_settings(QUERY_BUDGET=None, QUERY_BUDGET_STRICT=True)
+    def test_disabled_budget(self):
+        """QUERY_BUDGET = None отключает подсчёт"""
+        self.assertEqual(self.middleware(self.request).status_code, 200)
+
+    @modify_settings(MIDDLEWARE={
+        'append': 'core.middleware.QueryBudgetMiddleware'})
+    @override_settings(QUERY_BUDGET_STRICT=True)
+    def test_feed_views_have_own_budget(self):
+        """Ленты укладываются в свой, более строгий бюджет"""
+        for url in (reverse('posts:index'), reverse('posts:search')):
+            with self.subTest(url=url):
+                self.assertEqual(
+                    resolve(url).func.query_budget, FEED_QUERY_BUDGET)
+                self.assertEqual(self.client.get(url).status_code, 200)
+
+
+class CacheConfigTests(SimpleTestCase):
+    def test_urls_map_to_backends(self):
+        """URL кеша превращается в описание бэкенда"""
+        cases = {
+            'locmem://': (
+                'django.core.cache.backends.locmem.LocMemCache', ''),
+            'file:///var/tmp/cache': (
+                'django.core.cache.backends.filebased.FileBasedCache',
+                '/var/tmp/cache'),
+            'memcached://a:11211,b:11211': (
+                'django.core.cache.backends.memcached.MemcachedCache',
+                ['a:11211', 'b:11211']),
+            'redis://127.0.0.1:6379/1': (
+                'django_redis.cache.RedisCache', 'redis://127.0.0.1:6379/1'),
+        }
+        for url, (backend, location) in cases.items():
+            with self.subTest(url=url):
+                config = cache_config(url)
+                self.assertEqual(config['BACKEND'], 'core.cache.StatsCache')
+                self.assertEqual(config['WRAPPED'], backend)
+                self.assertEqual(config['LOCATION'], location)
+
+    def test_query_options_and_unknown_scheme(self):
+        """Параметры URL передаются в настройки, чужая схема - ошибка"""
+        config = cache_config('locmem://?timeout=60&key_prefix=yatube')
+        self.assertEqual(config['TIMEOUT'], 60)
+        self.assertEqual(config['KEY_PREFIX'], 'yatube')
+        with self.assertRaises(ImproperlyConfigured):
+            cache_config('ftp://example.com')
+
+    def test_file_cache_is_shared_and_counted(self):
+        """Файловый кеш общий для воркеров, статистика считает попадания"""
+        with tempfile.TemporaryDirectory() as directory:
+            config = cache_config(f'file://{directory}')
+            location = config.pop('LOCATION')
+            first = StatsCache(location, config)
+            second = StatsCache(location, config)
+            first.reset_stats()
+            first.set('page', 'content')
+            self.assertEqual(second.get('page'), 'content')
+            self.assertIsNone(second.get('missing'))
+            stats = first.stats()
+        self.assertEqual((stats['hits'], stats['misses']), (1, 1))
+        self.assertEqual(stats['hit_ratio'], 0.5)
+        self.assertEqual(stats['backend'], 'FileBasedCache')
+
+    def test_redis_cache_is_shared_and_counted(self):
+        """Redis-кеш (на fakeredis) общий для воркеров и поддерживает
+        операции, на которых держатся версии лент"""
+        config = cache_config('redis://127.0.0.1:6379/1?key_prefix=test')
+        location = config.pop('LOCATION')
+        config['OPTIONS'] = {'CONNECTION_POOL_KWARGS': {
+            'connection_class': fakeredis.FakeConnection}}
+        first = StatsCache(location, config)
+        second = StatsCache(location, config)
+        first.clear()
+        first.reset_stats()
+        first.set('version', 1)
+        self.assertEqual(second.incr('version'), 2)
+        self.assertFalse(second.add('version', 5))
+        self.assertEqual(first.get_many(['version', 'missing']),
+                         {'version': 2})
+        with self.assertRaises(ValueError):
+            first.incr('missing')
+        stats = first.stats()
+        self.assertEqual((stats['hits'], stats['misses']), (1, 1))
+        self.assertEqual(stats['backend'], 'RedisCache')
+
+
+class InstrumentationTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        registry.reset()
+
+    @override_settings(INSTRUMENTATION_SAMPLE_RATE=1.0)
+    def test_sampled_request_has_server_timing(self):
+        """Выборочный запрос отдаёт время SQL, кеша и шаблонов"""
+        response = self.client.get(reverse('posts:index'))
+        timing = response['Server-Timing']
+        for name in ('total;dur=', 'cache;desc=', 'tpl;dur='):
+            self.assertIn(name, timing)
+        self.assertNotIn('db;dur=', timing)
+        self.assertEqual(response.templates[0].name, 'posts/index.html')
+        self.assertIn(
+            'yatube_sampled_requests_total{view="posts:index"} 1',
+            registry.render())
+
+    @override_settings(INSTRUMENTATION_SAMPLE_RATE=0)
+    def test_unsampled_request_is_only_counted(self):
+        """Без выборки считаются только время ответа и статус"""
+        response = self.client.get(reverse('posts:index'))
+        self.assertFalse(response.has_header('Server-Timing'))
+        metrics = registry.render()
+        self.assertIn(
+            'yatube_requests_total{view="posts:index",method="GET",'
+            'status="200"} 1', metrics)
+        self.assertIn(
+            'yatube_request_duration_seconds_count{view="posts:index"} 1',
+            metrics)
+        self.assertNotIn('yatube_sampled_requests_total{', metrics)
+
+    @override_settings(INSTRUMENTATION_SAMPLE_RATE=1.0)
+    def test_db_timing_is_shown_to_staff(self):
+        """Время SQL в Server-Timing видят только сотрудники"""
+        self.client.force_login(User.objects.create_user(
+            username='staff', is_staff=True))
+        response = self.client.get(reverse('posts:index'))
+        self.assertIn('db;dur=', response['Server-Timing'])
+
+    @override_settings(METRICS_TOKEN='secret')
+    def test_metrics_endpoint(self):
+        """Метрики отдаются только по токену"""
+        self.client.get(reverse('posts:index'))
+        response = self.client.get(
+            reverse('metrics'), HTTP_AUTHORIZATION='Bearer secret')
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('yatube_cache_hits_total', response.content.decode())
+        for header in ({}, {'HTTP_AUTHORIZATION': 'Bearer wrong'}):
+            with self.subTest(header=header):
+                response = self.client.get(reverse('metrics'), **header)
+                self.assertEqual(response.status_code, 404)
+        with override_settings(METRICS_TOKEN=None):
+            response = self.client.get(
+                reverse('metrics'), HTTP_AUTHORIZATION='Bearer None')
+            self.assertEqual(response.status_code, 404)
+
+
+class TemplateProfilingTests(SimpleTestCase):
+    def setUp(self):
+        registry.reset()
+
+    def test_production_uses_cached_loader(self):
+        """Без DEBUG шаблоны берутся из кеширующего загрузчика"""
+        loader = engines['django'].engine.template_loaders[0]
+        self.assertIsInstance(loader, CachedLoader)
+
+    def test_profiling_loader_times_includes(self):
+        """Профилирование считает рендеры и собственное время шаблонов"""
+        engine = Engine(loaders=[(
+            'core.instrumentation.ProfilingLoader', [(
+                'django.template.loaders.locmem.Loader', {
+                    'base.html': '<{% block body %}{% endblock %}>',
+                    'page.html': (
+                        '{% extends "base.html" %}{% block body %}'
+                        '{% for i in items %}{% include "item.html" %}'
+                        '{% endfor %}{% endblock %}'),
+                    'item.html': '{{ i }}',
+                },
+            )],
+        )])
+        template = engine.get_template('page.html')
+        self.assertEqual(
+            template.render(Context({'items': range(3)})), '<012>')
+        profile = {name: stats for name, *stats in registry.template_profile()}
+        self.assertEqual(profile['item.html'][0], 3)
+        self.assertEqual(profile['page.html'][0], 1)
+        count, total, own = profile['base.html']
+        self.assertLess(own, total)
+        self.assertIn(
+            'yatube_template_renders_total{template="item.html"} 3',
+            registry.render())
+
+
+@override_settings(DATABASE_REPLICAS=['replica1', 'replica2'])
+class ReplicaRouterTests(SimpleTestCase):
+    def setUp(self):
+        self.router = ReplicaRouter()
+        self.factory = RequestFactory()
+
+    def read_db(self, request):
+        return self.router.db_for_read(Group)
+
+    def test_feed_views_read_from_replicas(self):
+        """Помеченные view читают с реплик, остальные - с основной базы"""
+        request = self.factory.get('/')
+        self.assertIn(replica_reads(self.read_db)(request), (
+            'replica1', 'replica2'))
+        self.assertEqual(self.read_db(request), PRIMARY)
+        with primary_reads():
+            self.assertEqual(self.read_db(request), PRIMARY)
+        self.assertFalse(self.router.allow_migrate('replica1', 'posts'))
+        self.assertTrue(self.router.allow_migrate(PRIMARY, 'posts'))
+
+    def test_writer_is_pinned_to_primary(self):
+        """После записи пользователь читает свои изменения с основной"""
+        def write_then_read(request):
+            self.assertEqual(self.router.db_for_write(Group), PRIMARY)
+            return HttpResponse(self.read_db(request))
+
+        middleware = ReplicaPinningMiddleware(replica_reads(write_then_read))
+        response = middleware(self.factory.post('/'))
+        self.assertEqual(response.content.decode(), PRIMARY)
+        self.assertIn(PIN_COOKIE, response.cookies)
+
+        middleware = ReplicaPinningMiddleware(
+            replica_reads(lambda request: HttpResponse(self.read_db(request))))
+        response = middleware(self.factory.get('/'))
+        self.assertNotEqual(response.content.decode(), PRIMARY)
+        self.assertNotIn(PIN_COOKIE, response.cookies)
+        request = self.factory.get('/')
+        request.COOKIES[PIN_COOKIE] = '1'
+        self.assertEqual(middleware(request).content.decode(), PRIMARY)
+
+    def test_request_reads_from_one_replica(self):
+        """Все чтения одного запроса идут с одной реплики"""
+        def reads(request):
+            return {self.read_db(request) for _ in range(20)}
+
+        self.assertEqual(
+            len(replica_reads(reads)(self.factory.get('/'))), 1)
+
+    def test_recent_changes_read_from_primary(self):
+        """Страница с ETag по недавно изменённой области читается
+        с основной базы, иначе под новым ETag попали бы старые данные"""
+        cache.clear()
+        etag = feed_cache.feed_etag('global')
+
+        def view(request):
+            etag(request)
+            return self.read_db(request)
+
+        request = self.factory.get('/')
+        request.user = AnonymousUser()
+        self.assertNotEqual(replica_reads(view)(request), PRIMARY)
+        feed_cache.bump('global')
+        self.assertEqual(replica_reads(view)(request), PRIMARY)
+
+
+class SqlitePragmaTests(TestCase):
+    def test_connection_gets_pragmas(self):
+        """Каждое соединение SQLite получает настройки из SQLITE_PRAGMAS"""
+        with connection.cursor() as cursor:
+            cursor.execute('PRAGMA busy_timeout')
+            self.assertEqual(cursor.fetchone()[0], 5000)
+            cursor.execute('PRAGMA synchronous')
+            # 1 - NORMAL
+            self.assertEqual(cursor.fetchone()[0], 1)
+            cursor.execute('PRAGMA cache_size')
+            self.assertEqual(cursor.fetchone()[0], -64000)
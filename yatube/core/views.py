@@ -1,4 +1,11 @@
+from django.contrib.admin.views.decorators import staff_member_required
+from django.conf import settings
+from django.http import Http404, HttpResponse, JsonResponse
 from django.shortcuts import render
+from django.utils.crypto import constant_time_compare
+
+from .cache import get_cache_stats
+from .instrumentation import registry
 
 
 def server_error(request):
@@ -11,3 +18,28 @@ def page_not_found(request, exception):
 
 def permission_denied(request, reason=''):
     return render(request, 'core/403csrf.html')
+
+
+@staff_member_required
+def cache_stats(request):
+    """Статистика общего кеша текущего процесса."""
+    return JsonResponse(get_cache_stats() or {})
+
+
+def metrics(request):
+    """Метрики процесса в текстовом формате Prometheus.
+    Отдаются только по токену: адрес клиента за прокси ничего
+    не говорит."""
+    token = settings.METRICS_TOKEN
+    if not token or not constant_time_compare(
+            request.META.get('HTTP_AUTHORIZATION', ''), f'Bearer {token}'):
+        raise Http404
+    lines = [registry.render()]
+    stats = get_cache_stats()
+    if stats:
+        for name in ('hits', 'misses', 'sets', 'deletes'):
+            lines.append(
+                f'# TYPE yatube_cache_{name}_total counter\n'
+                f'yatube_cache_{name}_total {stats[name]}\n')
+    return HttpResponse(
+        ''.join(lines), content_type='text/plain; version=0.0.4')
@@ -0,0 +1,220 @@
+"""JSON API для чтения лент.
+
+Посты и комментарии выбираются через .values(), без создания
+моделей, страницы листаются курсором, как и HTML-ленты, а ответ
+сериализуется по одному объекту прямо в поток ответа.
+"""
+import json
+
+from django.core.files.storage import default_storage
+from django.core.serializers.json import DjangoJSONEncoder
+from django.http import (HttpResponseNotAllowed, JsonResponse,
+                         StreamingHttpResponse)
+from django.shortcuts import get_object_or_404
+
+from core.routers import replica_reads
+
+from . import archive, following, suggestions
+from .cache import conditional_feed, post_scopes
+from .models import ArchivedComment, Comment, Group, Post, User
+from .timeline import CURSOR_FIELDS, feed_for
+from .utils import (COMMENTS_ORDER_PARAM, COMMENTS_PER_PAGE, CURSOR_PARAM,
+                    OLDEST, POSTS_PER_PAGE, CursorPaginator, comments_order)
+
+MAX_PER_PAGE = 100
+LIMIT_PARAM = 'limit'
+
+POST_FIELDS = (
+    'id',
+    'text',
+    'pub_date',
+    'updated',
+    'image',
+    'comments_count',
+    'author__username',
+    'group__slug',
+)
+COMMENT_FIELDS = ('id', 'text', 'created', 'author__username')
+
+
+def _dumps(value):
+    return json.dumps(value, cls=DjangoJSONEncoder, ensure_ascii=False)
+
+
+def serialize_post(row):
+    return {
+        'id': row['id'],
+        'text': row['text'],
+        'pub_date': row['pub_date'],
+        'updated': row['updated'],
+        'image': default_storage.url(row['image']) if row['image'] else None,
+        'comments_count': row['comments_count'],
+        'author': row['author__username'],
+        'group': row['group__slug'],
+    }
+
+
+def serialize_comment(row):
+    return {
+        'id': row['id'],
+        'text': row['text'],
+        'created': row['created'],
+        'author': row['author__username'],
+    }
+
+
+def stream_json(fields, name, items):
+    """Пишет объект JSON по частям: сначала поля, затем элементы
+    списка name по одному, не собирая весь ответ в памяти."""
+    yield _dumps(fields)[:-1]
+    yield (', ' if fields else '') + f'"{name}": ['
+    for number, item in enumerate(items):
+        yield (', ' if number else '') + _dumps(item)
+    yield ']}'
+
+
+def _limit(request):
+    try:
+        limit = int(request.GET.get(LIMIT_PARAM, POSTS_PER_PAGE))
+    except ValueError:
+        limit = POSTS_PER_PAGE
+    return min(max(limit, 1), MAX_PER_PAGE)
+
+
+def posts_page(request, queryset, **cursor_fields):
+    """Страница постов по курсору из запроса."""
+    paginator = CursorPaginator(
+        queryset.values(*POST_FIELDS), _limit(request), **cursor_fields)
+    page = paginator.get_page(request.GET.get(CURSOR_PARAM))
+    return StreamingHttpResponse(
+        stream_json(
+            {
+                'next_cursor': page.next_cursor,
+                'previous_cursor': page.previous_cursor,
+            },
+            'results',
+            map(serialize_post, page),
+        ),
+        content_type='application/json',
+    )
+
+
+@replica_reads
+@conditional_feed('global')
+def posts(request):
+    return posts_page(request, Post.objects.all())
+
+
+@replica_reads
+@conditional_feed('group:{slug}')
+def group_posts(request, slug):
+    group = get_object_or_404(Group, slug=slug)
+    return posts_page(request, group.posts.all())
+
+
+@replica_reads
+@conditional_feed('author:{username}')
+def profile_posts(request, username):
+    author = get_object_or_404(User, username=username)
+    return posts_page(request, archive.author_feed(author))
+
+
+def comments_page(request, post, token):
+    """Страница комментариев поста - словаря из get_post_or_404
+    с полем is_archived."""
+    model = ArchivedComment if post['is_archived'] else Comment
+    paginator = CursorPaginator(
+        model.objects.filter(post_id=post['id']).values(*COMMENT_FIELDS),
+        COMMENTS_PER_PAGE,
+        date_field='created',
+        ascending=comments_order(
+            request.GET.get(COMMENTS_ORDER_PARAM)) == OLDEST,
+    )
+    return paginator.get_page(token)
+
+
+@replica_reads
+@conditional_feed(post_scopes)
+def post_detail(request, post_id):
+    """Пост с первой страницей комментариев."""
+    row = archive.get_post_or_404(post_id, fields=POST_FIELDS)
+    page = comments_page(request, row, None)
+    fields = serialize_post(row)
+    fields['comments_next_cursor'] = page.next_cursor
+    return StreamingHttpResponse(
+        stream_json(fields, 'comments', map(serialize_comment, page)),
+        content_type='application/json',
+    )
+
+
+@replica_reads
+@conditional_feed('post:{post_id}')
+def post_comments(request, post_id):
+    post = archive.get_post_or_404(post_id, fields=('id',))
+    page = comments_page(request, post, request.GET.get(CURSOR_PARAM))
+    return StreamingHttpResponse(
+        stream_json(
+            {
+                'next_cursor': page.next_cursor,
+                'previous_cursor': page.previous_cursor,
+            },
+            'results',
+            map(serialize_comment, page),
+        ),
+        content_type='application/json',
+    )
+
+
+def _unauthorized():
+    return JsonResponse({'detail': 'Нужна авторизация'}, status=401)
+
+
+@replica_reads
+def follow_posts(request):
+    if not request.user.is_authenticated:
+        return _unauthorized()
+    return posts_page(request, feed_for(request.user), **CURSOR_FIELDS)
+
+
+def _requested_authors(request):
+    """Имена авторов из тела {"authors": [...]} или None."""
+    try:
+        authors = json.loads(request.body or b'{}').get('authors')
+    except (ValueError, AttributeError):
+        return None
+    if (not isinstance(authors, list)
+            or not all(isinstance(name, str) for name in authors)):
+        return None
+    return authors
+
+
+def follows(request):
+    """POST подписывает на авторов из тела запроса, DELETE отписывает,
+    всё одним запросом к API."""
+    if request.method not in ('POST', 'DELETE'):
+        return HttpResponseNotAllowed(('POST', 'DELETE'))
+    if not request.user.is_authenticated:
+        return _unauthorized()
+    authors = _requested_authors(request)
+    if authors is None:
+        return JsonResponse(
+            {'detail': 'Ожидается {"authors": [имена]}'}, status=400)
+    if len(authors) > following.MAX_AUTHORS:
+        return JsonResponse(
+            {'detail': f'Не больше {following.MAX_AUTHORS} авторов'},
+            status=400)
+    if request.method == 'POST':
+        return JsonResponse(
+            {'followed': following.follow(request.user, authors)})
+    return JsonResponse(
+        {'unfollowed': following.unfollow(request.user, authors)})
+
+
+def follow_suggestions(request):
+    if not request.user.is_authenticated:
+        return _unauthorized()
+    return JsonResponse({'results': [
+        {'author': suggestion.author.username, 'score': suggestion.score}
+        for suggestion in suggestions.for_user(
+            request.user, suggestions.PER_USER)
+    ]})
@@ -0,0 +1,170 @@
+"""Архив старых постов.
+
+Команда archive_posts пачками переносит посты старше
+settings.ARCHIVE_AFTER_DAYS вместе с комментариями в таблицы
+ArchivedPost и ArchivedComment: горячая таблица постов и её индексы
+остаются небольшими и помещаются в память. Id при переносе
+сохраняются.
+
+Главная, группы и ленты подписок показывают только горячие посты.
+Страница поста ищет его в архиве, если в горячей таблице его нет,
+а профиль после горячих постов автора листает его архивные. Архивные
+посты учитываются в счётчике постов автора, но не ищутся поиском
+и не комментируются.
+"""
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import BooleanField, Value
+from django.http import Http404
+from django.utils import timezone
+
+from . import bulk, cache, search
+from .models import (ArchivedComment, ArchivedPost, Comment, Post,
+                     TimelineEntry)
+
+BATCH_SIZE = 500
+
+POST_FIELDS = (
+    'id', 'text', 'pub_date', 'updated', 'image', 'comments_count',
+    'author_id', 'group_id',
+)
+COMMENT_FIELDS = ('id', 'post_id', 'author_id', 'text', 'created')
+
+
+def cutoff(days=None):
+    """Посты, опубликованные раньше этого момента, уходят в архив."""
+    if days is None:
+        days = settings.ARCHIVE_AFTER_DAYS
+    return timezone.now() - timedelta(days=days)
+
+
+def _move(post_ids):
+    posts = list(Post.objects.filter(pk__in=post_ids).values(
+        *POST_FIELDS, 'author__username', 'group__slug'))
+    comments = list(Comment.objects.filter(
+        post_id__in=post_ids).values_list(*COMMENT_FIELDS))
+    scopes = {'global'}
+    for row in posts:
+        scopes.add(f'post:{row["id"]}')
+        scopes.add(f'author:{row.pop("author__username")}')
+        slug = row.pop('group__slug')
+        if slug:
+            scopes.add(f'group:{slug}')
+    bulk.insert(ArchivedPost, (ArchivedPost(**row) for row in posts),
+                BATCH_SIZE)
+    bulk.insert(ArchivedComment, (
+        ArchivedComment(**dict(zip(COMMENT_FIELDS, row)))
+        for row in comments
+    ), BATCH_SIZE)
+    # Удаление без сигналов: счётчик постов автора не меняется,
+    # а поиск и кеш обновляются пачкой
+    search.unindex_many(post_ids, [row[0] for row in comments])
+    bulk.delete(TimelineEntry.objects.filter(post_id__in=post_ids))
+    bulk.delete(Comment.objects.filter(post_id__in=post_ids))
+    bulk.delete(Post.objects.filter(pk__in=post_ids))
+    return scopes
+
+
+def archive_posts(before, batch_size=BATCH_SIZE):
+    """Переносит в архив посты, опубликованные раньше before.
+    Каждая пачка переносится в своей транзакции.
+    Возвращает число перенесённых постов."""
+    moved = 0
+    while True:
+        with transaction.atomic():
+            post_ids = list(Post.objects.filter(
+                pub_date__lt=before
+            ).order_by('pk').values_list('pk', flat=True)[:batch_size])
+            if not post_ids:
+                return moved
+            scopes = _move(post_ids)
+        cache.bump(*scopes)
+        moved += len(post_ids)
+
+
+def get_post_or_404(post_id, detail=False, fields=None):
+    """Пост из горячей таблицы, а если его там нет - из архива.
+    С fields возвращает словарь этих полей и is_archived."""
+    for model in (Post, ArchivedPost):
+        queryset = model.objects.for_detail() if detail else model.objects
+        if fields is not None:
+            queryset = queryset.values(*fields, is_archived=Value(
+                model.is_archived, output_field=BooleanField()))
+        post = queryset.filter(pk=post_id).first()
+        if post is not None:
+            return post
+    raise Http404('Пост не найден')
+
+
+class ChainedFeed:
+    """Горячие посты, за ними архивные, как одна лента.
+
+    Архивные посты старше любого горячего, поэтому лента по дате -
+    просто одна выборка за другой. Поддерживает то, что нужно
+    Paginator и CursorPaginator: count(), срезы, order_by() и filter(),
+    а также values() для JSON API.
+    """
+
+    ordered = True
+
+    def __init__(self, hot, archived, ascending=False):
+        self.hot = hot
+        self.archived = archived
+        self.ascending = ascending
+
+    def _parts(self):
+        if self.ascending:
+            return self.archived, self.hot
+        return self.hot, self.archived
+
+    def count(self):
+        # Одним запросом COUNT(*) по UNION ALL обеих выборок
+        return self.hot.order_by().values('pk').union(
+            self.archived.order_by().values('pk'), all=True).count()
+
+    def __len__(self):
+        return self.count()
+
+    def order_by(self, *fields):
+        return ChainedFeed(
+            self.hot.order_by(*fields), self.archived.order_by(*fields),
+            ascending=not fields[0].startswith('-'),
+        )
+
+    def filter(self, *args, **kwargs):
+        return ChainedFeed(
+            self.hot.filter(*args, **kwargs),
+            self.archived.filter(*args, **kwargs),
+            ascending=self.ascending,
+        )
+
+    def values(self, *fields):
+        return ChainedFeed(
+            self.hot.values(*fields), self.archived.values(*fields),
+            ascending=self.ascending,
+        )
+
+    def __getitem__(self, key):
+        if not isinstance(key, slice):
+            objects = self[key:key + 1]
+            if not objects:
+                raise IndexError(key)
+            return objects[0]
+        first, second = self._parts()
+        start, stop = key.start or 0, key.stop
+        objects = list(first[start:stop])
+        if stop is not None and len(objects) == stop - start:
+            return objects
+        # Первая выборка кончилась: вторая начинается с её конца
+        skip = max(start - first.count(), 0) if not objects else 0
+        size = None if stop is None else stop - start - len(objects)
+        tail = second[skip:] if size is None else second[skip:skip + size]
+        return objects + list(tail)
+
+
+def author_feed(author):
+    """Посты автора для профиля вместе с архивными."""
+    return ChainedFeed(
+        author.posts.for_feed(), author.archived_posts.for_feed())
@@ -0,0 +1,52 @@
+"""Массовая запись и удаление строк в обход сигналов.
+
+Используется генератором тестовых данных и импортом: bulk_create
+не вызывает сигналы, поэтому счётчики, ленты подписок, рекомендации
+и поисковый индекс после вставки пересчитываются отдельно.
+"""
+from contextlib import contextmanager
+
+from django.db import connection
+
+from . import counters, search, suggestions, timeline
+
+
+@contextmanager
+def keep_dates(model, *names):
+    """Отключает auto_now_add/auto_now, чтобы bulk_create сохранил
+    даты из объектов."""
+    fields = [model._meta.get_field(name) for name in names]
+    saved = [(field.auto_now, field.auto_now_add) for field in fields]
+    for field in fields:
+        field.auto_now = field.auto_now_add = False
+    try:
+        yield
+    finally:
+        for field, (auto_now, auto_now_add) in zip(fields, saved):
+            field.auto_now, field.auto_now_add = auto_now, auto_now_add
+
+
+def insert(model, objects, batch_size):
+    """bulk_create пачками, пропуская строки, нарушающие уникальность."""
+    objects = list(objects)
+    # Django 2.2 не ограничивает явный batch_size лимитом базы
+    # на число параметров запроса
+    limit = connection.ops.bulk_batch_size(
+        model._meta.concrete_fields, objects)
+    model.objects.bulk_create(
+        objects, batch_size=min(batch_size, limit), ignore_conflicts=True)
+
+
+def delete(queryset):
+    """DELETE одним запросом, без сигналов и сборки объектов для
+    каскада: производные данные вызывающий обновляет сам."""
+    queryset._raw_delete(queryset.db)
+
+
+def rebuild_derived(batch_size=1000):
+    """Пересчитывает счётчики, ленты, рекомендации и индекс поиска."""
+    counters.reconcile_users(batch_size)
+    counters.reconcile_posts(batch_size)
+    search.rebuild()
+    timeline.rebuild_all()
+    suggestions.refresh()
@@ -0,0 +1,216 @@
+"""Кеш страниц лент с версионированными ключами.
+
+Каждая страница зависит от набора областей (global, group:<slug>,
+author:<username>, post:<id>). Сигналы повышают версию области при
+изменении данных, поэтому страницы можно хранить долго: устаревшая
+версия просто перестаёт совпадать. Пересобирает истёкшую страницу
+только один воркер, остальные в это время отдают старую копию.
+
+Те же версии служат валидатором ETag для условных GET-запросов:
+браузер или CDN с актуальной копией получают 304 без запросов
+к базе и рендера шаблонов.
+"""
+import hashlib
+import time
+from functools import wraps
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.http import HttpResponse
+from django.views.decorators.http import condition
+
+from core.routers import primary_reads, read_primary
+
+from . import thumbnails
+from .models import ArchivedPost, Post
+
+VERSION_KEY = 'feed:version:{}'
+PAGE_KEY = 'feed:page:{}'
+LOCK_KEY = 'feed:lock:{}'
+# Метка недавнего изменения области, пока реплики могут отставать
+BUMPED_KEY = 'feed:bumped:{}'
+LOCK_TIMEOUT = 10
+LOCK_POLL = 0.05
+
+
+def _new_version():
+    # Версия из времени, а не с единицы: после вытеснения ключа
+    # из кеша старые страницы не совпадут с новой версией
+    return time.time_ns()
+
+
+def bump(*scopes):
+    """Повышает версии областей, делая их страницы устаревшими."""
+    scopes = set(scopes)
+    for scope in scopes:
+        key = VERSION_KEY.format(scope)
+        try:
+            cache.incr(key)
+        except ValueError:
+            cache.set(key, _new_version(), None)
+    if settings.DATABASE_REPLICAS:
+        cache.set_many(
+            {BUMPED_KEY.format(scope): 1 for scope in scopes},
+            settings.REPLICA_PIN_SECONDS,
+        )
+
+
+def recently_bumped(scopes):
+    """Менялась ли какая-то из областей за время возможного
+    отставания реплик."""
+    if not settings.DATABASE_REPLICAS:
+        return False
+    return bool(cache.get_many(
+        [BUMPED_KEY.format(scope) for scope in scopes]))
+
+
+def bump_on_commit(*scopes):
+    """Повышает версии после записи производных данных и ещё раз после
+    коммита: страница, собранная параллельно до коммита по старым
+    данным, попадает в кеш под промежуточной версией и не читается."""
+    bump(*scopes)
+    if transaction.get_connection().in_atomic_block:
+        transaction.on_commit(lambda: bump(*scopes))
+
+
+def versions(scopes):
+    """Текущие версии областей в порядке их перечисления."""
+    keys = [VERSION_KEY.format(scope) for scope in scopes]
+    found = cache.get_many(keys)
+    for key in keys:
+        if key not in found:
+            cache.add(key, _new_version(), None)
+            found[key] = cache.get(key)
+    return tuple(found[key] for key in keys)
+
+
+def _wait_for_entry(key):
+    """Ждёт, пока другой воркер соберёт страницу."""
+    deadline = time.monotonic() + LOCK_TIMEOUT
+    while time.monotonic() < deadline:
+        time.sleep(LOCK_POLL)
+        entry = cache.get(key)
+        if entry is not None:
+            return entry
+        if cache.get(LOCK_KEY.format(key)) is None:
+            return None
+    return None
+
+
+def get_or_render(key, current, render):
+    """Отдаёт страницу из кеша или собирает её под single-flight замком.
+
+    current - версии областей, render - функция, возвращающая
+    HttpResponse. В кеше хранится только тело ответа без cookies.
+    """
+    entry = cache.get(key)
+    if entry is not None and entry[0] == current:
+        return _response(entry)
+    lock = LOCK_KEY.format(key)
+    if not cache.add(lock, 1, LOCK_TIMEOUT):
+        if entry is None:
+            entry = _wait_for_entry(key)
+        if entry is not None:
+            return _response(entry)
+        return render()
+    try:
+        thumbnails.start_render()
+        # Кешируемая страница не должна отставать, как реплика
+        with primary_reads():
+            response = render()
+        # Страница с оригиналом вместо превью устареет, как только
+        # превью нарежутся, поэтому её не кешируем
+        if (response.status_code == 200 and not response.streaming
+                and not thumbnails.render_incomplete()):
+            cache.set(key, (
+                current,
+                response.status_code,
+                response['Content-Type'],
+                response.content,
+            ), settings.FEED_CACHE_TIMEOUT)
+        return response
+    finally:
+        cache.delete(lock)
+
+
+def _response(entry):
+    _, status, content_type, content = entry
+    return HttpResponse(content, content_type=content_type, status=status)
+
+
+def page_key(request):
+    user = request.user.pk if request.user.is_authenticated else 0
+    raw = f'{user}:{request.get_full_path()}'
+    return PAGE_KEY.format(hashlib.md5(raw.encode()).hexdigest())
+
+
+def scope_names(scopes, kwargs):
+    """Имена областей страницы по аргументам view."""
+    names = []
+    for scope in scopes:
+        if callable(scope):
+            names.extend(scope(**kwargs))
+        else:
+            names.append(scope.format(**kwargs))
+    return names
+
+
+def cache_feed(*scopes, anonymous_only=False):
+    """Кеширует страницу по версиям областей.
+
+    Область - строка-шаблон с аргументами view ('group:{slug}')
+    или функция, возвращающая список областей по аргументам view.
+    """
+    def decorator(view_func):
+        @wraps(view_func)
+        def wrapper(request, *args, **kwargs):
+            if request.method != 'GET' or (
+                anonymous_only and request.user.is_authenticated
+            ):
+                return view_func(request, *args, **kwargs)
+            return get_or_render(
+                page_key(request),
+                versions(scope_names(scopes, kwargs)),
+                lambda: view_func(request, *args, **kwargs),
+            )
+        return wrapper
+    return decorator
+
+
+def post_scopes(post_id):
+    """Области страницы поста: сам пост и его автор (счётчик постов)."""
+    for model in (Post, ArchivedPost):
+        username = model.objects.filter(
+            pk=post_id).values_list('author__username', flat=True).first()
+        if username is not None:
+            break
+    return [f'post:{post_id}', f'author:{username}']
+
+
+def feed_etag(*scopes):
+    """Функция ETag из версий областей страницы и пользователя.
+
+    Новый пост, правка, комментарий, удаление, архивирование или
+    подписка повышают версию области и меняют ETag. Проверка читает
+    версии из кеша; только странице поста нужен ещё запрос за автором.
+    """
+    def etag(request, *args, **kwargs):
+        names = scope_names(scopes, kwargs)
+        # Реплика могла ещё не получить изменение, давшее эту версию
+        if recently_bumped(names):
+            read_primary()
+        user = request.user.pk if request.user.is_authenticated else 0
+        raw = f'{user}:{versions(names)}'
+        return hashlib.md5(raw.encode()).hexdigest()
+    return etag
+
+
+def conditional_feed(*scopes):
+    """Отвечает 304 Not Modified, если копия клиента не устарела.
+
+    Валидатор - только ETag: Last-Modified по дате последнего поста
+    не отражает удаления, переносы между группами, подписки и то,
+    какой пользователь смотрит страницу.
+    """
+    return condition(etag_func=feed_etag(*scopes))
@@ -0,0 +1,114 @@
+"""Денормализованные счётчики постов, подписок и комментариев.
+
+Сигналы меняют счётчики атомарно через F-выражения. Строка счётчиков
+создаётся вместе с пользователем, старым пользователям строки завели
+миграции. Чтение строк не создаёт: страницы читаются с реплики.
+Накопившийся дрейф и пропавшие строки исправляет reconcile_counters.
+"""
+from django.db.models import Count, F, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+from .models import ArchivedPost, Comment, Follow, Post, User, UserCounters
+
+USER_FIELDS = ('posts_count', 'followers_count', 'following_count')
+
+
+def _shift(queryset, field, delta):
+    """Атомарно сдвигает счётчик, не опуская его ниже нуля."""
+    if delta < 0:
+        queryset = queryset.filter(**{f'{field}__gte': -delta})
+    queryset.update(**{field: F(field) + delta})
+
+
+def bump(user_id, field, delta):
+    """Сдвигает счётчик пользователя, если строка счётчиков уже есть."""
+    _shift(UserCounters.objects.filter(user_id=user_id), field, delta)
+
+
+def bump_many(user_ids, field, delta):
+    """Сдвигает счётчик сразу нескольким пользователям."""
+    _shift(UserCounters.objects.filter(user_id__in=user_ids), field, delta)
+
+
+def bump_comments(post_id, delta):
+    _shift(Post.objects.filter(pk=post_id), 'comments_count', delta)
+
+
+def _count(model, field):
+    """Подзапрос с числом строк model, ссылающихся на внешний объект."""
+    rows = model.objects.filter(
+        **{field: OuterRef('pk')}
+    ).order_by().values(field).annotate(total=Count('pk')).values('total')
+    return Coalesce(Subquery(rows), 0)
+
+
+def _user_totals(users):
+    return users.annotate(
+        # Архивные посты тоже посты автора
+        actual_posts=(
+            _count(Post, 'author') + _count(ArchivedPost, 'author')),
+        actual_followers=_count(Follow, 'author'),
+        actual_following=_count(Follow, 'user'),
+    ).values_list(
+        'pk', 'actual_posts', 'actual_followers', 'actual_following')
+
+
+def for_user(user):
+    """Счётчики пользователя; без строки счётчиков - нули без записи в БД."""
+    try:
+        return user.counters
+    except UserCounters.DoesNotExist:
+        user.counters = UserCounters(user=user)
+        return user.counters
+
+
+def reconcile_users(batch_size=1000):
+    """Пересчитывает счётчики пользователей пачками.
+    Возвращает число исправленных строк."""
+    fixed = 0
+    last_pk = 0
+    while True:
+        batch = list(_user_totals(
+            User.objects.filter(pk__gt=last_pk).order_by('pk')
+        )[:batch_size])
+        if not batch:
+            return fixed
+        last_pk = batch[-1][0]
+        stored = UserCounters.objects.in_bulk([row[0] for row in batch])
+        changed, missing = [], []
+        for pk, *values in batch:
+            actual = dict(zip(USER_FIELDS, values))
+            counters = stored.get(pk)
+            if counters is None:
+                missing.append(UserCounters(user_id=pk, **actual))
+                continue
+            if any(getattr(counters, f) != v for f, v in actual.items()):
+                for field, value in actual.items():
+                    setattr(counters, field, value)
+                changed.append(counters)
+        UserCounters.objects.bulk_update(changed, USER_FIELDS)
+        UserCounters.objects.bulk_create(missing, ignore_conflicts=True)
+        fixed += len(changed) + len(missing)
+
+
+def reconcile_posts(batch_size=1000):
+    """Пересчитывает число комментариев постов пачками.
+    Возвращает число исправленных постов."""
+    fixed = 0
+    last_pk = 0
+    while True:
+        batch = list(Post.objects.filter(
+            pk__gt=last_pk
+        ).order_by('pk').annotate(
+            actual=_count(Comment, 'post')
+        ).only('pk', 'comments_count')[:batch_size])
+        if not batch:
+            return fixed
+        last_pk = batch[-1].pk
+        changed = [
+            post for post in batch if post.comments_count != post.actual
+        ]
+        for post in changed:
+            post.comments_count = post.actual
+        Post.objects.bulk_update(changed, ['comments_count'])
+        fixed += len(changed)
@@ -0,0 +1,90 @@
+"""Подписка и отписка сразу на нескольких авторов.
+
+Авторы выбираются одним запросом, подписки пишутся одним bulk_create
+и удаляются одним DELETE, без сигналов на каждую строку. Счётчики,
+ленты подписок, рекомендации и кеш профилей обновляют followed и
+unfollowed - тоже пачкой. Через них же идут сигналы подписки,
+созданной или удалённой поштучно, поэтому оба пути обновляют одно
+и то же.
+"""
+from django.db import IntegrityError, transaction
+
+from . import bulk, cache, counters, suggestions, timeline
+from .models import Follow, User
+
+# Больше авторов за один запрос API не принимает
+MAX_AUTHORS = 100
+
+
+def _bump_profiles(user, usernames):
+    cache.bump_on_commit(
+        f'author:{user.username}',
+        *(f'author:{username}' for username in usernames),
+    )
+
+
+def followed(user, authors):
+    """Обновляет производные данные после подписки пользователя
+    на авторов authors ({id: имя})."""
+    author_ids = list(authors)
+    counters.bump(user.pk, 'following_count', len(author_ids))
+    counters.bump_many(author_ids, 'followers_count', 1)
+    timeline.followers_changed(author_ids, 1)
+    timeline.add_authors(user.pk, author_ids)
+    suggestions.discard(user.pk, author_ids)
+    _bump_profiles(user, authors.values())
+
+
+def unfollowed(user, authors):
+    """Обновляет производные данные после отписки пользователя
+    от авторов authors ({id: имя})."""
+    author_ids = list(authors)
+    counters.bump(user.pk, 'following_count', -len(author_ids))
+    counters.bump_many(author_ids, 'followers_count', -1)
+    timeline.followers_changed(author_ids, -1)
+    timeline.remove_authors(user.pk, author_ids)
+    _bump_profiles(user, authors.values())
+
+
+def _new_authors(user, usernames):
+    return dict(User.objects.filter(
+        username__in=usernames
+    ).exclude(pk=user.pk).exclude(
+        following__user=user
+    ).values_list('pk', 'username'))
+
+
+def follow(user, usernames):
+    """Подписывает пользователя на авторов, на которых он ещё не
+    подписан. Возвращает имена новых авторов."""
+    with transaction.atomic():
+        authors = _new_authors(user, usernames)
+        while authors:
+            try:
+                with transaction.atomic():
+                    Follow.objects.bulk_create(
+                        Follow(user=user, author_id=pk) for pk in authors)
+                break
+            except IntegrityError:
+                # Часть подписок успел записать параллельный запрос:
+                # считаем только те, что вставим сами
+                authors = _new_authors(user, authors.values())
+        if not authors:
+            return []
+        followed(user, authors)
+    return sorted(authors.values())
+
+
+def unfollow(user, usernames):
+    """Отписывает пользователя от авторов.
+    Возвращает имена авторов, от которых он отписался."""
+    with transaction.atomic():
+        follows = Follow.objects.filter(
+            user=user, author__username__in=usernames)
+        authors = dict(follows.values_list('author_id', 'author__username'))
+        if not authors:
+            return []
+        bulk.delete(
+            Follow.objects.filter(user=user, author_id__in=list(authors)))
+        unfollowed(user, authors)
+    return sorted(authors.values())
@@ -1,4 +1,7 @@
 from django import forms
+from django.core.files.uploadedfile import UploadedFile
+
+from . import images
 from .models import Comment, Post
 
 
@@ -17,6 +20,22 @@ class PostForm(forms.ModelForm):
             'image': 'Картинка поста'
         }
 
+    def clean_image(self):
+        """Уменьшает и перекодирует новую картинку.
+
+        Если такая картинка уже загружалась, пост ссылается на
+        существующий файл вместо сохранения копии.
+        """
+        image = self.cleaned_data.get('image')
+        if not isinstance(image, UploadedFile):
+            return image
+        content, self.image_size, self.stored_size = images.normalize(image)
+        field = Post._meta.get_field('image')
+        name = field.generate_filename(self.instance, content.name)
+        if field.storage.exists(name):
+            return name
+        return content
+
 
 class CommentForm(forms.ModelForm):
     class Meta:
@@ -0,0 +1,83 @@
+"""Нормализация загружаемых картинок постов.
+
+Перед сохранением картинка уменьшается до POST_IMAGE_MAX_SIZE по
+большей стороне, теряет EXIF и прочие метаданные и перекодируется в
+POST_IMAGE_FORMAT. Имя файла - хеш содержимого, поэтому одинаковые
+картинки хранятся один раз.
+"""
+import hashlib
+import logging
+from io import BytesIO
+
+from django.conf import settings
+from django.core.exceptions import ValidationError
+from django.core.files.base import ContentFile
+from PIL import Image, ImageOps, features
+
+logger = logging.getLogger(__name__)
+
+EXTENSIONS = {'JPEG': 'jpg', 'WEBP': 'webp', 'PNG': 'png'}
+
+
+def output_format():
+    """Формат хранения; без libwebp WebP заменяется на JPEG."""
+    image_format = settings.POST_IMAGE_FORMAT.upper()
+    if image_format == 'WEBP' and not features.check('webp'):
+        return 'JPEG'
+    return image_format
+
+
+def _encode(image, image_format):
+    buffer = BytesIO()
+    if image_format == 'JPEG':
+        if image.mode in ('RGBA', 'LA', 'P'):
+            image = image.convert('RGBA')
+            background = Image.new('RGB', image.size, 'white')
+            background.paste(image, mask=image.getchannel('A'))
+            image = background
+        elif image.mode != 'RGB':
+            image = image.convert('RGB')
+        image.save(
+            buffer, 'JPEG', quality=settings.POST_IMAGE_QUALITY,
+            optimize=True, progressive=True)
+    elif image_format == 'WEBP':
+        image.save(
+            buffer, 'WEBP', quality=settings.POST_IMAGE_QUALITY, method=6)
+    else:
+        image.save(buffer, image_format, optimize=True)
+    return buffer.getvalue()
+
+
+def normalize(upload):
+    """Перекодированная картинка: (ContentFile, размер до, размер после).
+
+    Файл читается с диска или из памяти по мере декодирования,
+    целиком в память попадает только уменьшенная картинка.
+    """
+    if upload.size > settings.POST_IMAGE_MAX_UPLOAD_SIZE:
+        raise ValidationError(
+            'Картинка больше %(limit)d МБ',
+            code='too_large',
+            params={'limit': settings.POST_IMAGE_MAX_UPLOAD_SIZE >> 20},
+        )
+    upload.seek(0)
+    max_size = settings.POST_IMAGE_MAX_SIZE
+    try:
+        image = Image.open(upload)
+        # JPEG декодируется сразу в уменьшенном масштабе
+        image.draft('RGB', (max_size, max_size))
+        image = ImageOps.exif_transpose(image)
+        image.thumbnail((max_size, max_size), Image.LANCZOS)
+    except (OSError, Image.DecompressionBombError) as error:
+        raise ValidationError(
+            'Не удалось прочитать картинку', code='invalid_image'
+        ) from error
+    image_format = output_format()
+    content = _encode(image, image_format)
+    digest = hashlib.sha256(content).hexdigest()
+    name = f'{digest}.{EXTENSIONS.get(image_format, image_format.lower())}'
+    logger.info(
+        'Картинка %s: %d -> %d байт (%.0f%%)', upload.name, upload.size,
+        len(content), 100 * len(content) / upload.size if upload.size else 0,
+    )
+    return ContentFile(content, name=name), upload.size, len(content)
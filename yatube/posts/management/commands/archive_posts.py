@@ -0,0 +1,25 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from posts import archive
+
+
+class Command(BaseCommand):
+    help = 'Переносит старые посты с комментариями в архивные таблицы'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--days', type=int, default=settings.ARCHIVE_AFTER_DAYS,
+            help='Архивировать посты старше стольких дней'
+        )
+        parser.add_argument(
+            '--batch-size', type=int, default=archive.BATCH_SIZE,
+            help='Сколько постов переносить в одной транзакции'
+        )
+
+    def handle(self, *args, **options):
+        before = archive.cutoff(options['days'])
+        moved = archive.archive_posts(before, options['batch_size'])
+        self.stdout.write(
+            f'Перенесено в архив постов: {moved} '
+            f'(опубликованы раньше {before:%Y-%m-%d})')
@@ -0,0 +1,124 @@
+import threading
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import OperationalError, connection, connections
+from django.test import Client
+from django.urls import reverse
+
+from posts.models import Comment, Post, User
+
+from .benchmark_views import percentile
+
+# Умолчания SQLite для сравнения: журнал отката вместо WAL
+BASELINE_PRAGMAS = {'journal_mode': 'DELETE'}
+# Текст нагрузочных комментариев, по нему они удаляются после замера
+LOAD_TEXT = 'Нагрузочный комментарий benchmark_concurrency'
+
+
+class Command(BaseCommand):
+    help = (
+        'Замеряет пропускную способность чтения страницы поста, пока '
+        'другие потоки пишут к нему комментарии'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--readers', type=int, default=4)
+        parser.add_argument('--writers', type=int, default=2)
+        parser.add_argument('--seconds', type=float, default=10)
+        parser.add_argument(
+            '--baseline', action='store_true',
+            help='Без настройки SQLite (журнал отката) для сравнения'
+        )
+
+    def handle(self, *args, **options):
+        post = Post.objects.order_by('-comments_count', '-pk').first()
+        user = User.objects.order_by('pk').first()
+        if post is None or user is None:
+            raise CommandError('Нет постов: запустите generate_data')
+        pragmas = settings.SQLITE_PRAGMAS
+        if options['baseline']:
+            settings.SQLITE_PRAGMAS = BASELINE_PRAGMAS
+        connections.close_all()
+        try:
+            self.run(post, user, options)
+        finally:
+            settings.SQLITE_PRAGMAS = pragmas
+            connections.close_all()
+
+    def run(self, post, user, options):
+        if connection.vendor == 'sqlite':
+            with connection.cursor() as cursor:
+                cursor.execute('PRAGMA journal_mode')
+                self.stdout.write(f'journal_mode: {cursor.fetchone()[0]}')
+        url = reverse('posts:post_detail', args=[post.pk])
+        self.deadline = time.monotonic() + options['seconds']
+        self.lock = threading.Lock()
+        self.timings = []
+        self.stats = {'writes': 0, 'read_errors': 0, 'write_errors': 0}
+        threads = [
+            threading.Thread(target=self.read, args=(url, user))
+            for _ in range(options['readers'])
+        ] + [
+            threading.Thread(target=self.write, args=(post, user))
+            for _ in range(options['writers'])
+        ]
+        started = time.monotonic()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.report(time.monotonic() - started)
+        Comment.objects.filter(post=post, text=LOAD_TEXT).delete()
+
+    def count(self, name):
+        with self.lock:
+            self.stats[name] += 1
+
+    def read(self, url, user):
+        # Авторизованному пользователю страница поста не кешируется
+        client = Client()
+        client.force_login(user)
+        try:
+            while time.monotonic() < self.deadline:
+                started = time.perf_counter()
+                try:
+                    response = client.get(url)
+                except OperationalError:
+                    self.count('read_errors')
+                    continue
+                if response.status_code != 200:
+                    self.count('read_errors')
+                    continue
+                with self.lock:
+                    self.timings.append(time.perf_counter() - started)
+        finally:
+            connections.close_all()
+
+    def write(self, post, user):
+        try:
+            while time.monotonic() < self.deadline:
+                try:
+                    Comment.objects.create(
+                        post=post, author=user, text=LOAD_TEXT)
+                except OperationalError:
+                    self.count('write_errors')
+                    continue
+                self.count('writes')
+        finally:
+            connections.close_all()
+
+    def report(self, elapsed):
+        reads, stats = len(self.timings), self.stats
+        self.stdout.write(
+            f'Чтений: {reads} ({reads / elapsed:.1f}/с), '
+            f'ошибок {stats["read_errors"]}')
+        if self.timings:
+            self.stdout.write(
+                'Время чтения: '
+                f'p50 {percentile(self.timings, 50) * 1000:.1f} мс, '
+                f'p99 {percentile(self.timings, 99) * 1000:.1f} мс')
+        self.stdout.write(
+            f'Записей: {stats["writes"]} ({stats["writes"] / elapsed:.1f}/с), '
+            f'ошибок {stats["write_errors"]}')
@@ -0,0 +1,159 @@
+import json
+import os
+import time
+
+from django.core.cache import cache
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.db.models import Count
+from django.test import Client
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+
+from posts.models import Comment, Follow, Group, Post, User
+
+PERCENTILES = (50, 90, 99)
+
+
+def percentile(values, percent):
+    """Перцентиль по ближайшему рангу."""
+    values = sorted(values)
+    rank = max(0, -(-len(values) * percent // 100) - 1)
+    return values[rank]
+
+
+def benchmark_targets():
+    """URL представлений на самых нагруженных объектах базы и
+    пользователь, от имени которого их запрашивать."""
+    author = User.objects.annotate(
+        total=Count('posts')).order_by('-total').first()
+    group = Group.objects.annotate(
+        total=Count('posts')).order_by('-total').first()
+    post = Post.objects.order_by('-comments_count', '-pk').first()
+    reader_id = Follow.objects.values('user').annotate(
+        total=Count('pk')).order_by('-total').values_list(
+            'user', flat=True).first()
+    targets = {'index': (reverse('posts:index'), None)}
+    if group:
+        targets['group_posts'] = (
+            reverse('posts:group_posts', args=[group.slug]), None)
+    if author:
+        targets['profile'] = (
+            reverse('posts:profile', args=[author.username]), None)
+    if post:
+        targets['post_detail'] = (
+            reverse('posts:post_detail', args=[post.pk]), None)
+    if reader_id:
+        targets['follow_index'] = (
+            reverse('posts:follow_index'), User.objects.get(pk=reader_id))
+    return targets
+
+
+class Command(BaseCommand):
+    help = (
+        'Замеряет перцентили времени ответа и число запросов к БД '
+        'основных страниц и сохраняет результат для сравнения'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--requests', type=int, default=50,
+            help='Запросов к каждой странице'
+        )
+        parser.add_argument(
+            '--cold', action='store_true',
+            help='Очищать кеш перед каждым запросом'
+        )
+        parser.add_argument(
+            '--pages', type=int, default=1,
+            help='Сколько первых страниц пагинации обходить'
+        )
+        parser.add_argument(
+            '--output', default='benchmarks.json',
+            help='Файл, в который дописываются результаты прогонов'
+        )
+        parser.add_argument('--label', default='', help='Метка прогона')
+
+    def handle(self, *args, **options):
+        scale = {
+            'users': User.objects.count(),
+            'posts': Post.objects.count(),
+            'comments': Comment.objects.count(),
+            'follows': Follow.objects.count(),
+        }
+        self.stdout.write('Данные: ' + ', '.join(
+            f'{name} {count}' for name, count in scale.items()))
+        results = {}
+        for name, (url, user) in benchmark_targets().items():
+            results[name] = self.measure(url, user, options)
+            self.stdout.write(self.format(name, results[name]))
+        run = {
+            'label': options['label'],
+            'date': timezone.now().isoformat(),
+            'cold': options['cold'],
+            'scale': scale,
+            'views': results,
+        }
+        runs = self.load(options['output'])
+        previous = next((
+            old for old in reversed(runs)
+            if old['label'] == run['label'] and old['cold'] == run['cold']
+        ), None)
+        if previous:
+            self.compare(previous, run)
+        runs.append(run)
+        with open(options['output'], 'w') as output:
+            json.dump(runs, output, ensure_ascii=False, indent=2)
+
+    def measure(self, url, user, options):
+        client = Client()
+        if user is not None:
+            client.force_login(user)
+        timings, queries = [], []
+        for number in range(options['requests']):
+            page = number % options['pages'] + 1
+            if options['cold']:
+                cache.clear()
+            with CaptureQueriesContext(connection) as captured:
+                started = time.perf_counter()
+                response = client.get(url, {'page': page})
+                timings.append((time.perf_counter() - started) * 1000)
+            if response.status_code != 200:
+                raise RuntimeError(f'{url}: ответ {response.status_code}')
+            queries.append(len(captured))
+        result = {
+            f'p{percent}_ms': round(percentile(timings, percent), 2)
+            for percent in PERCENTILES
+        }
+        result['queries'] = max(queries)
+        return result
+
+    @staticmethod
+    def format(name, result):
+        timings = ', '.join(
+            f'p{percent} {result[f"p{percent}_ms"]:.2f} мс'
+            for percent in PERCENTILES
+        )
+        return f'{name}: {timings}, запросов {result["queries"]}'
+
+    @staticmethod
+    def load(path):
+        if not os.path.exists(path):
+            return []
+        with open(path) as source:
+            return json.load(source)
+
+    def compare(self, previous, run):
+        self.stdout.write(f'Сравнение с прогоном {previous["date"]}:')
+        for name, result in run['views'].items():
+            old = previous['views'].get(name)
+            if not old:
+                continue
+            change = (result['p50_ms'] / old['p50_ms'] - 1) * 100 if (
+                old['p50_ms']) else 0
+            self.stdout.write(
+                f'  {name}: p50 {old["p50_ms"]:.2f} -> '
+                f'{result["p50_ms"]:.2f} мс ({change:+.0f}%), '
+                f'запросов {old["queries"]} -> {result["queries"]}'
+            )
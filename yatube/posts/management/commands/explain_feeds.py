@@ -0,0 +1,83 @@
+import statistics
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import connection
+
+from posts.models import Comment, Follow, Post
+from posts.timeline import author_posts, timeline_posts
+from posts.utils import COMMENTS_PER_PAGE, POSTS_PER_PAGE
+
+# Признаки плохого плана в EXPLAIN QUERY PLAN SQLite
+FULL_SCAN = 'SCAN'
+TEMP_SORT = 'USE TEMP B-TREE'
+
+
+def feed_queries():
+    """Запросы лент и страницы поста в том виде, в каком их строят view."""
+    sample = Post.objects.values_list(
+        'author_id', 'group_id', 'pk').order_by('pk').first()
+    author_id, group_id, post_id = sample or (1, 1, 1)
+    reader_id = Follow.objects.values_list(
+        'user_id', flat=True).order_by('pk').first() or author_id
+    page = POSTS_PER_PAGE + 1
+    ordering = ('-pub_date', '-pk')
+    feed = Post.objects.for_feed().order_by(*ordering)
+    return {
+        'index': feed[:page],
+        'group': feed.filter(group_id=group_id)[:page],
+        'profile': feed.filter(author_id=author_id)[:page],
+        # Лента подписок сливает страницу записей ленты и страницы
+        # популярных авторов, каждая часть - отдельный запрос
+        'follow': timeline_posts(reader_id).for_feed().order_by(
+            '-feed_date', '-feed_id')[:page],
+        'follow_author': author_posts(author_id).for_feed().order_by(
+            '-feed_date', '-feed_id')[:page],
+        'comments': Comment.objects.filter(post_id=post_id).select_related(
+            'author').order_by('-created', '-pk')[:COMMENTS_PER_PAGE + 1],
+        'followers': Follow.objects.filter(
+            author_id=author_id).values_list('user_id', flat=True),
+    }
+
+
+def plan_problems(plan):
+    """Строки плана SQLite с полным просмотром таблицы или сортировкой."""
+    return [
+        line.strip() for line in plan.splitlines()
+        if TEMP_SORT in line or (
+            FULL_SCAN in line and 'INDEX' not in line
+            and 'CONSTANT ROW' not in line
+        )
+    ]
+
+
+class Command(BaseCommand):
+    help = (
+        'Показывает планы (EXPLAIN) и время запросов лент, '
+        'чтобы проверить, что они идут по индексам'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--repeat', type=int, default=20,
+            help='Сколько раз выполнить каждый запрос для замера времени'
+        )
+
+    def handle(self, *args, **options):
+        sqlite = connection.vendor == 'sqlite'
+        problems = 0
+        for name, queryset in feed_queries().items():
+            plan = queryset.explain()
+            timings = []
+            for _ in range(options['repeat']):
+                started = time.perf_counter()
+                list(queryset.all())
+                timings.append(time.perf_counter() - started)
+            median = statistics.median(timings) * 1000 if timings else 0
+            self.stdout.write(f'== {name}: {median:.2f} мс')
+            self.stdout.write(plan)
+            bad = plan_problems(plan) if sqlite else []
+            problems += len(bad)
+            for line in bad:
+                self.stdout.write(f'  !! {line}')
+        self.stdout.write(f'Проблемных шагов плана: {problems}')
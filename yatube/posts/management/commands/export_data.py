@@ -0,0 +1,33 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from posts import ndjson
+
+
+class Command(BaseCommand):
+    help = (
+        'Выгружает группы, посты и комментарии вместе с архивными '
+        'и подписки в NDJSON '
+        'потоком, не загружая таблицы в память'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help='Файл выгрузки, .gz - со сжатием')
+        parser.add_argument(
+            '--chunk-size', type=int, default=2000,
+            help='Сколько строк читать из базы за раз'
+        )
+
+    def handle(self, *args, **options):
+        started = time.monotonic()
+        rows = 0
+        with ndjson.open_stream(options['path'], 'w') as output:
+            for record in ndjson.export_records(options['chunk_size']):
+                output.write(ndjson.dumps(record) + '\n')
+                rows += 1
+        elapsed = time.monotonic() - started
+        self.stdout.write(
+            f'Выгружено строк: {rows} за {elapsed:.1f} с '
+            f'({rows / elapsed if elapsed else 0:.0f} строк/с)'
+        )
@@ -0,0 +1,190 @@
+import random
+import time
+from datetime import timedelta
+from itertools import accumulate
+
+from django.contrib.auth.hashers import make_password
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.utils import timezone
+from faker import Faker
+
+from posts import bulk
+from posts.models import Comment, Follow, Group, Post, User
+
+# Тексты собираются из заранее сгенерированных фраз: Faker
+# слишком медленный, чтобы звать его на каждую из миллиона строк
+PHRASES = 2000
+
+
+def zipf_weights(size, exponent):
+    """Накопленные веса закона Ципфа: k-й по популярности объект
+    выбирается с вероятностью, пропорциональной 1 / k ** exponent."""
+    return list(accumulate(
+        1 / rank ** exponent for rank in range(1, size + 1)))
+
+
+class Command(BaseCommand):
+    help = (
+        'Генерирует пользователей, группы, посты, комментарии и граф '
+        'подписок со степенным распределением для нагрузочных замеров'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=1000)
+        parser.add_argument('--groups', type=int, default=20)
+        parser.add_argument('--posts', type=int, default=10000)
+        parser.add_argument('--comments', type=int, default=20000)
+        parser.add_argument(
+            '--follows', type=int, default=20,
+            help='Среднее число подписок пользователя'
+        )
+        parser.add_argument(
+            '--days', type=int, default=365,
+            help='За сколько дней распределить даты постов'
+        )
+        parser.add_argument(
+            '--exponent', type=float, default=1.1,
+            help='Показатель закона Ципфа для авторов и подписок'
+        )
+        parser.add_argument('--batch-size', type=int, default=1000)
+        parser.add_argument('--seed', type=int, default=None)
+        parser.add_argument(
+            '--skip-derived', action='store_true',
+            help='Не пересчитывать счётчики, ленты и поисковый индекс'
+        )
+
+    def handle(self, *args, **options):
+        self.random = random.Random(options['seed'])
+        self.batch_size = options['batch_size']
+        fake = Faker('ru_RU')
+        fake.seed_instance(options['seed'])
+        self.phrases = [fake.sentence(nb_words=8) for _ in range(PHRASES)]
+        started = time.monotonic()
+
+        # Одна транзакция вместо коммита (и fsync) на каждую пачку
+        with transaction.atomic():
+            users = self.create_users(options['users'])
+            groups = self.create_groups(options['groups'])
+            popularity = self.random.sample(users, len(users))
+            weights = zipf_weights(len(popularity), options['exponent'])
+            self.create_follows(
+                users, popularity, weights, options['follows'])
+            posts = self.create_posts(
+                options['posts'], popularity, weights, groups,
+                options['days'])
+            self.create_comments(
+                options['comments'], posts, users, options['days'])
+            if not options['skip_derived']:
+                bulk.rebuild_derived(self.batch_size)
+        self.stdout.write(
+            f'Готово за {time.monotonic() - started:.1f} с: '
+            f'пользователей {len(users)}, групп {len(groups)}, '
+            f'постов {len(posts)}, комментариев {options["comments"]}'
+        )
+
+    def text(self, sentences=3):
+        return ' '.join(self.random.choices(self.phrases, k=sentences))
+
+    def _insert(self, model, objects):
+        bulk.insert(model, objects, self.batch_size)
+
+    def create_users(self, count):
+        # Один хеш на всех: хеширование пароля - самая медленная часть
+        password = make_password(None)
+        prefix = f'user{int(time.time())}_'
+        last_pk = User.objects.order_by('-pk').values_list(
+            'pk', flat=True).first() or 0
+        self._insert(User, (
+            User(
+                username=f'{prefix}{number}',
+                first_name=self.random.choice(self.phrases).split()[0],
+                password=password,
+            )
+            for number in range(count)
+        ))
+        return list(User.objects.filter(
+            pk__gt=last_pk).values_list('pk', flat=True))
+
+    def create_groups(self, count):
+        prefix = f'group-{int(time.time())}-'
+        self._insert(Group, (
+            Group(
+                title=self.text(1)[:200],
+                slug=f'{prefix}{number}',
+                description=self.text(),
+            )
+            for number in range(count)
+        ))
+        return list(Group.objects.filter(
+            slug__startswith=prefix).values_list('pk', flat=True))
+
+    def create_follows(self, users, popularity, weights, average):
+        """Подписки по закону Ципфа: на популярных авторов подписано
+        большинство, на хвост - единицы."""
+        if not users:
+            return
+        for start in range(0, len(users), self.batch_size):
+            follows = []
+            for user_id in users[start:start + self.batch_size]:
+                count = min(
+                    int(self.random.expovariate(1 / average)) + 1,
+                    len(popularity) - 1,
+                )
+                authors = set(self.random.choices(
+                    popularity, cum_weights=weights, k=count))
+                authors.discard(user_id)
+                follows.extend(
+                    Follow(user_id=user_id, author_id=author_id)
+                    for author_id in authors
+                )
+            self._insert(Follow, follows)
+
+    def create_posts(self, count, popularity, weights, groups, days):
+        if not popularity:
+            return []
+        last_pk = Post.objects.order_by('-pk').values_list(
+            'pk', flat=True).first() or 0
+        now = timezone.now()
+        span = timedelta(days=days).total_seconds()
+        choices = groups + [None]
+        with bulk.keep_dates(Post, 'pub_date', 'updated'):
+            for start in range(0, count, self.batch_size):
+                batch = []
+                for _ in range(min(self.batch_size, count - start)):
+                    date = now - timedelta(
+                        seconds=self.random.random() * span)
+                    batch.append(Post(
+                        text=self.text(self.random.randint(1, 6)),
+                        author_id=self.random.choices(
+                            popularity, cum_weights=weights)[0],
+                        group_id=self.random.choice(choices),
+                        pub_date=date,
+                        updated=date,
+                    ))
+                self._insert(Post, batch)
+        return list(Post.objects.filter(
+            pk__gt=last_pk).values_list('pk', flat=True))
+
+    def create_comments(self, count, posts, users, days):
+        """Комментарии тоже тяготеют к небольшой доле постов."""
+        if not posts or not users:
+            return
+        weights = zipf_weights(len(posts), 1.0)
+        now = timezone.now()
+        span = timedelta(days=days).total_seconds()
+        with bulk.keep_dates(Comment, 'created'):
+            for start in range(0, count, self.batch_size):
+                size = min(self.batch_size, count - start)
+                post_ids = self.random.choices(
+                    posts, cum_weights=weights, k=size)
+                self._insert(Comment, [
+                    Comment(
+                        post_id=post_id,
+                        author_id=self.random.choice(users),
+                        text=self.text(1),
+                        created=now - timedelta(
+                            seconds=self.random.random() * span),
+                    )
+                    for post_id in post_ids
+                ])
@@ -0,0 +1,47 @@
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from django.core.management.base import BaseCommand
+from django.db import connections
+
+from posts import thumbnails
+from posts.models import Post
+
+
+class Command(BaseCommand):
+    help = 'Нарезает превью всех картинок постов параллельно на всех ядрах'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--workers', type=int, default=os.cpu_count(),
+            help='Число процессов (по умолчанию - число ядер)'
+        )
+
+    def handle(self, *args, **options):
+        names = list(Post.objects.exclude(image='').values_list(
+            'image', flat=True).distinct().iterator())
+        # Дочерние процессы не должны унаследовать открытые соединения
+        connections.close_all()
+        started = time.monotonic()
+        done = failed = 0
+        with ProcessPoolExecutor(max_workers=options['workers']) as pool:
+            futures = [
+                pool.submit(thumbnails.generate_entries, name)
+                for name in names
+            ]
+            for name, future in zip(names, futures):
+                try:
+                    count, entries = future.result()
+                    # Кеш может быть локальным для процесса (locmem):
+                    # метаданные превью записывает родитель
+                    thumbnails.save_entries(entries)
+                    done += count
+                except Exception as error:
+                    failed += 1
+                    self.stderr.write(f'{name}: {error}')
+        elapsed = time.monotonic() - started
+        self.stdout.write(
+            f'Картинок: {len(names)}, превью: {done}, ошибок: {failed}, '
+            f'время: {elapsed:.1f} с'
+        )
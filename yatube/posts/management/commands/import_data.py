@@ -0,0 +1,53 @@
+import json
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+
+from posts import bulk, ndjson
+
+
+class Command(BaseCommand):
+    help = (
+        'Загружает выгрузку export_data пачками bulk_create '
+        'с постоянным расходом памяти'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help='Файл выгрузки, .gz - со сжатием')
+        parser.add_argument('--batch-size', type=int, default=1000)
+        parser.add_argument(
+            '--skip-derived', action='store_true',
+            help='Не пересчитывать счётчики, ленты и поисковый индекс'
+        )
+
+    def handle(self, *args, **options):
+        try:
+            importer = ndjson.Importer(options['batch_size'])
+        except ValueError as error:
+            raise CommandError(error)
+        started = time.monotonic()
+        with transaction.atomic():
+            with ndjson.open_stream(options['path']) as source:
+                for line in source:
+                    if line.strip():
+                        importer.add(json.loads(line))
+            importer.finish()
+            loaded = time.monotonic() - started
+            if not options['skip_derived']:
+                bulk.rebuild_derived(options['batch_size'])
+        rows = sum(importer.counts.values())
+        self.stdout.write(', '.join(
+            f'{name} {count}' for name, count in importer.counts.items()))
+        skipped = {
+            name: count for name, count in importer.skipped.items() if count}
+        if skipped:
+            self.stdout.write('Пропущено строк (дубликаты, комментарии '
+                              'без поста): ' + ', '.join(
+                                  f'{name} {count}'
+                                  for name, count in skipped.items()))
+        self.stdout.write(
+            f'Загружено строк: {rows} за {loaded:.1f} с '
+            f'({rows / loaded if loaded else 0:.0f} строк/с), '
+            f'всего с пересчётом {time.monotonic() - started:.1f} с'
+        )
@@ -0,0 +1,46 @@
+from django.conf import settings
+from django.core.cache import cache
+from django.core.management.base import BaseCommand, CommandError
+from django.test import Client
+
+from core.instrumentation import registry
+
+from .benchmark_views import benchmark_targets
+
+
+class Command(BaseCommand):
+    help = (
+        'Рендерит основные страницы и показывает время рендера каждого '
+        'шаблона и include. Нужен YATUBE_TEMPLATE_PROFILING=1'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--requests', type=int, default=20,
+            help='Запросов к каждой странице'
+        )
+        parser.add_argument(
+            '--top', type=int, default=15, help='Сколько шаблонов показать')
+
+    def handle(self, *args, **options):
+        if not settings.TEMPLATE_PROFILING:
+            raise CommandError(
+                'Профилирование выключено: запустите команду '
+                'с YATUBE_TEMPLATE_PROFILING=1')
+        registry.reset()
+        for url, user in benchmark_targets().values():
+            client = Client()
+            if user is not None:
+                client.force_login(user)
+            for _ in range(options['requests']):
+                # Без кеша страниц и фрагментов каждый запрос рендерится
+                cache.clear()
+                client.get(url)
+        self.stdout.write(
+            f'{"шаблон":40} {"рендеров":>9} {"всего, мс":>10} '
+            f'{"своё, мс":>10} {"на рендер":>10}')
+        for name, count, total, own in (
+                registry.template_profile()[:options['top']]):
+            self.stdout.write(
+                f'{name[:40]:40} {count:9} {total * 1000:10.1f} '
+                f'{own * 1000:10.1f} {own * 1000 / count:10.3f}')
@@ -0,0 +1,13 @@
+from django.core.management.base import BaseCommand
+from django.db import connection
+
+from posts import search
+
+
+class Command(BaseCommand):
+    help = 'Пересобирает полнотекстовый индекс постов и комментариев'
+
+    def handle(self, *args, **options):
+        search.create_index()
+        search.rebuild()
+        self.stdout.write(f'Индекс поиска пересобран ({connection.vendor})')
@@ -0,0 +1,26 @@
+from django.core.management.base import BaseCommand
+
+from posts import timeline
+from posts.models import User
+
+
+class Command(BaseCommand):
+    help = 'Пересобирает материализованные ленты подписок'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            'usernames', nargs='*',
+            help='Пользователи, чьи ленты нужно пересобрать (по умолчанию все)'
+        )
+
+    def handle(self, *args, **options):
+        if not options['usernames']:
+            entries = timeline.rebuild_all()
+            self.stdout.write(f'Пересобраны все ленты, записей: {entries}')
+            return
+        users = User.objects.filter(username__in=options['usernames'])
+        rebuilt = 0
+        for user_id in users.values_list('pk', flat=True).iterator():
+            timeline.rebuild(user_id)
+            rebuilt += 1
+        self.stdout.write(f'Пересобрано лент: {rebuilt}')
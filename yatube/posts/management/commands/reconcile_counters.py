@@ -0,0 +1,20 @@
+from django.core.management.base import BaseCommand
+
+from posts import counters
+
+
+class Command(BaseCommand):
+    help = 'Пересчитывает денормализованные счётчики и исправляет дрейф'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size', type=int, default=1000,
+            help='Сколько строк пересчитывать за один запрос'
+        )
+
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+        users = counters.reconcile_users(batch_size)
+        posts = counters.reconcile_posts(batch_size)
+        self.stdout.write(
+            f'Исправлено счётчиков пользователей: {users}, постов: {posts}')
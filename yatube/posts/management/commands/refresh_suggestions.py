@@ -0,0 +1,20 @@
+from django.core.management.base import BaseCommand
+
+from posts import suggestions
+
+
+class Command(BaseCommand):
+    help = (
+        'Пересобирает рекомендации подписок по подпискам подписок; '
+        'запускается периодически, например из cron'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--per-user', type=int, default=suggestions.PER_USER,
+            help='Сколько рекомендаций хранить для пользователя'
+        )
+
+    def handle(self, *args, **options):
+        rows = suggestions.refresh(options['per_user'])
+        self.stdout.write(f'Записано рекомендаций: {rows}')
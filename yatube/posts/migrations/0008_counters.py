@@ -0,0 +1,62 @@
+# Generated by Django 2.2.16 on 2026-10-18 03:59
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+def fill_counters(apps, schema_editor):
+    User = apps.get_model(*settings.AUTH_USER_MODEL.split('.'))
+    Post = apps.get_model('posts', 'Post')
+    Comment = apps.get_model('posts', 'Comment')
+    Follow = apps.get_model('posts', 'Follow')
+    UserCounters = apps.get_model('posts', 'UserCounters')
+
+    def totals(queryset, field):
+        rows = queryset.values(field).annotate(total=models.Count('pk'))
+        return {row[field]: row['total'] for row in rows.order_by()}
+
+    posts = totals(Post.objects, 'author')
+    followers = totals(Follow.objects, 'author')
+    following = totals(Follow.objects, 'user')
+    UserCounters.objects.bulk_create(
+        UserCounters(
+            user_id=pk,
+            posts_count=posts.get(pk, 0),
+            followers_count=followers.get(pk, 0),
+            following_count=following.get(pk, 0),
+        )
+        for pk in User.objects.values_list('pk', flat=True)
+    )
+    for post_id, total in totals(Comment.objects, 'post').items():
+        Post.objects.filter(pk=post_id).update(comments_count=total)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('auth', '0011_update_proxy_permissions'),
+        ('posts', '0007_timelineentry'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='UserCounters',
+            fields=[
+                ('user', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='counters', serialize=False, to=settings.AUTH_USER_MODEL, verbose_name='Пользователь')),
+                ('posts_count', models.PositiveIntegerField(default=0, verbose_name='Постов')),
+                ('followers_count', models.PositiveIntegerField(default=0, verbose_name='Подписчиков')),
+                ('following_count', models.PositiveIntegerField(default=0, verbose_name='Подписок')),
+            ],
+            options={
+                'verbose_name': 'Счётчики пользователя',
+                'verbose_name_plural': 'Счётчики пользователей',
+            },
+        ),
+        migrations.AddField(
+            model_name='post',
+            name='comments_count',
+            field=models.PositiveIntegerField(default=0, editable=False, verbose_name='Число комментариев'),
+        ),
+        migrations.RunPython(fill_counters, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,20 @@
+# Generated by Django 2.2.16 on 2026-10-18 05:12
+
+from django.db import migrations, models
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('posts', '0008_counters'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='post',
+            name='updated',
+            field=models.DateTimeField(auto_now=True, default=django.utils.timezone.now, verbose_name='Дата Изменения'),
+            preserve_default=False,
+        ),
+    ]
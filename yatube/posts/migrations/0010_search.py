@@ -0,0 +1,56 @@
+"""Структуры полнотекстового поиска.
+
+DDL записан здесь, а не берётся из posts.search, чтобы миграция
+не менялась вместе с модулем. Индекс SQLite сразу заполняется
+существующими постами и комментариями через posts.search.rebuild.
+"""
+from django.db import migrations
+
+SQLITE_CREATE = (
+    'CREATE VIRTUAL TABLE IF NOT EXISTS posts_post_fts USING fts5('
+    "body, tokenize = 'unicode61 remove_diacritics 2')",
+    'CREATE VIRTUAL TABLE IF NOT EXISTS posts_comment_fts USING fts5('
+    "body, post_id UNINDEXED, tokenize = 'unicode61 remove_diacritics 2')",
+)
+SQLITE_DROP = (
+    'DROP TABLE IF EXISTS posts_post_fts',
+    'DROP TABLE IF EXISTS posts_comment_fts',
+)
+POSTGRES_CREATE = (
+    'CREATE INDEX IF NOT EXISTS posts_post_text_fts ON posts_post '
+    "USING gin (to_tsvector('russian', text))",
+    'CREATE INDEX IF NOT EXISTS posts_comment_text_fts ON posts_comment '
+    "USING gin (to_tsvector('russian', text))",
+)
+POSTGRES_DROP = (
+    'DROP INDEX IF EXISTS posts_post_text_fts',
+    'DROP INDEX IF EXISTS posts_comment_text_fts',
+)
+
+
+def _run(schema_editor, statements):
+    for statement in statements.get(schema_editor.connection.vendor, ()):
+        schema_editor.execute(statement)
+
+
+def create_search_index(apps, schema_editor):
+    from posts import search
+
+    _run(schema_editor, {
+        'sqlite': SQLITE_CREATE, 'postgresql': POSTGRES_CREATE})
+    search.rebuild(schema_editor.connection)
+
+
+def drop_search_index(apps, schema_editor):
+    _run(schema_editor, {'sqlite': SQLITE_DROP, 'postgresql': POSTGRES_DROP})
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('posts', '0009_post_updated'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_search_index, drop_search_index),
+    ]
@@ -0,0 +1,57 @@
+# Generated by Django 2.2.16 on 2026-10-18 04:56
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('posts', '0012_comment_page_index'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ArchivedPost',
+            fields=[
+                ('id', models.IntegerField(primary_key=True, serialize=False)),
+                ('text', models.TextField(verbose_name='Текст Поста')),
+                ('pub_date', models.DateTimeField(verbose_name='Дата Публикации')),
+                ('updated', models.DateTimeField(verbose_name='Дата Изменения')),
+                ('image', models.ImageField(blank=True, upload_to='posts/', verbose_name='Картинка')),
+                ('comments_count', models.PositiveIntegerField(default=0, editable=False, verbose_name='Число комментариев')),
+                ('author', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='archived_posts', to=settings.AUTH_USER_MODEL, verbose_name='Автор')),
+                ('group', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='archived_posts', to='posts.Group', verbose_name='Группа')),
+            ],
+            options={
+                'verbose_name': 'Архивный пост',
+                'verbose_name_plural': 'Архивные посты',
+                'ordering': ('-pub_date',),
+            },
+        ),
+        migrations.CreateModel(
+            name='ArchivedComment',
+            fields=[
+                ('id', models.IntegerField(primary_key=True, serialize=False)),
+                ('text', models.TextField(verbose_name='Текст комментария')),
+                ('created', models.DateTimeField(verbose_name='Создан')),
+                ('author', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='archived_comments', to=settings.AUTH_USER_MODEL, verbose_name='Автор')),
+                ('post', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='comment', to='posts.ArchivedPost', verbose_name='Пост')),
+            ],
+            options={
+                'verbose_name': 'Архивный комментарий',
+                'verbose_name_plural': 'Архивные комментарии',
+                'ordering': ('-created',),
+            },
+        ),
+        migrations.AddIndex(
+            model_name='archivedpost',
+            index=models.Index(fields=['author', '-pub_date', '-id'], name='archived_author_date_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='archivedcomment',
+            index=models.Index(fields=['post', '-created', '-id'], name='archived_comment_post_idx'),
+        ),
+    ]
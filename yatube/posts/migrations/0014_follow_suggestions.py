@@ -0,0 +1,38 @@
+# Generated by Django 2.2.16 on 2026-10-18 05:03
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('posts', '0013_archive'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='FollowSuggestion',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('score', models.PositiveIntegerField(verbose_name='Общих подписок')),
+                ('author', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to=settings.AUTH_USER_MODEL, verbose_name='Автор')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='follow_suggestions', to=settings.AUTH_USER_MODEL, verbose_name='Читатель')),
+            ],
+            options={
+                'verbose_name': 'Рекомендация подписки',
+                'verbose_name_plural': 'Рекомендации подписок',
+                'ordering': ('-score',),
+            },
+        ),
+        migrations.AddIndex(
+            model_name='followsuggestion',
+            index=models.Index(fields=['user', '-score', 'author'], name='suggestion_user_score_idx'),
+        ),
+        migrations.AddConstraint(
+            model_name='followsuggestion',
+            constraint=models.UniqueConstraint(fields=('user', 'author'), name='unique_follow_suggestion'),
+        ),
+    ]
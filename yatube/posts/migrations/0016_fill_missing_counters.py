@@ -0,0 +1,50 @@
+from django.conf import settings
+from django.db import migrations, models
+
+
+def fill_missing_counters(apps, schema_editor):
+    """Заводит счётчики пользователям, у которых их нет:
+    чтение страниц строки счётчиков больше не создаёт."""
+    User = apps.get_model(*settings.AUTH_USER_MODEL.split('.'))
+    Post = apps.get_model('posts', 'Post')
+    ArchivedPost = apps.get_model('posts', 'ArchivedPost')
+    Follow = apps.get_model('posts', 'Follow')
+    UserCounters = apps.get_model('posts', 'UserCounters')
+
+    missing = list(User.objects.filter(
+        counters__isnull=True).values_list('pk', flat=True))
+    if not missing:
+        return
+
+    def totals(queryset, field):
+        rows = queryset.filter(**{f'{field}__in': missing}).values(
+            field).annotate(total=models.Count('pk'))
+        return {row[field]: row['total'] for row in rows.order_by()}
+
+    posts = totals(Post.objects, 'author')
+    archived = totals(ArchivedPost.objects, 'author')
+    followers = totals(Follow.objects, 'author')
+    following = totals(Follow.objects, 'user')
+    UserCounters.objects.bulk_create(
+        (
+            UserCounters(
+                user_id=pk,
+                posts_count=posts.get(pk, 0) + archived.get(pk, 0),
+                followers_count=followers.get(pk, 0),
+                following_count=following.get(pk, 0),
+            )
+            for pk in missing
+        ),
+        batch_size=1000,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('posts', '0015_timeline_page_index'),
+    ]
+
+    operations = [
+        migrations.RunPython(fill_missing_counters, migrations.RunPython.noop),
+    ]
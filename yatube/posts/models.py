@@ -3,6 +3,30 @@ from django.db import models
 
 User = get_user_model()
 
+# Поля, которые выводят шаблоны лент
+FEED_FIELDS = (
+    'text',
+    'pub_date',
+    'updated',
+    'image',
+    'comments_count',
+    'author__username',
+    'author__first_name',
+    'author__last_name',
+    'group__slug',
+    'group__title',
+)
+
+
+class PostQuerySet(models.QuerySet):
+    def for_feed(self):
+        """Посты для лент: автор и группа подтягиваются одним запросом."""
+        return self.select_related('author', 'group').only(*FEED_FIELDS)
+
+    def for_detail(self):
+        """Пост для страницы поста вместе со счётчиками автора."""
+        return self.select_related('author__counters', 'group')
+
 
 class Post(models.Model):
     text = models.TextField(
@@ -12,6 +36,10 @@ class Post(models.Model):
         auto_now_add=True,
         verbose_name='Дата Публикации'
     )
+    updated = models.DateTimeField(
+        auto_now=True,
+        verbose_name='Дата Изменения'
+    )
     author = models.ForeignKey(
         User,
         on_delete=models.CASCADE,
@@ -31,11 +59,32 @@ class Post(models.Model):
         upload_to='posts/',
         blank=True
     )
+    comments_count = models.PositiveIntegerField(
+        default=0,
+        editable=False,
+        verbose_name='Число комментариев'
+    )
+
+    objects = PostQuerySet.as_manager()
+
+    is_archived = False
 
     class Meta:
         ordering = ('-pub_date',)
         verbose_name = 'Пост'
         verbose_name_plural = 'Посты'
+        # Ленты сортируются по (pub_date, id), в том числе при
+        # пагинации по курсору
+        indexes = [
+            models.Index(
+                fields=['-pub_date', '-id'], name='post_date_idx'),
+            models.Index(
+                fields=['author', '-pub_date', '-id'],
+                name='post_author_date_idx'),
+            models.Index(
+                fields=['group', '-pub_date', '-id'],
+                name='post_group_date_idx'),
+        ]
 
     def __str__(self):
         return self.text[:15]
@@ -86,6 +135,11 @@ class Comment(models.Model):
         ordering = ('-created', )
         verbose_name_plural = 'Коментарии'
         verbose_name = 'Коментарий'
+        indexes = [
+            models.Index(
+                fields=['post', '-created', '-id'],
+                name='comment_post_created_idx'),
+        ]
 
     def __str__(self):
         return self.text[:15]
@@ -105,6 +159,204 @@ class Follow(models.Model):
         constraints = [
             models.UniqueConstraint(
                 fields=['user', 'author'], name='unique_follows')]
+        # Подписчики автора без обращения к таблице: рассылка постов
+        # по лентам и подсчёт подписчиков
+        indexes = [
+            models.Index(
+                fields=['author', 'user'], name='follow_author_user_idx')]
 
     def __str__(self):
         return f'{self.user} подписался на {self.author}'
+
+
+class TimelineEntry(models.Model):
+    """Запись материализованной ленты подписок пользователя."""
+    user = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        related_name='timeline',
+        verbose_name='Читатель',
+    )
+    post = models.ForeignKey(
+        Post,
+        on_delete=models.CASCADE,
+        related_name='timeline_entries',
+        verbose_name='Пост',
+    )
+    pub_date = models.DateTimeField(
+        verbose_name='Дата Публикации'
+    )
+
+    class Meta:
+        ordering = ('-pub_date',)
+        verbose_name = 'Запись ленты'
+        verbose_name_plural = 'Записи ленты'
+        constraints = [
+            models.UniqueConstraint(
+                fields=['user', 'post'], name='unique_timeline_entry')]
+        # Страница ленты читается по индексу в порядке (дата, id поста)
+        indexes = [
+            models.Index(
+                fields=['user', '-pub_date', '-post'],
+                name='timeline_user_date_idx')]
+
+    def __str__(self):
+        return f'{self.post_id} в ленте {self.user_id}'
+
+
+class UserCounters(models.Model):
+    """Денормализованные счётчики пользователя."""
+    user = models.OneToOneField(
+        User,
+        on_delete=models.CASCADE,
+        primary_key=True,
+        related_name='counters',
+        verbose_name='Пользователь',
+    )
+    posts_count = models.PositiveIntegerField(
+        default=0,
+        verbose_name='Постов'
+    )
+    followers_count = models.PositiveIntegerField(
+        default=0,
+        verbose_name='Подписчиков'
+    )
+    following_count = models.PositiveIntegerField(
+        default=0,
+        verbose_name='Подписок'
+    )
+
+    class Meta:
+        verbose_name = 'Счётчики пользователя'
+        verbose_name_plural = 'Счётчики пользователей'
+
+    def __str__(self):
+        return f'Счётчики {self.user_id}'
+
+
+class FollowSuggestion(models.Model):
+    """Автор, на которого подписаны подписки пользователя, но не он сам.
+    Таблица пересобирается командой refresh_suggestions."""
+    user = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        related_name='follow_suggestions',
+        verbose_name='Читатель',
+    )
+    author = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        related_name='+',
+        verbose_name='Автор',
+    )
+    score = models.PositiveIntegerField(
+        verbose_name='Общих подписок'
+    )
+
+    class Meta:
+        ordering = ('-score',)
+        verbose_name = 'Рекомендация подписки'
+        verbose_name_plural = 'Рекомендации подписок'
+        constraints = [
+            models.UniqueConstraint(
+                fields=['user', 'author'], name='unique_follow_suggestion')]
+        indexes = [
+            models.Index(
+                fields=['user', '-score', 'author'],
+                name='suggestion_user_score_idx')]
+
+    def __str__(self):
+        return f'{self.author_id} для {self.user_id}'
+
+
+class ArchivedPost(models.Model):
+    """Пост, перенесённый из горячей таблицы командой archive_posts.
+    Id совпадает с id исходного поста, поэтому ссылки не меняются."""
+    id = models.IntegerField(primary_key=True)
+    text = models.TextField(
+        verbose_name='Текст Поста'
+    )
+    pub_date = models.DateTimeField(
+        verbose_name='Дата Публикации'
+    )
+    updated = models.DateTimeField(
+        verbose_name='Дата Изменения'
+    )
+    author = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        related_name='archived_posts',
+        verbose_name='Автор'
+    )
+    group = models.ForeignKey(
+        Group,
+        blank=True,
+        null=True,
+        on_delete=models.SET_NULL,
+        related_name='archived_posts',
+        verbose_name='Группа'
+    )
+    image = models.ImageField(
+        'Картинка',
+        upload_to='posts/',
+        blank=True
+    )
+    comments_count = models.PositiveIntegerField(
+        default=0,
+        editable=False,
+        verbose_name='Число комментариев'
+    )
+
+    objects = PostQuerySet.as_manager()
+
+    is_archived = True
+
+    class Meta:
+        ordering = ('-pub_date',)
+        verbose_name = 'Архивный пост'
+        verbose_name_plural = 'Архивные посты'
+        # Архив читается только профилем автора и страницей поста
+        indexes = [
+            models.Index(
+                fields=['author', '-pub_date', '-id'],
+                name='archived_author_date_idx'),
+        ]
+
+    def __str__(self):
+        return self.text[:15]
+
+
+class ArchivedComment(models.Model):
+    """Комментарий архивного поста."""
+    id = models.IntegerField(primary_key=True)
+    post = models.ForeignKey(
+        ArchivedPost,
+        on_delete=models.CASCADE,
+        related_name='comment',
+        verbose_name='Пост',
+    )
+    author = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        related_name='archived_comments',
+        verbose_name='Автор',
+    )
+    text = models.TextField(
+        verbose_name='Текст комментария',
+    )
+    created = models.DateTimeField(
+        verbose_name='Создан',
+    )
+
+    class Meta:
+        ordering = ('-created', )
+        verbose_name = 'Архивный комментарий'
+        verbose_name_plural = 'Архивные комментарии'
+        indexes = [
+            models.Index(
+                fields=['post', '-created', '-id'],
+                name='archived_comment_post_idx'),
+        ]
+
+    def __str__(self):
+        return self.text[:15]
@@ -0,0 +1,248 @@
+"""Потоковая выгрузка и загрузка данных в NDJSON.
+
+Каждая строка файла - один объект JSON с полем model. Группы, посты,
+комментарии, архивные посты с их комментариями и подписки пишутся
+в порядке зависимостей, пользователи
+задаются именами и при загрузке создаются, если их ещё нет. Id постов
+и комментариев сохраняются, поэтому загрузка идёт только в пустые
+таблицы: иначе совпавшие id молча пропускались бы, а комментарии
+цеплялись бы к чужим постам.
+
+Выгрузка читает строки через .values_list().iterator(), загрузка
+копит не больше одной пачки, так что память не растёт с объёмом.
+Файлы с расширением .gz сжимаются gzip.
+"""
+import gzip
+import json
+from datetime import datetime
+
+from django.contrib.auth.hashers import make_password
+from django.core.management.color import no_style
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import connection
+from django.utils.dateparse import parse_datetime
+
+from . import bulk, cache
+from .models import (ArchivedComment, ArchivedPost, Comment, Follow, Group,
+                     Post, User)
+
+# Поля выгрузки; имена после __ - естественные ключи связей
+EXPORT_FIELDS = {
+    'group': (Group, ('title', 'slug', 'description')),
+    'post': (Post, (
+        'id', 'text', 'pub_date', 'updated', 'image',
+        'author__username', 'group__slug',
+    )),
+    'comment': (Comment, (
+        'id', 'post', 'author__username', 'text', 'created',
+    )),
+    # Счётчик комментариев архивного поста не пересчитывается
+    'archivedpost': (ArchivedPost, (
+        'id', 'text', 'pub_date', 'updated', 'image', 'comments_count',
+        'author__username', 'group__slug',
+    )),
+    'archivedcomment': (ArchivedComment, (
+        'id', 'post', 'author__username', 'text', 'created',
+    )),
+    'follow': (Follow, ('user__username', 'author__username')),
+}
+
+# Таблицы, которые должны быть пусты перед загрузкой
+TARGET_MODELS = tuple(model for model, _ in EXPORT_FIELDS.values())
+
+
+def open_stream(path, mode='r'):
+    """Текстовый файл, сжатый gzip, если имя кончается на .gz."""
+    if path.endswith('.gz'):
+        return gzip.open(path, mode + 't', encoding='utf-8')
+    return open(path, mode, encoding='utf-8')
+
+
+def export_records(chunk_size=2000):
+    """Словари всех выгружаемых строк в порядке зависимостей."""
+    for name, (model, fields) in EXPORT_FIELDS.items():
+        rows = model.objects.order_by('pk').values_list(*fields)
+        for row in rows.iterator(chunk_size=chunk_size):
+            record = {'model': name}
+            for field, value in zip(fields, row):
+                record[field.split('__')[0]] = value
+            yield record
+
+
+class Encoder(DjangoJSONEncoder):
+    """Даты с микросекундами: DjangoJSONEncoder округляет их до
+    миллисекунд, и после загрузки менялся бы порядок постов."""
+
+    def default(self, o):
+        if isinstance(o, datetime):
+            return o.isoformat()
+        return super().default(o)
+
+
+def dumps(record):
+    return json.dumps(record, cls=Encoder, ensure_ascii=False)
+
+
+class Importer:
+    """Загружает записи пачками по batch_size, разрешая связи
+    по естественным ключам одним запросом на пачку.
+
+    После finish() counts - число действительно записанных строк,
+    skipped - число прочитанных, но не записанных (дубликаты в файле,
+    комментарии без поста)."""
+
+    def __init__(self, batch_size=1000):
+        filled = [
+            model._meta.verbose_name_plural for model in TARGET_MODELS
+            if model.objects.exists()
+        ]
+        if filled:
+            raise ValueError(
+                'Загрузка возможна только в пустые таблицы, '
+                f'а в базе уже есть: {", ".join(map(str, filled))}')
+        self.batch_size = batch_size
+        self.model = None
+        self.pending = []
+        self.read = dict.fromkeys(EXPORT_FIELDS, 0)
+        self.counts = dict.fromkeys(EXPORT_FIELDS, 0)
+        self.skipped = dict.fromkeys(EXPORT_FIELDS, 0)
+        self.scopes = {'global'}
+        self.password = make_password(None)
+
+    def add(self, record):
+        name = record.pop('model')
+        if name not in EXPORT_FIELDS:
+            raise ValueError(f'Неизвестная модель: {name}')
+        if name != self.model or len(self.pending) >= self.batch_size:
+            self.flush()
+            self.model = name
+        self.pending.append(record)
+
+    def flush(self):
+        if not self.pending:
+            return
+        getattr(self, f'_insert_{self.model}s')(self.pending)
+        self.read[self.model] += len(self.pending)
+        self.pending = []
+
+    def finish(self):
+        """Дописывает последнюю пачку, считает записанные строки
+        и сдвигает последовательности id за загруженные значения."""
+        self.flush()
+        models = [model for model, _ in EXPORT_FIELDS.values()]
+        # Таблицы были пусты, так что записано ровно то, что в них есть
+        for name, (model, _) in EXPORT_FIELDS.items():
+            self.counts[name] = model.objects.count()
+            self.skipped[name] = self.read[name] - self.counts[name]
+        with connection.cursor() as cursor:
+            for sql in connection.ops.sequence_reset_sql(no_style(), models):
+                cursor.execute(sql)
+        cache.bump_on_commit(*self.scopes)
+
+    def _users(self, usernames):
+        """Id пользователей по именам, недостающие создаются."""
+        usernames = set(usernames)
+        found = dict(User.objects.filter(
+            username__in=usernames).values_list('username', 'pk'))
+        missing = usernames - found.keys()
+        if missing:
+            bulk.insert(User, (
+                User(username=username, password=self.password)
+                for username in missing
+            ), self.batch_size)
+            found.update(User.objects.filter(
+                username__in=missing).values_list('username', 'pk'))
+        self.scopes.update(f'author:{username}' for username in usernames)
+        return found
+
+    def _insert_groups(self, records):
+        bulk.insert(Group, (Group(**record) for record in records),
+                    self.batch_size)
+        self.scopes.update(f'group:{record["slug"]}' for record in records)
+
+    def _insert_posts(self, records):
+        users = self._users(record['author'] for record in records)
+        slugs = {record['group'] for record in records} - {None}
+        groups = dict(Group.objects.filter(
+            slug__in=slugs).values_list('slug', 'pk'))
+        with bulk.keep_dates(Post, 'pub_date', 'updated'):
+            bulk.insert(Post, (
+                Post(
+                    id=record['id'],
+                    text=record['text'],
+                    pub_date=parse_datetime(record['pub_date']),
+                    updated=parse_datetime(record['updated']),
+                    image=record['image'] or '',
+                    author_id=users[record['author']],
+                    group_id=groups.get(record['group']),
+                )
+                for record in records
+            ), self.batch_size)
+        self.scopes.update(f'group:{slug}' for slug in slugs)
+
+    def _insert_comments(self, records):
+        users = self._users(record['author'] for record in records)
+        posts = set(Post.objects.filter(
+            pk__in={record['post'] for record in records}
+        ).values_list('pk', flat=True))
+        comments = [
+            Comment(
+                id=record['id'],
+                post_id=record['post'],
+                author_id=users[record['author']],
+                text=record['text'],
+                created=parse_datetime(record['created']),
+            )
+            for record in records if record['post'] in posts
+        ]
+        with bulk.keep_dates(Comment, 'created'):
+            bulk.insert(Comment, comments, self.batch_size)
+
+    def _insert_archivedposts(self, records):
+        users = self._users(record['author'] for record in records)
+        slugs = {record['group'] for record in records} - {None}
+        groups = dict(Group.objects.filter(
+            slug__in=slugs).values_list('slug', 'pk'))
+        bulk.insert(ArchivedPost, (
+            ArchivedPost(
+                id=record['id'],
+                text=record['text'],
+                pub_date=parse_datetime(record['pub_date']),
+                updated=parse_datetime(record['updated']),
+                image=record['image'] or '',
+                comments_count=record['comments_count'],
+                author_id=users[record['author']],
+                group_id=groups.get(record['group']),
+            )
+            for record in records
+        ), self.batch_size)
+        self.scopes.update(f'post:{record["id"]}' for record in records)
+
+    def _insert_archivedcomments(self, records):
+        users = self._users(record['author'] for record in records)
+        posts = set(ArchivedPost.objects.filter(
+            pk__in={record['post'] for record in records}
+        ).values_list('pk', flat=True))
+        bulk.insert(ArchivedComment, (
+            ArchivedComment(
+                id=record['id'],
+                post_id=record['post'],
+                author_id=users[record['author']],
+                text=record['text'],
+                created=parse_datetime(record['created']),
+            )
+            for record in records if record['post'] in posts
+        ), self.batch_size)
+
+    def _insert_follows(self, records):
+        users = self._users(
+            username for record in records
+            for username in (record['user'], record['author'])
+        )
+        bulk.insert(Follow, (
+            Follow(
+                user_id=users[record['user']],
+                author_id=users[record['author']],
+            )
+            for record in records if record['user'] != record['author']
+        ), self.batch_size)
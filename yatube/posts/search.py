@@ -0,0 +1,346 @@
+"""Полнотекстовый поиск по постам и комментариям.
+
+В SQLite индекс - таблицы FTS5 posts_post_fts и posts_comment_fts.
+FTS5 не умеет русскую морфологию, поэтому в индекс пишутся основы
+слов, полученные лёгким стеммером из этого модуля, а запрос проходит
+через тот же стеммер. Индекс обновляют сигналы, команда
+rebuild_search_index строит его заново.
+
+В PostgreSQL используются GIN-индексы по to_tsvector('russian', text),
+которые база обновляет сама. На других базах поиск идёт через LIKE.
+
+Результаты ранжируются (bm25 или ts_rank; совпадение в комментарии
+весит вдвое меньше совпадения в тексте поста) и листаются по курсору
+из пары (ранг, id) без OFFSET. Ранжировать приходится все совпадения,
+поэтому список (ранг, id) лучших SEARCH_MAX_RESULTS постов считается
+один раз и хранится в кеше SEARCH_CACHE_TIMEOUT секунд; страницы
+режутся из готового списка. Новые посты и комментарии попадают в
+результаты после истечения кеша, удалённые посты просто не находятся
+при выборке страницы. Сразу сбрасывает списки только rebuild.
+"""
+import base64
+import bisect
+import hashlib
+import re
+from functools import wraps
+
+from django.core.cache import cache
+from django.db import connection
+
+from . import cache as feed_cache
+from .models import Post
+from .utils import NEXT, PREVIOUS, CursorPage
+
+SEARCH_PER_PAGE = 10
+# Сколько лучших результатов запроса можно пролистать
+SEARCH_MAX_RESULTS = 1000
+SEARCH_CACHE_TIMEOUT = 60
+# Сколько строк rebuild читает и пишет за раз
+REBUILD_BATCH = 1000
+RANKED_KEY = 'search:ranked:{}'
+# Доля ранга, которую даёт совпадение в комментарии
+COMMENT_WEIGHT = 0.5
+
+MIN_STEM = 3
+_WORD = re.compile(r'\w+')
+_CYRILLIC = re.compile('[а-я]')
+_REFLEXIVE = ('ся', 'сь')
+# Окончания прилагательных, глаголов и существительных, длинные первыми
+_ENDINGS = sorted(set((
+    'ее ие ые ое ими ыми ей ий ый ой ем им ым ом его ого ему ому их ых '
+    'ую юю ая яя ою ею '
+    'ла на ете йте ли й ем ло но ет ют ны ть ешь нно ила ыла ена '
+    'ейте уйте ите или ыли ей уй ил ыл им ым ен ило ыло ено ят ует уют '
+    'ит ыт ены ить ыть ишь ую ю '
+    'а ев ов ие ье е иями ями ами еи ии и ией ей ой ий й иям ям ием ем '
+    'ам ом о у ах иях ях ы ь ию ью ю ия ья я'
+).split()), key=len, reverse=True)
+
+SQLITE_TABLES = (
+    'CREATE VIRTUAL TABLE IF NOT EXISTS posts_post_fts USING fts5('
+    "body, tokenize = 'unicode61 remove_diacritics 2')",
+    'CREATE VIRTUAL TABLE IF NOT EXISTS posts_comment_fts USING fts5('
+    "body, post_id UNINDEXED, tokenize = 'unicode61 remove_diacritics 2')",
+)
+POSTGRES_INDEXES = (
+    'CREATE INDEX IF NOT EXISTS posts_post_text_fts ON posts_post '
+    "USING gin (to_tsvector('russian', text))",
+    'CREATE INDEX IF NOT EXISTS posts_comment_text_fts ON posts_comment '
+    "USING gin (to_tsvector('russian', text))",
+)
+
+
+def stem(word):
+    """Основа слова: русские окончания отбрасываются, остальное
+    только приводится к нижнему регистру."""
+    word = word.lower().replace('ё', 'е')
+    if not _CYRILLIC.search(word):
+        return word
+    for suffix in _REFLEXIVE:
+        if word.endswith(suffix) and len(word) - len(suffix) >= MIN_STEM:
+            word = word[:-len(suffix)]
+            break
+    for ending in _ENDINGS:
+        if word.endswith(ending) and len(word) - len(ending) >= MIN_STEM:
+            word = word[:-len(ending)]
+            break
+    return word
+
+
+def index_text(text):
+    """Текст для индекса FTS5: основы слов через пробел."""
+    return ' '.join(stem(word) for word in _WORD.findall(text))
+
+
+def match_query(query):
+    """Запрос FTS5 из пользовательской строки или None, если в ней
+    нет слов. Основы берутся в кавычки, чтобы синтаксис FTS5 из
+    строки не выполнялся."""
+    stems = [stem(word) for word in _WORD.findall(query)]
+    if not stems:
+        return None
+    return ' '.join(f'"{word}"' for word in stems)
+
+
+def create_index(using=None):
+    """Создаёт структуры поиска для базы соединения using."""
+    using = using or connection
+    statements = {
+        'sqlite': SQLITE_TABLES,
+        'postgresql': POSTGRES_INDEXES,
+    }.get(using.vendor, ())
+    with using.cursor() as cursor:
+        for statement in statements:
+            cursor.execute(statement)
+
+
+def drop_index(using=None):
+    using = using or connection
+    statements = {
+        'sqlite': ('posts_post_fts', 'posts_comment_fts'),
+        'postgresql': ('posts_post_text_fts', 'posts_comment_text_fts'),
+    }.get(using.vendor, ())
+    kind = 'TABLE' if using.vendor == 'sqlite' else 'INDEX'
+    with using.cursor() as cursor:
+        for name in statements:
+            cursor.execute(f'DROP {kind} IF EXISTS {name}')
+
+
+def _copy(using, select, insert, convert):
+    """Переписывает строки select в insert пачками по REBUILD_BATCH,
+    не держа таблицу в памяти."""
+    with using.cursor() as source, using.cursor() as target:
+        source.execute(select)
+        while True:
+            rows = source.fetchmany(REBUILD_BATCH)
+            if not rows:
+                return
+            target.executemany(insert, [convert(*row) for row in rows])
+
+
+def rebuild(using=None):
+    """Заново заполняет индекс FTS5 из таблиц постов и комментариев."""
+    using = using or connection
+    feed_cache.bump_on_commit('search')
+    if using.vendor != 'sqlite':
+        return
+    with using.cursor() as cursor:
+        cursor.execute('DELETE FROM posts_post_fts')
+        cursor.execute('DELETE FROM posts_comment_fts')
+    _copy(
+        using, 'SELECT id, text FROM posts_post',
+        'INSERT INTO posts_post_fts (rowid, body) VALUES (%s, %s)',
+        lambda pk, text: (pk, index_text(text)),
+    )
+    _copy(
+        using, 'SELECT id, post_id, text FROM posts_comment',
+        'INSERT INTO posts_comment_fts (rowid, body, post_id) '
+        'VALUES (%s, %s, %s)',
+        lambda pk, post_id, text: (pk, index_text(text), post_id),
+    )
+
+
+def _sqlite_only(func):
+    """Обновление индекса нужно только таблицам FTS5 в SQLite."""
+    @wraps(func)
+    def wrapper(*args):
+        if connection.vendor == 'sqlite':
+            with connection.cursor() as cursor:
+                func(cursor, *args)
+    return wrapper
+
+
+@_sqlite_only
+def index_post(cursor, post):
+    cursor.execute('DELETE FROM posts_post_fts WHERE rowid = %s', [post.pk])
+    cursor.execute(
+        'INSERT INTO posts_post_fts (rowid, body) VALUES (%s, %s)',
+        [post.pk, index_text(post.text)],
+    )
+
+
+@_sqlite_only
+def unindex_post(cursor, post_id):
+    cursor.execute('DELETE FROM posts_post_fts WHERE rowid = %s', [post_id])
+
+
+@_sqlite_only
+def unindex_many(cursor, post_ids, comment_ids):
+    """Убирает из индекса пачку постов и комментариев по rowid."""
+    for table, ids in (
+        ('posts_post_fts', post_ids), ('posts_comment_fts', comment_ids),
+    ):
+        if ids:
+            placeholders = ', '.join(['%s'] * len(ids))
+            cursor.execute(
+                f'DELETE FROM {table} WHERE rowid IN ({placeholders})', ids)
+
+
+@_sqlite_only
+def index_comment(cursor, comment):
+    cursor.execute(
+        'DELETE FROM posts_comment_fts WHERE rowid = %s', [comment.pk])
+    cursor.execute(
+        'INSERT INTO posts_comment_fts (rowid, body, post_id) '
+        'VALUES (%s, %s, %s)',
+        [comment.pk, index_text(comment.text), comment.post_id],
+    )
+
+
+@_sqlite_only
+def unindex_comment(cursor, comment_id):
+    cursor.execute(
+        'DELETE FROM posts_comment_fts WHERE rowid = %s', [comment_id])
+
+
+def _escape_like(text):
+    """Экранирует спецсимволы LIKE, чтобы % и _ искались буквально."""
+    for char in ('\\', '%', '_'):
+        text = text.replace(char, '\\' + char)
+    return text
+
+
+def _hits(query):
+    """Подзапрос (post_id, score) совпадений; меньший score - выше."""
+    if connection.vendor == 'sqlite':
+        match = match_query(query)
+        if match is None:
+            return None
+        return (
+            'SELECT rowid AS post_id, bm25(posts_post_fts) AS score '
+            'FROM posts_post_fts WHERE posts_post_fts MATCH %s '
+            'UNION ALL '
+            'SELECT post_id, bm25(posts_comment_fts) * %s '
+            'FROM posts_comment_fts WHERE posts_comment_fts MATCH %s',
+            [match, COMMENT_WEIGHT, match],
+        )
+    if not _WORD.search(query):
+        return None
+    if connection.vendor == 'postgresql':
+        vector = "to_tsvector('russian', text)"
+        tsquery = "plainto_tsquery('russian', %s)"
+        return (
+            f'SELECT id AS post_id, -ts_rank({vector}, {tsquery}) AS score '
+            f'FROM posts_post WHERE {vector} @@ {tsquery} '
+            'UNION ALL '
+            f'SELECT post_id, -ts_rank({vector}, {tsquery}) * %s '
+            f'FROM posts_comment WHERE {vector} @@ {tsquery}',
+            [query, query, query, COMMENT_WEIGHT, query],
+        )
+    like = f'%{_escape_like(query)}%'
+    return (
+        'SELECT id AS post_id, 0 AS score FROM posts_post '
+        "WHERE text LIKE %s ESCAPE '\\' "
+        'UNION ALL '
+        'SELECT post_id, 0 FROM posts_comment '
+        "WHERE text LIKE %s ESCAPE '\\'",
+        [like, like],
+    )
+
+
+def ranked(query):
+    """Пары (ранг, id) лучших постов по запросу, лучшие первыми.
+
+    Считаются один раз за SEARCH_CACHE_TIMEOUT и версию индекса:
+    следующие страницы и повторные запросы берут список из кеша.
+    """
+    hits = _hits(query)
+    if hits is None:
+        return []
+    key = RANKED_KEY.format(hashlib.md5(query.encode()).hexdigest())
+    current = feed_cache.versions(['search'])
+    entry = cache.get(key)
+    if entry is not None and entry[0] == current:
+        return entry[1]
+    sql, params = hits
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f'SELECT MIN(score) AS relevance, post_id FROM ({sql}) hits '
+            'GROUP BY post_id ORDER BY relevance, post_id LIMIT %s',
+            params + [SEARCH_MAX_RESULTS],
+        )
+        rows = [tuple(row) for row in cursor.fetchall()]
+    cache.set(key, (current, rows), SEARCH_CACHE_TIMEOUT)
+    return rows
+
+
+def encode_cursor(post, direction):
+    raw = f'{direction}|{post.search_score!r}|{post.pk}'
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip('=')
+
+
+def decode_cursor(token):
+    try:
+        raw = base64.urlsafe_b64decode(token + '=' * (-len(token) % 4))
+        direction, score, pk = raw.decode().split('|')
+        score, pk = float(score), int(pk)
+    except ValueError:
+        return None
+    if direction not in (NEXT, PREVIOUS):
+        return None
+    return direction, score, pk
+
+
+class SearchPaginator:
+    """Keyset-пагинация результатов поиска по паре (ранг, id)."""
+
+    def __init__(self, query, per_page=SEARCH_PER_PAGE):
+        self.query = query
+        self.per_page = per_page
+
+    def encode(self, post, direction):
+        return encode_cursor(post, direction)
+
+    def get_page(self, token=None):
+        cursor = decode_cursor(token) if token else None
+        if cursor is None:
+            posts, has_more = self._fetch()
+            return CursorPage(posts, self, has_more, False)
+        direction, score, pk = cursor
+        if direction == NEXT:
+            posts, has_more = self._fetch(after=(score, pk))
+            return CursorPage(posts, self, has_more, True)
+        posts, has_more = self._fetch(before=(score, pk))
+        if not has_more:
+            return self.get_page()
+        return CursorPage(posts, self, True, True)
+
+    def _fetch(self, after=None, before=None):
+        rows = ranked(self.query)
+        if before:
+            stop = bisect.bisect_left(rows, before)
+            rows = rows[max(stop - self.per_page - 1, 0):stop]
+            has_more = len(rows) > self.per_page
+            rows = rows[-self.per_page:]
+        else:
+            start = bisect.bisect_right(rows, after) if after else 0
+            rows = rows[start:start + self.per_page + 1]
+            has_more = len(rows) > self.per_page
+            rows = rows[:self.per_page]
+        posts = Post.objects.for_feed().in_bulk([pk for _, pk in rows])
+        found = []
+        for score, pk in rows:
+            if pk in posts:
+                posts[pk].search_score = score
+                found.append(posts[pk])
+        return found, has_more
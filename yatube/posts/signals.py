@@ -0,0 +1,204 @@
+from django.core.signals import request_finished, request_started
+from django.db.models.signals import (
+    post_delete, post_save, pre_delete, pre_save
+)
+from django.dispatch import receiver
+
+from . import cache, counters, following, search, thumbnails, timeline
+from .models import (
+    ArchivedComment, ArchivedPost, Comment, Follow, Group, Post, User,
+    UserCounters
+)
+
+# Поля пользователя, которые выводятся на страницах
+USER_DISPLAY_FIELDS = ('username', 'first_name', 'last_name')
+
+
+def _post_scopes(post):
+    """Области кеша, чьи страницы показывают пост."""
+    scopes = ['global', f'post:{post.pk}', f'author:{post.author.username}']
+    old_slug = getattr(post, '_old_group_slug', None)
+    for slug in (post.group and post.group.slug, old_slug):
+        if slug:
+            scopes.append(f'group:{slug}')
+    return scopes
+
+
+def _user_scopes(user):
+    """Области страниц, где выводится имя пользователя: его профиль,
+    ленты с его постами и страницы его постов и постов с его
+    комментариями."""
+    scopes = {'global', f'author:{user.username}'}
+    for model in (Post, ArchivedPost):
+        rows = model.objects.filter(author=user).values_list(
+            'pk', 'group__slug')
+        for post_id, slug in rows.iterator():
+            scopes.add(f'post:{post_id}')
+            if slug:
+                scopes.add(f'group:{slug}')
+    for model in (Comment, ArchivedComment):
+        post_ids = model.objects.filter(author=user).values_list(
+            'post_id', flat=True).distinct()
+        scopes.update(f'post:{post_id}' for post_id in post_ids.iterator())
+    return scopes
+
+
+def _group_post_scopes(group):
+    """Области страниц постов группы: на них ссылка на группу."""
+    scopes = set()
+    for model in (Post, ArchivedPost):
+        rows = model.objects.filter(group=group).values_list(
+            'pk', 'author__username')
+        for post_id, username in rows.iterator():
+            scopes.update((f'post:{post_id}', f'author:{username}'))
+    return scopes
+
+
+@receiver(post_save, sender=User)
+def create_user_counters(sender, instance, created, raw=False, **kwargs):
+    """Заводит нулевые счётчики новому пользователю."""
+    if created and not raw:
+        UserCounters.objects.get_or_create(user=instance)
+
+
+@receiver(pre_save, sender=User)
+def remember_user_names(sender, instance, raw=False, update_fields=None,
+                        **kwargs):
+    """Запоминает прежние имена пользователя. Вход в систему сохраняет
+    только last_login и базу здесь не читает."""
+    instance._old_names = None
+    if not instance.pk or raw or (
+        update_fields is not None
+        and not set(update_fields) & set(USER_DISPLAY_FIELDS)
+    ):
+        return
+    instance._old_names = User.objects.filter(
+        pk=instance.pk).values_list(*USER_DISPLAY_FIELDS).first()
+
+
+@receiver(post_save, sender=User)
+def invalidate_user_pages(sender, instance, created, raw=False, **kwargs):
+    """Сбрасывает страницы, где выводились прежние имена пользователя."""
+    old = getattr(instance, '_old_names', None)
+    names = tuple(getattr(instance, field) for field in USER_DISPLAY_FIELDS)
+    if created or raw or old is None or old == names:
+        return
+    cache.bump_on_commit(f'author:{old[0]}', *_user_scopes(instance))
+
+
+@receiver(post_delete, sender=User)
+def invalidate_deleted_user_pages(sender, instance, **kwargs):
+    """Посты и комментарии удалённого пользователя сбрасывают свои
+    страницы сами, остаётся профиль."""
+    cache.bump_on_commit(f'author:{instance.username}')
+
+
+@receiver(pre_save, sender=Post)
+def remember_post_state(sender, instance, raw=False, **kwargs):
+    """Запоминает прежние группу и картинку поста: страницы старой
+    группы нужно сбросить, а превью резать только для новой картинки."""
+    instance._old_group_slug = instance._old_image = None
+    if instance.pk and not raw:
+        instance._old_group_slug, instance._old_image = (
+            Post.objects.filter(pk=instance.pk).values_list(
+                'group__slug', 'image').first() or (None, None)
+        )
+
+
+@receiver(post_save, sender=Post)
+def fan_out_new_post(sender, instance, created, raw=False, **kwargs):
+    """Раскладывает новый пост по лентам подписчиков."""
+    if raw:
+        return
+    search.index_post(instance)
+    if created:
+        counters.bump(instance.author_id, 'posts_count', 1)
+        timeline.fan_out_post(instance)
+    image = instance.image.name
+    if image and image != instance._old_image:
+        thumbnails.schedule(image)
+    # Версии повышаются последними, когда счётчики и ленты уже записаны
+    cache.bump_on_commit(*_post_scopes(instance))
+
+
+@receiver(post_delete, sender=Post)
+def count_deleted_post(sender, instance, **kwargs):
+    search.unindex_post(instance.pk)
+    counters.bump(instance.author_id, 'posts_count', -1)
+    cache.bump_on_commit(*_post_scopes(instance))
+
+
+@receiver(pre_save, sender=Group)
+def remember_group_slug(sender, instance, raw=False, **kwargs):
+    instance._old_slug = None
+    if instance.pk and not raw:
+        instance._old_slug = Group.objects.filter(
+            pk=instance.pk).values_list('slug', flat=True).first()
+
+
+@receiver(post_save, sender=Group)
+def invalidate_group_pages(sender, instance, raw=False, **kwargs):
+    """Сбрасывает страницы группы, а при смене адреса - и страницы
+    её постов со ссылкой на группу."""
+    scopes = ['global', f'group:{instance.slug}']
+    old_slug = getattr(instance, '_old_slug', None)
+    if old_slug and old_slug != instance.slug and not raw:
+        scopes.append(f'group:{old_slug}')
+        scopes.extend(_group_post_scopes(instance))
+    cache.bump_on_commit(*scopes)
+
+
+@receiver(pre_delete, sender=Group)
+def remember_group_posts(sender, instance, **kwargs):
+    """Запоминает страницы постов группы, пока посты на неё ссылаются:
+    SET_NULL обнуляет ссылку без сигналов постов."""
+    instance._post_scopes = _group_post_scopes(instance)
+
+
+@receiver(post_delete, sender=Group)
+def invalidate_deleted_group_pages(sender, instance, **kwargs):
+    cache.bump_on_commit(
+        'global', f'group:{instance.slug}',
+        *getattr(instance, '_post_scopes', ()))
+
+
+@receiver(post_save, sender=Comment)
+def count_new_comment(sender, instance, created, raw=False, **kwargs):
+    if created and not raw:
+        counters.bump_comments(instance.post_id, 1)
+    if not raw:
+        search.index_comment(instance)
+    cache.bump_on_commit(f'post:{instance.post_id}')
+
+
+@receiver(post_delete, sender=Comment)
+def count_deleted_comment(sender, instance, **kwargs):
+    counters.bump_comments(instance.post_id, -1)
+    search.unindex_comment(instance.pk)
+    cache.bump_on_commit(f'post:{instance.post_id}')
+
+
+@receiver(post_save, sender=Follow)
+def fill_timeline_on_follow(sender, instance, created, raw=False, **kwargs):
+    """Добавляет посты автора в ленту нового подписчика."""
+    if created and not raw:
+        following.followed(
+            instance.user, {instance.author_id: instance.author.username})
+
+
+@receiver(post_delete, sender=Follow)
+def clear_timeline_on_unfollow(sender, instance, **kwargs):
+    """Убирает посты автора из ленты после отписки."""
+    following.unfollowed(
+        instance.user, {instance.author_id: instance.author.username})
+
+
+@receiver(request_started)
+def start_thumbnail_queue(sender, **kwargs):
+    thumbnails.start_request()
+
+
+@receiver(request_finished)
+def cut_queued_thumbnails(sender, **kwargs):
+    """Режет превью после отправки ответа, не задерживая его."""
+    thumbnails.finish_request()
@@ -0,0 +1,58 @@
+"""Рекомендации, на кого подписаться.
+
+Пользователю предлагаются авторы, на которых подписаны его подписки
+(друзья друзей), по числу таких общих подписок. Обход графа подписок
+дорогой, поэтому рекомендации считаются заранее для всех
+пользователей одним запросом и хранятся в FollowSuggestion, а
+страница читает готовые строки по индексу. Таблицу периодически
+пересобирает команда refresh_suggestions; подписка через
+following.follow сразу убирает ставшую ненужной рекомендацию.
+"""
+from django.db import connection, transaction
+
+from .models import Follow, FollowSuggestion
+
+# Сколько рекомендаций хранить для каждого пользователя
+PER_USER = 20
+# Сколько из них показывать на странице подписок
+SHOWN = 5
+
+
+def refresh(per_user=PER_USER):
+    """Пересобирает рекомендации всех пользователей.
+    Возвращает число записанных строк."""
+    follow = Follow._meta.db_table
+    with transaction.atomic(), connection.cursor() as cursor:
+        FollowSuggestion.objects.all().delete()
+        cursor.execute(
+            f'INSERT INTO {FollowSuggestion._meta.db_table} '
+            '(user_id, author_id, score) '
+            'SELECT user_id, author_id, score FROM ('
+            'SELECT mine.user_id, theirs.author_id, COUNT(*) AS score, '
+            'ROW_NUMBER() OVER (PARTITION BY mine.user_id '
+            'ORDER BY COUNT(*) DESC, theirs.author_id) AS place '
+            f'FROM {follow} mine '
+            f'JOIN {follow} theirs ON theirs.user_id = mine.author_id '
+            f'LEFT JOIN {follow} existing '
+            'ON existing.user_id = mine.user_id '
+            'AND existing.author_id = theirs.author_id '
+            'WHERE theirs.author_id <> mine.user_id '
+            'AND existing.id IS NULL '
+            'GROUP BY mine.user_id, theirs.author_id'
+            ') ranked WHERE place <= %s',
+            [per_user],
+        )
+        return cursor.rowcount
+
+
+def for_user(user, limit=SHOWN):
+    """Лучшие рекомендации пользователя вместе с авторами."""
+    return FollowSuggestion.objects.filter(user=user).select_related(
+        'author').order_by('-score', 'author')[:limit]
+
+
+def discard(user_id, author_ids):
+    """Убирает рекомендации авторов, на которых пользователь
+    подписался."""
+    FollowSuggestion.objects.filter(
+        user_id=user_id, author_id__in=author_ids).delete()
@@ -0,0 +1,11 @@
+from django import template
+
+from posts.utils import page_window as build_page_window
+
+register = template.Library()
+
+
+@register.filter
+def page_window(page):
+    """Номера страниц навигации без полного page_range."""
+    return build_page_window(page)
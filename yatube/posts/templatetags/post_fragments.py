@@ -0,0 +1,50 @@
+import hashlib
+
+from django import template
+from django.conf import settings
+from django.core.cache import cache
+from django.template.loader import render_to_string
+from django.utils.safestring import mark_safe
+
+from posts import thumbnails
+
+register = template.Library()
+
+FRAGMENT_KEY = 'post:fragment:{}'
+FRAGMENT_TEMPLATE = 'posts/includes/post.html'
+
+
+def fragment_key(post):
+    """Ключ меняется вместе с любыми данными, которые выводит фрагмент:
+    правка поста обновляет updated, и старый фрагмент больше не читается."""
+    author = post.author
+    raw = ':'.join(str(part) for part in (
+        post.pk,
+        post.updated.timestamp(),
+        author.username,
+        author.first_name,
+        author.last_name,
+        post.group.slug if post.group else '',
+    ))
+    return FRAGMENT_KEY.format(hashlib.md5(raw.encode()).hexdigest())
+
+
+@register.simple_tag
+def cached_posts(posts):
+    """Фрагменты разметки постов ленты: берутся из кеша одним get_many,
+    дорисовываются только недостающие."""
+    posts = list(posts)
+    keys = [fragment_key(post) for post in posts]
+    fragments = cache.get_many(keys)
+    ready = {}
+    for key, post in zip(keys, posts):
+        if key in fragments:
+            continue
+        fragments[key] = render_to_string(FRAGMENT_TEMPLATE, {'post': post})
+        # Пока превью режется в фоне, фрагмент ссылается на оригинал
+        # и в кеш не попадает
+        if not post.image or thumbnails.is_ready(post.image.name):
+            ready[key] = fragments[key]
+    if ready:
+        cache.set_many(ready, settings.FEED_CACHE_TIMEOUT)
+    return [mark_safe(fragments[key]) for key in keys]
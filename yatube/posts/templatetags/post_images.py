@@ -0,0 +1,72 @@
+import logging
+
+from django import template
+from django.conf import settings
+from django.template.loader import render_to_string
+from django.utils.safestring import mark_safe
+from sorl.thumbnail import default
+from sorl.thumbnail.conf import settings as sorl_settings
+
+from posts import thumbnails
+
+logger = logging.getLogger(__name__)
+
+register = template.Library()
+
+PICTURE_TEMPLATE = 'posts/includes/picture.html'
+MIME_TYPES = {'JPEG': 'image/jpeg', 'WEBP': 'image/webp', 'PNG': 'image/png'}
+
+
+@register.simple_tag
+def responsive_image(image, variant, css_class=''):
+    """Разметка <picture> с srcset из набора превью variant.
+
+    Пока превью не нарезаны, выводится исходная картинка. Ошибки,
+    как и в теге {% thumbnail %}, только пишутся в лог.
+    """
+    if not image:
+        return ''
+    try:
+        return _render_picture(image, variant, css_class)
+    except Exception:
+        if sorl_settings.THUMBNAIL_DEBUG:
+            raise
+        logger.exception('Не удалось вывести картинку %s', image)
+        return ''
+
+
+def _render_picture(image, variant, css_class):
+    spec = settings.POST_IMAGE_VARIANTS[variant]
+    srcsets = {}
+    for image_format, width, geometry, options in thumbnails.variant_set(
+        variant
+    ):
+        thumb = default.backend.get_thumbnail(image, geometry, **options)
+        if thumb.name == image.name:
+            srcsets = {}
+            break
+        srcsets.setdefault(image_format, []).append((width, thumb))
+    context = {
+        'css_class': css_class,
+        'lazy': spec['lazy'],
+        'src': image.url,
+    }
+    if srcsets:
+        *preferred, fallback = srcsets
+        largest = srcsets[fallback][-1][1]
+        context.update({
+            'sources': [
+                {'type': MIME_TYPES[name], 'srcset': _srcset(srcsets[name])}
+                for name in preferred
+            ],
+            'srcset': _srcset(srcsets[fallback]),
+            'sizes': spec['sizes'],
+            'src': largest.url,
+            'width': largest.width,
+            'height': largest.height,
+        })
+    return mark_safe(render_to_string(PICTURE_TEMPLATE, context))
+
+
+def _srcset(candidates):
+    return ', '.join(f'{thumb.url} {width}w' for width, thumb in candidates)
@@ -0,0 +1,116 @@
+import json
+
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.db import connection
+from django.test import Client, TestCase
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from posts.models import Comment, Follow, Group, Post
+from posts.utils import COMMENTS_PER_PAGE
+
+User = get_user_model()
+
+
+class ApiTests(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.author = User.objects.create_user(username='author')
+        cls.reader = User.objects.create_user(username='reader')
+        cls.group = Group.objects.create(
+            title='Группа', slug='group', description='Описание')
+        cls.posts = [
+            Post.objects.create(
+                text=f'Пост {number}', author=cls.author,
+                group=cls.group if number % 2 else None)
+            for number in range(5)
+        ]
+        Comment.objects.create(
+            post=cls.posts[0], author=cls.reader, text='Первый')
+        Comment.objects.create(
+            post=cls.posts[0], author=cls.reader, text='Второй')
+        Follow.objects.create(user=cls.reader, author=cls.author)
+
+    def setUp(self):
+        cache.clear()
+        self.client = Client()
+
+    def get_json(self, url, **params):
+        response = self.client.get(url, params)
+        self.assertEqual(response['Content-Type'], 'application/json')
+        return json.loads(b''.join(response.streaming_content))
+
+    def test_posts_pages_by_cursor(self):
+        """Лента листается курсором без повторов."""
+        url = reverse('posts:api_posts')
+        data = self.get_json(url, limit=2)
+        self.assertIsNone(data['previous_cursor'])
+        seen = [post['id'] for post in data['results']]
+        while data['next_cursor']:
+            data = self.get_json(url, limit=2, cursor=data['next_cursor'])
+            seen.extend(post['id'] for post in data['results'])
+        self.assertEqual(
+            seen, [post.pk for post in reversed(self.posts)])
+        self.assertEqual(data['results'][-1], {
+            'id': self.posts[0].pk,
+            'text': 'Пост 0',
+            'pub_date': data['results'][-1]['pub_date'],
+            'updated': data['results'][-1]['updated'],
+            'image': None,
+            'comments_count': 2,
+            'author': 'author',
+            'group': None,
+        })
+
+    def test_group_and_profile_posts(self):
+        """Посты группы и автора берутся из их лент."""
+        data = self.get_json(reverse('posts:api_group_posts', args=['group']))
+        self.assertEqual(
+            [post['id'] for post in data['results']],
+            [self.posts[3].pk, self.posts[1].pk])
+        data = self.get_json(
+            reverse('posts:api_profile_posts', args=['reader']))
+        self.assertEqual(data['results'], [])
+
+    def test_post_detail_streams_comments(self):
+        """Пост отдаётся с комментариями без лишних запросов."""
+        url = reverse('posts:api_post_detail', args=[self.posts[0].pk])
+        with CaptureQueriesContext(connection) as queries:
+            data = self.get_json(url)
+        self.assertEqual(data['text'], 'Пост 0')
+        self.assertEqual(
+            [comment['text'] for comment in data['comments']],
+            ['Второй', 'Первый'])
+        self.assertLessEqual(len(queries), 4)
+        response = self.client.get(
+            reverse('posts:api_post_detail', args=[0]))
+        self.assertEqual(response.status_code, 404)
+
+    def test_comments_pages(self):
+        """Комментарии поста листаются курсором в обоих порядках."""
+        post = self.posts[1]
+        Comment.objects.bulk_create(
+            Comment(post=post, author=self.reader, text=f'Комм {number}')
+            for number in range(COMMENTS_PER_PAGE + 3)
+        )
+        data = self.get_json(reverse('posts:api_post_detail', args=[post.pk]))
+        self.assertEqual(len(data['comments']), COMMENTS_PER_PAGE)
+        url = reverse('posts:api_post_comments', args=[post.pk])
+        rest = self.get_json(url, cursor=data['comments_next_cursor'])
+        self.assertEqual(len(rest['results']), 3)
+        self.assertIsNone(rest['next_cursor'])
+        ids = [comment['id'] for comment in data['comments'] + rest['results']]
+        oldest = self.get_json(url, comments_order='oldest', limit=100)
+        self.assertEqual(
+            [comment['id'] for comment in oldest['results']],
+            sorted(ids)[:COMMENTS_PER_PAGE])
+
+    def test_follow_feed_requires_login(self):
+        """Лента подписок доступна только авторизованным."""
+        url = reverse('posts:api_follow_posts')
+        self.assertEqual(self.client.get(url).status_code, 401)
+        self.client.force_login(self.reader)
+        data = self.get_json(url)
+        self.assertEqual(len(data['results']), len(self.posts))
@@ -0,0 +1,162 @@
+from datetime import timedelta
+import json
+from io import StringIO
+
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.core.management import call_command
+from django.test import Client, TestCase
+from django.urls import reverse
+from django.utils import timezone
+
+from posts import archive, counters
+from posts.models import (ArchivedComment, ArchivedPost, Comment, Follow,
+                          Post, TimelineEntry)
+from posts.utils import POSTS_PER_PAGE
+
+User = get_user_model()
+
+OLD_POSTS = 5
+NEW_POSTS = POSTS_PER_PAGE - 3
+
+
+class ArchiveTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.author = User.objects.create_user(username='author')
+        self.reader = User.objects.create_user(username='reader')
+        Follow.objects.create(user=self.reader, author=self.author)
+        now = timezone.now()
+        for number in range(OLD_POSTS + NEW_POSTS):
+            post = Post.objects.create(
+                text=f'Пост {number}', author=self.author)
+            Post.objects.filter(pk=post.pk).update(
+                pub_date=now - timedelta(
+                    days=OLD_POSTS + NEW_POSTS - number - 0.5))
+        self.old = list(Post.objects.order_by('pk')[:OLD_POSTS])
+        self.comment = Comment.objects.create(
+            post=self.old[0], author=self.reader, text='Старый комментарий')
+        self.client = Client()
+        self.reader_client = Client()
+        self.reader_client.force_login(self.reader)
+
+    def archive(self):
+        before = timezone.now() - timedelta(days=NEW_POSTS)
+        return archive.archive_posts(before, batch_size=2)
+
+    def test_old_posts_move_to_archive(self):
+        """Старые посты с комментариями переносятся с прежними id"""
+        self.assertEqual(self.archive(), OLD_POSTS)
+        self.assertEqual(Post.objects.count(), NEW_POSTS)
+        self.assertEqual(
+            set(ArchivedPost.objects.values_list('pk', flat=True)),
+            {post.pk for post in self.old})
+        archived = ArchivedComment.objects.get(pk=self.comment.pk)
+        self.assertEqual(archived.post_id, self.old[0].pk)
+        self.assertEqual(archived.post.comments_count, 1)
+        self.assertFalse(Comment.objects.exists())
+        self.assertEqual(
+            TimelineEntry.objects.filter(user=self.reader).count(),
+            NEW_POSTS)
+
+    def test_archived_posts_still_count(self):
+        """Архивные посты остаются в счётчике постов автора"""
+        self.archive()
+        total = OLD_POSTS + NEW_POSTS
+        author = User.objects.get(pk=self.author.pk)
+        self.assertEqual(counters.for_user(author).posts_count, total)
+        self.assertEqual(counters.reconcile_users(), 0)
+
+    def test_command_reports_moved_posts(self):
+        out = StringIO()
+        call_command('archive_posts', days=NEW_POSTS, stdout=out)
+        self.assertIn(f'постов: {OLD_POSTS}', out.getvalue())
+
+    def test_post_detail_falls_back_to_archive(self):
+        """Страница архивного поста открывается без формы комментария"""
+        url = reverse('posts:post_detail', args=[self.old[0].pk])
+        self.reader_client.get(url)
+        self.archive()
+        response = self.reader_client.get(url)
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.context['post'].is_archived)
+        self.assertContains(response, 'Старый комментарий')
+        self.assertNotContains(response, 'data-comment-form')
+        response = self.client.get(
+            reverse('posts:post_comments', args=[self.old[0].pk]))
+        self.assertContains(response, 'Старый комментарий')
+
+    def test_archived_post_cannot_be_commented(self):
+        self.archive()
+        response = self.reader_client.post(
+            reverse('posts:add_comment', args=[self.old[0].pk]),
+            {'text': 'Новый'})
+        self.assertEqual(response.status_code, 404)
+
+    def test_index_shows_only_hot_posts(self):
+        self.archive()
+        response = self.client.get(reverse('posts:index'))
+        self.assertEqual(
+            response.context['page_obj'].paginator.count, NEW_POSTS)
+
+    def test_profile_continues_into_archive(self):
+        """Профиль листает горячие посты автора, затем архивные"""
+        url = reverse('posts:profile', args=[self.author.username])
+        expected = [
+            post.pk for post in Post.objects.order_by('-pub_date', '-pk')]
+        self.archive()
+        shown = []
+        response = self.client.get(url)
+        self.assertEqual(
+            response.context['page_obj'].paginator.count, len(expected))
+        shown.extend(post.pk for post in response.context['page_obj'])
+        response = self.client.get(url, {'page': 2})
+        shown.extend(post.pk for post in response.context['page_obj'])
+        self.assertEqual(shown, expected)
+
+    def test_profile_cursor_crosses_into_archive(self):
+        url = reverse('posts:profile', args=[self.author.username])
+        expected = [
+            post.pk for post in Post.objects.order_by('-pub_date', '-pk')]
+        self.archive()
+        page = self.client.get(url, {'cursor': ''}).context['page_obj']
+        second = self.client.get(
+            url, {'cursor': page.next_cursor}).context['page_obj']
+        self.assertEqual(
+            [post.pk for post in page] + [post.pk for post in second],
+            expected)
+        previous = self.client.get(
+            url, {'cursor': second.previous_cursor}).context['page_obj']
+        self.assertEqual(
+            [post.pk for post in previous], expected[:POSTS_PER_PAGE])
+
+    def get_json(self, url, **params):
+        response = self.client.get(url, params)
+        self.assertEqual(response.status_code, 200)
+        return json.loads(b''.join(response.streaming_content))
+
+    def test_api_post_detail_reads_archive(self):
+        """API отдаёт архивный пост с комментариями, как и страница"""
+        post = self.old[0]
+        self.archive()
+        data = self.get_json(reverse('posts:api_post_detail', args=[post.pk]))
+        self.assertEqual(data['id'], post.pk)
+        self.assertEqual(
+            [comment['text'] for comment in data['comments']],
+            ['Старый комментарий'])
+        data = self.get_json(
+            reverse('posts:api_post_comments', args=[post.pk]))
+        self.assertEqual(len(data['results']), 1)
+
+    def test_api_profile_continues_into_archive(self):
+        """Профиль в API листает и горячие, и архивные посты"""
+        expected = list(Post.objects.order_by(
+            '-pub_date', '-pk').values_list('pk', flat=True))
+        self.archive()
+        url = reverse('posts:api_profile_posts', args=[self.author.username])
+        data = self.get_json(url, limit=4)
+        shown = [post['id'] for post in data['results']]
+        while data['next_cursor']:
+            data = self.get_json(url, limit=4, cursor=data['next_cursor'])
+            shown.extend(post['id'] for post in data['results'])
+        self.assertEqual(shown, expected)
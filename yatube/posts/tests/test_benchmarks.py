@@ -0,0 +1,55 @@
+import json
+import os
+import tempfile
+from io import StringIO
+
+from django.core.cache import cache
+from django.core.management import call_command
+from django.test import TestCase
+
+from posts.models import Comment, Follow, Post, TimelineEntry, UserCounters
+from posts.management.commands.benchmark_views import percentile
+
+
+class GenerateDataTests(TestCase):
+    def test_generate_data(self):
+        """Генератор создаёт связанные данные и производные таблицы."""
+        call_command(
+            'generate_data', users=30, groups=3, posts=200, comments=300,
+            follows=5, seed=1, stdout=StringIO())
+        self.assertEqual(Post.objects.count(), 200)
+        self.assertEqual(Comment.objects.count(), 300)
+        self.assertTrue(Follow.objects.exists())
+        self.assertTrue(TimelineEntry.objects.exists())
+        self.assertEqual(
+            sum(UserCounters.objects.values_list('posts_count', flat=True)),
+            200,
+        )
+        # Даты постов разнесены во времени, а не равны моменту вставки
+        dates = set(Post.objects.values_list('pub_date', flat=True))
+        self.assertGreater(len(dates), 100)
+
+    def test_benchmark_views(self):
+        """Замер сохраняет прогоны и сравнивает их с предыдущим."""
+        call_command(
+            'generate_data', users=10, groups=2, posts=30, comments=30,
+            seed=2, stdout=StringIO())
+        cache.clear()
+        with tempfile.TemporaryDirectory() as directory:
+            output = os.path.join(directory, 'runs.json')
+            for _ in range(2):
+                out = StringIO()
+                call_command(
+                    'benchmark_views', requests=3, output=output, stdout=out)
+            with open(output) as source:
+                runs = json.load(source)
+        self.assertEqual(len(runs), 2)
+        self.assertEqual(runs[0]['scale']['posts'], 30)
+        self.assertIn('p99_ms', runs[1]['views']['index'])
+        self.assertIn('Сравнение с прогоном', out.getvalue())
+
+    def test_percentile(self):
+        values = list(range(1, 101))
+        self.assertEqual(percentile(values, 50), 50)
+        self.assertEqual(percentile(values, 99), 99)
+        self.assertEqual(percentile([7], 90), 7)
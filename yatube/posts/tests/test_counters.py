@@ -0,0 +1,90 @@
+from io import StringIO
+
+from django.contrib.auth import get_user_model
+from django.core.management import call_command
+from django.db import connection
+from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from posts.models import Comment, Follow, Post, UserCounters
+
+User = get_user_model()
+
+
+class CountersTests(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.author = User.objects.create_user(username='author')
+        cls.reader = User.objects.create_user(username='reader')
+
+    def test_counters_follow_writes(self):
+        """Счётчики меняются при создании и удалении объектов"""
+        post = Post.objects.create(text='Пост', author=self.author)
+        follow = Follow.objects.create(user=self.reader, author=self.author)
+        comment = Comment.objects.create(
+            post=post, author=self.reader, text='Комментарий')
+        author = UserCounters.objects.get(user=self.author)
+        self.assertEqual(author.posts_count, 1)
+        self.assertEqual(author.followers_count, 1)
+        self.assertEqual(
+            UserCounters.objects.get(user=self.reader).following_count, 1)
+        post.refresh_from_db()
+        self.assertEqual(post.comments_count, 1)
+        comment.delete()
+        follow.delete()
+        post.delete()
+        author.refresh_from_db()
+        self.assertEqual(
+            (author.posts_count, author.followers_count), (0, 0))
+
+    def test_pages_run_no_aggregate_queries(self):
+        """Профиль и пост выводят счётчики без COUNT-запросов"""
+        post = Post.objects.create(text='Пост', author=self.author)
+        urls = {
+            # На профиле остаётся только COUNT(*) паджинатора
+            reverse('posts:profile', kwargs={'username': 'author'}): 1,
+            reverse('posts:post_detail', kwargs={'post_id': post.pk}): 0,
+        }
+        for url, expected in urls.items():
+            with self.subTest(url=url):
+                with CaptureQueriesContext(connection) as queries:
+                    response = self.client.get(url)
+                self.assertContains(response, 'Всего постов')
+                counts = [
+                    query for query in queries.captured_queries
+                    if 'COUNT(' in query['sql']
+                ]
+                self.assertEqual(len(counts), expected)
+
+    def test_pages_do_not_create_counters(self):
+        """Страницы без строки счётчиков выводят нули и ничего не пишут"""
+        post = Post.objects.create(text='Пост', author=self.author)
+        UserCounters.objects.filter(user=self.author).delete()
+        urls = [
+            reverse('posts:profile', kwargs={'username': 'author'}),
+            reverse('posts:post_detail', kwargs={'post_id': post.pk}),
+        ]
+        for url in urls:
+            with self.subTest(url=url):
+                with CaptureQueriesContext(connection) as queries:
+                    response = self.client.get(url)
+                self.assertContains(response, 'Всего постов')
+                writes = [
+                    query for query in queries.captured_queries
+                    if query['sql'].startswith(('INSERT', 'UPDATE'))
+                ]
+                self.assertEqual(writes, [])
+        self.assertFalse(
+            UserCounters.objects.filter(user=self.author).exists())
+
+    def test_reconcile_command_fixes_drift(self):
+        """reconcile_counters исправляет разошедшиеся счётчики"""
+        Post.objects.bulk_create(
+            Post(text=f'Пост {i}', author=self.author) for i in range(3))
+        UserCounters.objects.filter(user=self.reader).delete()
+        call_command('reconcile_counters', batch_size=1, stdout=StringIO())
+        self.assertEqual(
+            UserCounters.objects.get(user=self.author).posts_count, 3)
+        self.assertTrue(UserCounters.objects.filter(user=self.reader).exists())
@@ -0,0 +1,192 @@
+import json
+from io import StringIO
+from unittest import mock
+
+from django.contrib.auth import get_user_model
+from django.core.management import call_command
+from django.db import connection
+from django.test import Client, TestCase
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from posts import following, suggestions
+from posts.models import Follow, FollowSuggestion, Post, TimelineEntry
+
+User = get_user_model()
+
+
+def counts(username):
+    counters = User.objects.get(username=username).counters
+    return counters.followers_count, counters.following_count
+
+
+class FollowingTests(TestCase):
+    def setUp(self):
+        self.reader = User.objects.create_user(username='reader')
+        self.authors = [
+            User.objects.create_user(username=f'author{number}')
+            for number in range(3)
+        ]
+        for author in self.authors:
+            Post.objects.create(text='Пост', author=author)
+        self.names = [author.username for author in self.authors]
+
+    def test_follow_many_authors(self):
+        """Подписка на нескольких авторов обновляет счётчики и ленту"""
+        done = following.follow(
+            self.reader, self.names + ['reader', 'nobody'])
+        self.assertEqual(done, self.names)
+        self.assertEqual(
+            Follow.objects.filter(user=self.reader).count(), 3)
+        self.assertEqual(counts('reader'), (0, 3))
+        self.assertEqual(counts('author0'), (1, 0))
+        self.assertEqual(
+            TimelineEntry.objects.filter(user=self.reader).count(), 3)
+        self.assertEqual(following.follow(self.reader, self.names), [])
+        self.assertEqual(counts('reader'), (0, 3))
+
+    def test_follow_queries_do_not_grow_with_authors(self):
+        def queries(names):
+            with CaptureQueriesContext(connection) as captured:
+                following.follow(self.reader, names)
+            return len(captured)
+
+        single = queries(self.names[:1])
+        self.assertEqual(queries(self.names[1:]), single)
+
+    def test_follow_counts_only_inserted_rows(self):
+        """Подписку, которую успел записать параллельный запрос,
+        follow не считает второй раз"""
+        stale = dict(User.objects.filter(
+            username__in=self.names).values_list('pk', 'username'))
+        Follow.objects.create(user=self.reader, author=self.authors[0])
+        fresh = following._new_authors(self.reader, self.names)
+        with mock.patch.object(following, '_new_authors',
+                               side_effect=[stale, fresh]):
+            done = following.follow(self.reader, self.names)
+        self.assertEqual(done, self.names[1:])
+        self.assertEqual(counts('reader'), (0, 3))
+        self.assertEqual(counts('author0'), (1, 0))
+
+    def test_unfollow_many_authors(self):
+        following.follow(self.reader, self.names)
+        done = following.unfollow(self.reader, self.names[:2] + ['nobody'])
+        self.assertEqual(done, self.names[:2])
+        self.assertEqual(counts('reader'), (0, 1))
+        self.assertEqual(counts('author0'), (0, 0))
+        self.assertEqual(
+            list(TimelineEntry.objects.filter(
+                user=self.reader).values_list('post__author', flat=True)),
+            [self.authors[2].pk])
+
+    def test_profile_follow_unknown_author(self):
+        client = Client()
+        client.force_login(self.reader)
+        for name in ('posts:profile_follow', 'posts:profile_unfollow'):
+            with self.subTest(name=name):
+                response = client.get(reverse(name, args=['nobody']))
+                self.assertEqual(response.status_code, 404)
+
+
+class FollowsApiTests(TestCase):
+    def setUp(self):
+        self.reader = User.objects.create_user(username='reader')
+        for number in range(2):
+            User.objects.create_user(username=f'author{number}')
+        self.client = Client()
+        self.client.force_login(self.reader)
+        self.url = reverse('posts:api_follows')
+
+    def request(self, method, body):
+        return getattr(self.client, method)(
+            self.url, json.dumps(body), content_type='application/json')
+
+    def test_follow_and_unfollow(self):
+        response = self.request(
+            'post', {'authors': ['author0', 'author1', 'nobody']})
+        self.assertEqual(
+            response.json(), {'followed': ['author0', 'author1']})
+        response = self.request('delete', {'authors': ['author1']})
+        self.assertEqual(response.json(), {'unfollowed': ['author1']})
+        self.assertEqual(
+            list(Follow.objects.values_list('author__username', flat=True)),
+            ['author0'])
+
+    def test_bad_requests(self):
+        cases = (
+            ({'authors': 'author0'}, 400),
+            ({'authors': [1, 2]}, 400),
+            ([], 400),
+            ({'authors': ['x'] * (following.MAX_AUTHORS + 1)}, 400),
+        )
+        for body, status in cases:
+            with self.subTest(body=body):
+                self.assertEqual(
+                    self.request('post', body).status_code, status)
+        self.assertEqual(self.client.get(self.url).status_code, 405)
+        self.client.logout()
+        self.assertEqual(
+            self.request('post', {'authors': []}).status_code, 401)
+
+
+class SuggestionsTests(TestCase):
+    def setUp(self):
+        self.users = {
+            name: User.objects.create_user(username=name)
+            for name in ('reader', 'friend1', 'friend2', 'popular', 'other')
+        }
+        for user, author in (
+            ('reader', 'friend1'),
+            ('reader', 'friend2'),
+            ('reader', 'other'),
+            ('friend1', 'popular'),
+            ('friend2', 'popular'),
+            ('friend2', 'other'),
+            ('friend2', 'reader'),
+        ):
+            Follow.objects.create(
+                user=self.users[user], author=self.users[author])
+
+    def suggested(self, username='reader'):
+        return [
+            (suggestion.author.username, suggestion.score)
+            for suggestion in suggestions.for_user(self.users[username])
+        ]
+
+    def test_refresh_suggests_friends_of_friends(self):
+        """Рекомендуются авторы подписок, кроме себя и уже читаемых"""
+        out = StringIO()
+        call_command('refresh_suggestions', stdout=out)
+        self.assertIn(
+            f'рекомендаций: {FollowSuggestion.objects.count()}',
+            out.getvalue())
+        self.assertEqual(self.suggested(), [('popular', 2)])
+        self.assertEqual(self.suggested('friend1'), [])
+
+    def test_refresh_keeps_top_per_user(self):
+        suggestions.refresh(per_user=1)
+        self.assertEqual(
+            FollowSuggestion.objects.filter(
+                user=self.users['friend2']).count(), 1)
+
+    def test_follow_discards_suggestion(self):
+        suggestions.refresh()
+        following.follow(self.users['reader'], ['popular'])
+        self.assertEqual(self.suggested(), [])
+
+    def test_single_follow_discards_suggestion(self):
+        """Подписка, созданная в обход following.follow, тоже убирает
+        рекомендацию"""
+        suggestions.refresh()
+        Follow.objects.create(
+            user=self.users['reader'], author=self.users['popular'])
+        self.assertEqual(self.suggested(), [])
+
+    def test_follow_index_shows_suggestions(self):
+        suggestions.refresh()
+        client = Client()
+        client.force_login(self.users['reader'])
+        response = client.get(reverse('posts:follow_index'))
+        self.assertContains(response, 'Кого почитать')
+        self.assertContains(
+            response, reverse('posts:profile_follow', args=['popular']))
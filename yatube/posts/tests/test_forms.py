@@ -1,8 +1,17 @@
+import shutil
+import tempfile
+from io import BytesIO
+
 from posts.models import Post, Group
+from django.conf import settings
 from django.contrib.auth import get_user_model
-from django.test import Client, TestCase
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.test import Client, TestCase, override_settings
 from django.urls import reverse
 from http import HTTPStatus
+from PIL import Image
+
+TEMP_MEDIA_ROOT = tempfile.mkdtemp(dir=settings.BASE_DIR)
 
 User = get_user_model()
 
@@ -81,3 +90,64 @@ class PostCreateFormTests(TestCase):
         self.assertEqual(post.text, form_data['text'])
         self.assertEqual(post.author, self.user)
         self.assertEqual(post.group_id, form_data['group'])
+
+
+@override_settings(
+    MEDIA_ROOT=TEMP_MEDIA_ROOT,
+    POST_IMAGE_MAX_SIZE=100,
+    POST_IMAGE_FORMAT='JPEG',
+)
+class PostImageFormTests(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.user = User.objects.create_user(username='photographer')
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        shutil.rmtree(TEMP_MEDIA_ROOT, ignore_errors=True)
+
+    def setUp(self):
+        self.authorized_client = Client()
+        self.authorized_client.force_login(self.user)
+
+    @staticmethod
+    def make_image(name='photo.png', size=(400, 300)):
+        buffer = BytesIO()
+        Image.new('RGBA', size, (255, 0, 0, 128)).save(buffer, 'PNG')
+        return SimpleUploadedFile(
+            name, buffer.getvalue(), content_type='image/png')
+
+    def create_post(self, text, image):
+        self.authorized_client.post(
+            reverse('posts:post_create'),
+            data={'text': text, 'image': image},
+        )
+        return Post.objects.get(text=text)
+
+    def test_image_is_normalized(self):
+        """Картинка уменьшается и перекодируется в JPEG."""
+        post = self.create_post('С картинкой', self.make_image())
+        self.assertTrue(post.image.name.startswith('posts/'))
+        self.assertTrue(post.image.name.endswith('.jpg'))
+        with Image.open(post.image.path) as image:
+            self.assertEqual(image.format, 'JPEG')
+            self.assertEqual(image.size, (100, 75))
+            self.assertNotIn('exif', image.info)
+
+    def test_same_image_stored_once(self):
+        """Одинаковые картинки ссылаются на один файл."""
+        first = self.create_post('Первый', self.make_image('a.png'))
+        second = self.create_post('Второй', self.make_image('b.png'))
+        self.assertEqual(first.image.name, second.image.name)
+
+    @override_settings(POST_IMAGE_MAX_UPLOAD_SIZE=10)
+    def test_too_large_image_rejected(self):
+        """Слишком большой файл не проходит валидацию."""
+        response = self.authorized_client.post(
+            reverse('posts:post_create'),
+            data={'text': 'Большой', 'image': self.make_image()},
+        )
+        self.assertTrue(response.context['form'].errors.get('image'))
+        self.assertFalse(Post.objects.filter(text='Большой').exists())
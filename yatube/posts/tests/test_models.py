@@ -1,6 +1,10 @@
+from io import StringIO
+
 from django.contrib.auth import get_user_model
+from django.core.management import call_command
 from django.test import TestCase
 
+from ..management.commands.explain_feeds import feed_queries, plan_problems
 from ..models import Group, Post
 
 User = get_user_model()
@@ -46,3 +50,29 @@ class PostModelTest(TestCase):
                 with self.subTest(field=field):
                     self.assertEqual(
                         post._meta.get_field(field).verbose_name, expected)
+
+
+class FeedIndexesTest(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.user = User.objects.create_user(username='auth')
+        cls.group = Group.objects.create(
+            title='Тестовая группа', slug='test-slug', description='')
+        Post.objects.create(text='Пост', author=cls.user, group=cls.group)
+
+    def test_feed_queries_use_indexes(self):
+        """Ленты и комментарии читаются по индексам без сортировки."""
+        for name, queryset in feed_queries().items():
+            with self.subTest(query=name):
+                self.assertEqual(plan_problems(queryset.explain()), [])
+
+    def test_follow_feed_reads_timeline_index(self):
+        """Лента подписок читается по индексу материализованной ленты."""
+        plan = feed_queries()['follow'].explain()
+        self.assertIn('timeline_user_date_idx', plan)
+
+    def test_explain_feeds_command(self):
+        out = StringIO()
+        call_command('explain_feeds', repeat=1, stdout=out)
+        self.assertIn('== index', out.getvalue())
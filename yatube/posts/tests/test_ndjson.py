@@ -0,0 +1,109 @@
+import gzip
+import json
+import os
+import tempfile
+from io import StringIO
+
+from django.core.management import CommandError, call_command
+from django.test import TestCase
+
+from posts import archive, search
+from posts.models import (ArchivedComment, ArchivedPost, Comment, Follow,
+                          Group, Post, User, UserCounters)
+
+
+class NdjsonTests(TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.addCleanup(self.directory.cleanup)
+        call_command(
+            'generate_data', users=15, groups=2, posts=60, comments=80,
+            follows=3, seed=3, stdout=StringIO())
+
+    def clear(self):
+        for model in (Follow, ArchivedComment, ArchivedPost, Comment, Post,
+                      Group, User):
+            model.objects.all().delete()
+
+    def write(self, name, records):
+        path = os.path.join(self.directory.name, name)
+        with open(path, 'w', encoding='utf-8') as output:
+            for record in records:
+                output.write(json.dumps(record) + '\n')
+        return path
+
+    def snapshot(self):
+        return {
+            'posts': set(Post.objects.values_list(
+                'pk', 'text', 'pub_date', 'author__username', 'group__slug')),
+            'comments': set(Comment.objects.values_list(
+                'pk', 'post', 'author__username', 'created')),
+            'follows': set(Follow.objects.values_list(
+                'user__username', 'author__username')),
+            'groups': set(Group.objects.values_list('slug', 'title')),
+            'archived_posts': set(ArchivedPost.objects.values_list(
+                'pk', 'text', 'pub_date', 'comments_count',
+                'author__username', 'group__slug')),
+            'archived_comments': set(ArchivedComment.objects.values_list(
+                'pk', 'post', 'author__username', 'created')),
+        }
+
+    def test_round_trip(self):
+        """Выгрузка и загрузка в пустую базу сохраняют данные,
+        в том числе архивные."""
+        path = os.path.join(self.directory.name, 'dump.ndjson.gz')
+        dates = sorted(Post.objects.values_list('pub_date', flat=True))
+        archive.archive_posts(dates[len(dates) // 3])
+        before = self.snapshot()
+        self.assertTrue(before['archived_posts'])
+        self.assertTrue(before['archived_comments'])
+        out = StringIO()
+        call_command('export_data', path, chunk_size=7, stdout=out)
+        self.assertIn('строк/с', out.getvalue())
+        with gzip.open(path, 'rt', encoding='utf-8') as source:
+            first = json.loads(source.readline())
+        self.assertEqual(first['model'], 'group')
+
+        self.clear()
+        out = StringIO()
+        call_command('import_data', path, batch_size=10, stdout=out)
+        self.assertIn('строк/с', out.getvalue())
+        self.assertEqual(self.snapshot(), before)
+        self.assertEqual(
+            sum(UserCounters.objects.values_list('posts_count', flat=True)),
+            60,
+        )
+        post = Post.objects.create(
+            text='Уникальное слово дирижабль',
+            author=User.objects.first())
+        self.assertGreater(post.pk, max(pk for pk, *_ in before['posts']))
+        self.assertEqual(
+            list(search.SearchPaginator('дирижабль', 10).get_page()), [post])
+
+    def test_duplicates_and_comments_without_post_are_skipped(self):
+        """Пропущенные строки не попадают в счётчики и выводятся."""
+        self.clear()
+        post = {
+            'model': 'post', 'id': 1, 'text': 'Пост', 'author': 'ghost',
+            'group': None, 'image': '',
+            'pub_date': '2020-01-01T00:00:00+00:00',
+            'updated': '2020-01-01T00:00:00+00:00',
+        }
+        path = self.write('dump.ndjson', [post, post, {
+            'model': 'comment', 'id': 10 ** 6, 'post': 10 ** 6,
+            'author': 'ghost', 'text': 'Потерянный',
+            'created': '2020-01-01T00:00:00+00:00',
+        }])
+        out = StringIO()
+        call_command('import_data', path, skip_derived=True, stdout=out)
+        self.assertIn('post 1, comment 0', out.getvalue())
+        self.assertIn('post 1, comment 1', out.getvalue())
+        self.assertEqual(Post.objects.count(), 1)
+        self.assertFalse(Comment.objects.exists())
+
+    def test_import_into_filled_tables_is_refused(self):
+        """Совпавшие id не должны молча пропадать или цеплять чужие
+        комментарии, поэтому загрузка в непустую базу запрещена."""
+        path = self.write('dump.ndjson', [])
+        with self.assertRaisesMessage(CommandError, 'пустые таблицы'):
+            call_command('import_data', path, stdout=StringIO())
@@ -0,0 +1,123 @@
+from io import StringIO
+from unittest import mock
+
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.core.management import call_command
+from django.db import connection
+from django.test import Client, TestCase
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from posts import search
+from posts.models import Comment, Post
+
+User = get_user_model()
+
+
+class SearchTests(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.author = User.objects.create_user(username='author')
+        cls.cats = Post.objects.create(
+            text='Наши котики спят на диване', author=cls.author)
+        cls.dogs = Post.objects.create(
+            text='Собаки гуляют в парке', author=cls.author)
+        Comment.objects.create(
+            post=cls.dogs, author=cls.author, text='А где же котик?')
+
+    def setUp(self):
+        cache.clear()
+        self.client = Client()
+
+    def found(self, query, per_page=10):
+        return list(search.SearchPaginator(query, per_page).get_page())
+
+    def test_stem(self):
+        """Формы слова сводятся к одной основе."""
+        self.assertEqual(search.stem('Котиков'), search.stem('котик'))
+        self.assertEqual(search.stem('гуляют'), search.stem('гулять'))
+        self.assertEqual(search.stem('Django'), 'django')
+
+    def test_search_ranks_post_text_above_comments(self):
+        """Совпадение в тексте поста выше совпадения в комментарии."""
+        self.assertEqual(self.found('котика'), [self.cats, self.dogs])
+        self.assertEqual(self.found('парк'), [self.dogs])
+        self.assertEqual(self.found('"OR* NEAR('), [])
+
+    def test_index_follows_changes(self):
+        """Сигналы обновляют индекс при правке и удалении."""
+        self.cats.text = 'Теперь про попугаев'
+        self.cats.save()
+        self.assertEqual(self.found('попугай'), [self.cats])
+        self.assertEqual(self.found('диван'), [])
+        self.dogs.comment.all().delete()
+        self.assertEqual(self.found('котик'), [])
+
+    def test_keyset_pages(self):
+        """Страницы результатов листаются по курсору без повторов."""
+        posts = [
+            Post.objects.create(text=f'Котик номер {i}', author=self.author)
+            for i in range(5)
+        ]
+        paginator = search.SearchPaginator('котик', per_page=2)
+        page = paginator.get_page()
+        seen = list(page)
+        while page.has_next():
+            page = paginator.get_page(page.next_cursor)
+            seen.extend(page)
+        self.assertEqual(len(seen), len(posts) + 2)
+        self.assertEqual(len(set(seen)), len(seen))
+        previous = paginator.get_page(page.previous_cursor)
+        self.assertEqual(list(previous), seen[-3:-1])
+
+    def test_ranking_is_computed_once(self):
+        """Следующие страницы режутся из сохранённого ранжирования,
+        которое не сбрасывается каждой новой записью"""
+        for i in range(3):
+            Post.objects.create(text=f'Котик номер {i}', author=self.author)
+        paginator = search.SearchPaginator('котик', per_page=2)
+        page = paginator.get_page()
+        with CaptureQueriesContext(connection) as queries:
+            second = paginator.get_page(page.next_cursor)
+        self.assertEqual(len(queries), 1)
+        self.assertNotIn('MATCH', queries[0]['sql'])
+        self.assertEqual(len(second), 2)
+        post = Post.objects.create(text='Ещё котик', author=self.author)
+        Comment.objects.create(post=post, author=self.author, text='котик')
+        self.assertNotIn(post, self.found('котик'))
+        cache.clear()
+        self.assertIn(post, self.found('котик'))
+
+    def test_rebuild_reads_in_batches(self):
+        """Пересборка индекса читает таблицы пачками"""
+        for i in range(5):
+            Post.objects.create(text=f'Попугай {i}', author=self.author)
+        with mock.patch.object(search, 'REBUILD_BATCH', 2):
+            search.rebuild()
+        self.assertEqual(len(self.found('попугай')), 5)
+        self.assertEqual(self.found('котик'), [self.cats, self.dogs])
+
+    def test_like_fallback_escapes_wildcards(self):
+        """Без полнотекстового индекса % и _ ищутся буквально."""
+        percent = Post.objects.create(text='Скидка 100%', author=self.author)
+        Post.objects.create(text='Цена 100 рублей', author=self.author)
+        with mock.patch.object(connection, 'vendor', 'other'):
+            self.assertEqual(self.found('100%'), [percent])
+            self.assertEqual(self.found('_'), [])
+
+    def test_search_view(self):
+        """Страница поиска выводит найденные посты."""
+        response = self.client.get(reverse('posts:search'), {'q': 'собака'})
+        self.assertContains(response, 'Собаки гуляют в парке')
+        self.assertNotContains(response, 'Наши котики')
+        response = self.client.get(reverse('posts:search'))
+        self.assertIsNone(response.context['page_obj'])
+
+    def test_rebuild_command(self):
+        """Команда заново строит индекс из таблиц."""
+        out = StringIO()
+        call_command('rebuild_search_index', stdout=out)
+        self.assertIn('пересобран', out.getvalue())
+        self.assertEqual(self.found('диван'), [self.cats])
@@ -0,0 +1,117 @@
+import os
+import shutil
+import tempfile
+from io import StringIO
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.test import Client, TestCase, override_settings
+from django.urls import reverse
+
+from posts import thumbnails
+from posts.models import Post, User
+from posts.templatetags.post_images import responsive_image
+
+TEMP_MEDIA_ROOT = tempfile.mkdtemp(dir=settings.BASE_DIR)
+
+SMALL_GIF = (
+    b'\x47\x49\x46\x38\x39\x61\x02\x00'
+    b'\x01\x00\x80\x00\x00\x00\x00\x00'
+    b'\xFF\xFF\xFF\x21\xF9\x04\x00\x00'
+    b'\x00\x00\x00\x2C\x00\x00\x00\x00'
+    b'\x02\x00\x01\x00\x00\x02\x02\x0C'
+    b'\x0A\x00\x3B'
+)
+
+
+@override_settings(MEDIA_ROOT=TEMP_MEDIA_ROOT)
+class ThumbnailsTest(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.user = User.objects.create_user(username='author')
+        cls.post = Post.objects.create(
+            text='Пост с картинкой',
+            author=cls.user,
+            image=SimpleUploadedFile(
+                name='thumb.gif', content=SMALL_GIF,
+                content_type='image/gif'),
+        )
+        cls.name = cls.post.image.name
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        shutil.rmtree(TEMP_MEDIA_ROOT, ignore_errors=True)
+
+    def setUp(self):
+        cache.clear()
+        self.client = Client()
+
+    def test_pending_thumbnail_falls_back_to_source(self):
+        """Неготовое превью заменяется оригиналом без нарезки."""
+        geometry, options = thumbnails.all_variants()[0]
+        backend = thumbnails.PregeneratedThumbnailBackend()
+        thumbnails.start_render()
+        image = backend.get_thumbnail(self.name, geometry, **options)
+        self.assertEqual(image.name, self.name)
+        self.assertTrue(thumbnails.render_incomplete())
+        self.assertFalse(thumbnails.is_ready(self.name))
+
+    def test_generate_makes_thumbnails_ready(self):
+        """После нарезки шаблоны получают готовое превью."""
+        geometry, options = thumbnails.all_variants()[0]
+        self.assertEqual(
+            thumbnails.generate(self.name), len(thumbnails.all_variants()))
+        self.assertTrue(thumbnails.is_ready(self.name))
+        thumbnails.start_render()
+        image = thumbnails.PregeneratedThumbnailBackend().get_thumbnail(
+            self.name, geometry, **options)
+        self.assertNotEqual(image.name, self.name)
+        self.assertTrue(image.exists())
+        self.assertFalse(thumbnails.render_incomplete())
+
+    def test_queue_is_cut_after_response(self):
+        """Очередь запроса нарезается только после ответа."""
+        thumbnails.start_request()
+        thumbnails._enqueue(self.name, None)
+        self.assertFalse(thumbnails.is_ready(self.name))
+        thumbnails.finish_request()
+        self.assertTrue(thumbnails.is_ready(self.name))
+
+    def test_page_with_pending_thumbnail_not_cached(self):
+        """Страница с оригиналом вместо превью не попадает в кеш."""
+        self.client.get(reverse('posts:index'))
+        Post.objects.filter(pk=self.post.pk).update(text='Новый текст')
+        response = self.client.get(reverse('posts:index'))
+        self.assertContains(response, 'Новый текст')
+        thumbnails.generate(self.name)
+        self.client.get(reverse('posts:index'))
+        Post.objects.filter(pk=self.post.pk).update(text='Ещё новее')
+        response = self.client.get(reverse('posts:index'))
+        self.assertNotContains(response, 'Ещё новее')
+
+    def test_responsive_image_srcset(self):
+        """Тег выводит srcset из всех ширин набора, когда они готовы."""
+        html = responsive_image(self.post.image, 'feed')
+        self.assertIn(f'src="{self.post.image.url}"', html)
+        self.assertNotIn('srcset', html)
+        thumbnails.generate(self.name)
+        html = responsive_image(self.post.image, 'feed', 'card-img')
+        for width in settings.POST_IMAGE_VARIANTS['feed']['widths']:
+            self.assertIn(f' {width}w', html)
+        self.assertIn('loading="lazy"', html)
+        self.assertIn('width="960" height="339"', html)
+        self.assertNotIn(self.post.image.url, html)
+
+    def test_generate_thumbnails_command(self):
+        """Команда нарезает превью всех картинок постов."""
+        out = StringIO()
+        call_command('generate_thumbnails', workers=1, stdout=out)
+        self.assertIn('Картинок: 1', out.getvalue())
+        self.assertIn('ошибок: 0', out.getvalue())
+        self.assertTrue(os.path.isdir(os.path.join(TEMP_MEDIA_ROOT, 'cache')))
+        # Кеш в тестах - locmem: записи kvstore сделал родительский процесс
+        self.assertTrue(thumbnails.is_ready(self.name))
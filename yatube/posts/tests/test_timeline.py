@@ -0,0 +1,138 @@
+from io import StringIO
+
+from django.contrib.auth import get_user_model
+from django.core.management import call_command
+from django.core.paginator import Paginator
+from django.db import connection
+from django.test import Client, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from posts import timeline
+from posts.models import Follow, Post, TimelineEntry, UserCounters
+from posts.utils import CursorPaginator
+
+User = get_user_model()
+
+
+class TimelineTests(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.author = User.objects.create_user(username='author')
+        cls.reader = User.objects.create_user(username='reader')
+
+    def test_post_fans_out_to_followers(self):
+        """Новый пост попадает в ленту подписчика"""
+        Follow.objects.create(user=self.reader, author=self.author)
+        post = Post.objects.create(text='Пост', author=self.author)
+        self.assertTrue(TimelineEntry.objects.filter(
+            user=self.reader, post=post).exists())
+        self.assertIn(post, timeline.feed_for(self.reader))
+
+    def test_follow_and_unfollow_update_timeline(self):
+        """Подписка дописывает старые посты, отписка их убирает"""
+        post = Post.objects.create(text='Пост', author=self.author)
+        follow = Follow.objects.create(user=self.reader, author=self.author)
+        self.assertIn(post, timeline.feed_for(self.reader))
+        follow.delete()
+        self.assertFalse(TimelineEntry.objects.exists())
+        self.assertNotIn(post, timeline.feed_for(self.reader))
+
+    @override_settings(TIMELINE_FANOUT_LIMIT=0)
+    def test_celebrity_posts_are_read_on_demand(self):
+        """Посты популярного автора подмешиваются при чтении"""
+        Follow.objects.create(user=self.reader, author=self.author)
+        post = Post.objects.create(text='Пост', author=self.author)
+        self.assertFalse(TimelineEntry.objects.exists())
+        self.assertIn(post, timeline.feed_for(self.reader))
+
+    @override_settings(TIMELINE_FANOUT_LIMIT=1)
+    def test_crossing_fanout_limit_keeps_posts_in_feed(self):
+        """Посты не пропадают из ленты, когда автор становится
+        популярным и перестаёт им быть"""
+        other = User.objects.create_user(username='other')
+        Follow.objects.create(user=self.reader, author=self.author)
+        old = Post.objects.create(text='Старый', author=self.author)
+        follow = Follow.objects.create(user=other, author=self.author)
+        self.assertFalse(TimelineEntry.objects.exists())
+        new = Post.objects.create(text='Новый', author=self.author)
+        self.assertEqual(list(timeline.feed_for(self.reader)), [new, old])
+        follow.delete()
+        self.assertEqual(
+            TimelineEntry.objects.filter(user=self.reader).count(), 2)
+        self.assertEqual(list(timeline.feed_for(self.reader)), [new, old])
+
+    @override_settings(TIMELINE_FANOUT_LIMIT=1)
+    def test_follow_page_with_celebrities_uses_cursor(self):
+        """Лента с популярными авторами листается только курсором"""
+        other = User.objects.create_user(username='other')
+        for user in (self.reader, other):
+            Follow.objects.create(user=user, author=self.author)
+        client = Client()
+        client.force_login(self.reader)
+        page = client.get(reverse('posts:follow_index')).context['page_obj']
+        self.assertTrue(page.is_cursor)
+
+    @override_settings(TIMELINE_FANOUT_LIMIT=1)
+    def test_feed_merges_timeline_and_celebrities(self):
+        """Лента сливает материализованную часть и популярных авторов
+        по дате и листается без повторов"""
+        celebrity = User.objects.create_user(username='celebrity')
+        other = User.objects.create_user(username='other')
+        Follow.objects.create(user=self.reader, author=self.author)
+        Follow.objects.create(user=self.reader, author=celebrity)
+        Follow.objects.create(user=other, author=celebrity)
+        posts = [
+            Post.objects.create(
+                text=f'Пост {i}', author=(self.author, celebrity)[i % 2])
+            for i in range(7)
+        ][::-1]
+        feed = timeline.feed_for(self.reader)
+        self.assertEqual(feed.count(), 7)
+        self.assertEqual(list(feed), posts)
+        self.assertEqual(feed[2:5], posts[2:5])
+        paginator = CursorPaginator(feed, 3, **timeline.CURSOR_FIELDS)
+        page = paginator.get_page()
+        seen = list(page)
+        while page.has_next():
+            page = paginator.get_page(page.next_cursor)
+            seen.extend(page)
+        self.assertEqual(seen, posts)
+        self.assertEqual(
+            list(Paginator(feed, 3).page(2)), posts[3:6])
+
+    @override_settings(TIMELINE_FANOUT_LIMIT=0)
+    def test_author_without_counters_is_fanned_out(self):
+        """Автор без строки счётчиков не считается популярным ни при
+        записи, ни при чтении ленты"""
+        Follow.objects.create(user=self.reader, author=self.author)
+        UserCounters.objects.filter(user=self.author).delete()
+        post = Post.objects.create(text='Пост', author=self.author)
+        self.assertFalse(timeline.is_celebrity(self.author.pk))
+        self.assertEqual(list(timeline.feed_for(self.reader)), [post])
+
+    def test_single_source_feed_slices_in_sql(self):
+        """Без популярных авторов страница со смещением - один запрос
+        с OFFSET, а не чтение всех строк до неё"""
+        Follow.objects.create(user=self.reader, author=self.author)
+        posts = [
+            Post.objects.create(text=f'Пост {i}', author=self.author)
+            for i in range(5)
+        ][::-1]
+        feed = timeline.feed_for(self.reader)
+        self.assertFalse(feed.cursor_only)
+        with CaptureQueriesContext(connection) as queries:
+            self.assertEqual(feed[3:5], posts[3:5])
+        self.assertEqual(len(queries), 1)
+        self.assertIn('OFFSET 3', queries[0]['sql'])
+
+    def test_rebuild_command_restores_timelines(self):
+        """Команда rebuild_timelines восстанавливает ленты"""
+        Follow.objects.create(user=self.reader, author=self.author)
+        Post.objects.bulk_create(
+            Post(text=f'Пост {i}', author=self.author) for i in range(3))
+        self.assertEqual(TimelineEntry.objects.count(), 0)
+        call_command('rebuild_timelines', stdout=StringIO())
+        self.assertEqual(
+            TimelineEntry.objects.filter(user=self.reader).count(), 3)
@@ -1,11 +1,20 @@
+from unittest import mock
+
 from django.contrib.auth import get_user_model
-from django.test import Client, TestCase
+from django.test import Client, TestCase, TransactionTestCase
 from django.urls import reverse
 from django import forms
 from django.core.cache import cache
+from django.core.paginator import Paginator
 from django.core.files.uploadedfile import SimpleUploadedFile
+from django.db import connection, transaction
+from django.template.loader import render_to_string
+from django.test.utils import CaptureQueriesContext
 
+from posts import cache as feed_cache
 from posts.models import Follow, Comment, Group, Post, User
+from posts.templatetags.post_fragments import cached_posts
+from posts.utils import COMMENTS_PER_PAGE, ELLIPSIS, page_window
 
 User = get_user_model()
 
@@ -179,6 +188,57 @@ class PaginatorViewsTest(TestCase):
             'posts:profile', kwargs={'username': 'UserHasNoName'}))
         self.assertEqual(len(response.context['page_obj']), 10)
 
+    def test_cursor_pages_walk_forward_and_back(self):
+        """Курсорная пагинация листает ленту вперёд и назад"""
+        url = reverse('posts:group_posts', kwargs={'slug': 'test_slug'})
+        first = self.client.get(url + '?cursor=').context['page_obj']
+        self.assertEqual(len(first), 10)
+        self.assertFalse(first.has_previous())
+        self.assertTrue(first.has_next())
+        second = self.client.get(
+            url + f'?cursor={first.next_cursor}').context['page_obj']
+        self.assertEqual(len(second), 3)
+        self.assertFalse(second.has_next())
+        self.assertFalse(set(first) & set(second))
+        back = self.client.get(
+            url + f'?cursor={second.previous_cursor}').context['page_obj']
+        self.assertEqual(list(back), list(first))
+
+    def test_broken_cursor_returns_first_page(self):
+        """Битый курсор открывает первую страницу"""
+        response = self.client.get(reverse(
+            'posts:profile', kwargs={'username': 'UserHasNoName'}
+        ) + '?cursor=broken')
+        self.assertEqual(len(response.context['page_obj']), 10)
+
+    def test_page_window(self):
+        """Навигация показывает края и окно вокруг текущей страницы"""
+        paginator = Paginator(range(1000), 10)
+        self.assertEqual(
+            page_window(paginator.page(50)),
+            [1, ELLIPSIS, 48, 49, 50, 51, 52, ELLIPSIS, 100])
+        self.assertEqual(
+            page_window(paginator.page(1)), [1, 2, 3, ELLIPSIS, 100])
+        self.assertEqual(
+            page_window(paginator.page(4)), [1, 2, 3, 4, 5, 6, ELLIPSIS, 100])
+        self.assertEqual(
+            page_window(Paginator(range(30), 10).page(2)), [1, 2, 3])
+
+    def test_paginator_render_is_constant_in_page_count(self):
+        """Навигация не перебирает все страницы и не растёт с их числом"""
+        def render(pages):
+            page = Paginator(range(pages * 10), 10).page(pages // 2)
+            with mock.patch.object(
+                Paginator, 'page_range', new_callable=mock.PropertyMock,
+            ) as page_range:
+                html = render_to_string(
+                    'includes/paginator.html', {'page_obj': page})
+            self.assertEqual(page_range.call_count, 0)
+            return html
+
+        small, huge = render(10), render(10 ** 6)
+        self.assertEqual(small.count('<li'), huge.count('<li'))
+
 
 class CommentTests(TestCase):
     @classmethod
@@ -212,6 +272,63 @@ class CommentTests(TestCase):
         self.client.post(CommentTests.comment_url)
         self.assertEqual(count_comments, Comment.objects.count())
 
+    def test_ajax_comment_returns_fragment(self):
+        """Комментарий из JavaScript возвращает только свой фрагмент"""
+        url = reverse('posts:add_comment', args=[self.post.pk])
+        response = self.authorized_client.post(
+            url, {'text': 'Из фоновой формы'},
+            HTTP_X_REQUESTED_WITH='XMLHttpRequest')
+        self.assertEqual(response.status_code, 201)
+        self.assertContains(response, 'Из фоновой формы', status_code=201)
+        self.assertNotContains(response, '<html', status_code=201)
+        response = self.authorized_client.post(
+            url, {'text': 'В JSON'}, HTTP_X_REQUESTED_WITH='XMLHttpRequest',
+            HTTP_ACCEPT='application/json')
+        self.assertEqual(response.json()['text'], 'В JSON')
+        self.assertIn('В JSON', response.json()['html'])
+        response = self.authorized_client.post(
+            url, {'text': ''}, HTTP_X_REQUESTED_WITH='XMLHttpRequest')
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('text', response.json()['errors'])
+
+    def test_comments_load_by_pages(self):
+        """Комментарии поста выводятся страницами с подгрузкой"""
+        Comment.objects.bulk_create(
+            Comment(post=self.post, author=self.user, text=f'Комм {i}')
+            for i in range(COMMENTS_PER_PAGE + 5)
+        )
+        response = self.client.get(
+            reverse('posts:post_detail', args=[self.post.pk]))
+        comments = response.context['comments']
+        self.assertEqual(len(comments), COMMENTS_PER_PAGE)
+        more = self.client.get(
+            reverse('posts:post_comments', args=[self.post.pk]),
+            {'cursor': comments.next_cursor})
+        self.assertEqual(len(more.context['comments']), 5)
+        self.assertNotContains(more, '<html')
+        self.assertFalse(set(comments) & set(more.context['comments']))
+
+    def test_comments_oldest_first(self):
+        """Комментарии можно листать от старых к новым"""
+        first = Comment.objects.create(
+            post=self.post, author=self.user, text='Первый')
+        for i in range(COMMENTS_PER_PAGE):
+            Comment.objects.create(
+                post=self.post, author=self.user, text=f'Комм {i}')
+        url = reverse('posts:post_detail', args=[self.post.pk])
+        response = self.client.get(url, {'comments_order': 'oldest'})
+        comments = response.context['comments']
+        self.assertEqual(comments[0], first)
+        self.assertContains(response, 'Комментарии: 21')
+        more = self.client.get(
+            reverse('posts:post_comments', args=[self.post.pk]),
+            {'comments_order': 'oldest', 'cursor': comments.next_cursor})
+        self.assertEqual(
+            [comment.text for comment in more.context['comments']],
+            [f'Комм {COMMENTS_PER_PAGE - 1}'])
+        newest = self.client.get(url).context['comments']
+        self.assertEqual(newest[0].text, f'Комм {COMMENTS_PER_PAGE - 1}')
+
 
 class TestCache(TestCase):
     @classmethod
@@ -235,11 +352,11 @@ class TestCache(TestCase):
         cache.clear()
 
     def test_cache_index(self):
-        """Проверка хранения и очищения кэша для index."""
+        """Главная страница отдаётся из кеша, пока данные не менялись."""
         response = self.authorized_client.get(reverse('posts:index'))
         posts = response.content
-        Post.objects.create(text='Текст поста',
-                            author=self.user,)
+        # Изменение в обход сигналов не сбрасывает кеш
+        Post.objects.filter(pk=self.post.pk).update(text='Новый текст')
         response_old = self.authorized_client.get(reverse('posts:index'))
         old_posts = response_old.content
         self.assertEqual(old_posts, posts)
@@ -248,6 +365,159 @@ class TestCache(TestCase):
         new_posts = response_new.content
         self.assertNotEqual(old_posts, new_posts)
 
+    def test_new_post_invalidates_cached_pages(self):
+        """Новый пост сразу виден на закешированных страницах."""
+        urls = (
+            reverse('posts:index'),
+            reverse('posts:group_posts', kwargs={'slug': 'slug'}),
+            reverse('posts:profile', kwargs={'username': 'auth'}),
+        )
+        for url in urls:
+            self.authorized_client.get(url)
+        Post.objects.create(
+            text='Свежий пост', group=self.group, author=self.user)
+        for url in urls:
+            with self.subTest(url=url):
+                response = self.authorized_client.get(url)
+                self.assertContains(response, 'Свежий пост')
+
+    def test_stale_page_served_while_other_worker_rebuilds(self):
+        """Пока страницу пересобирает другой воркер, отдаётся старая."""
+        url = reverse('posts:index')
+        stale = self.authorized_client.get(url).content
+        Post.objects.create(text='Свежий пост', author=self.user)
+        key = feed_cache.page_key(
+            self.authorized_client.get(url).wsgi_request)
+        cache.add(feed_cache.LOCK_KEY.format(key), 1)
+        Post.objects.create(text='Ещё пост', author=self.user)
+        response = self.authorized_client.get(url)
+        self.assertNotContains(response, 'Ещё пост')
+        self.assertNotEqual(response.content, stale)
+
+    def test_post_fragment_cached_until_post_edit(self):
+        """Фрагмент поста берётся из кеша, пока пост не отредактирован."""
+        cached_posts([Post.objects.for_feed().get(pk=self.post.pk)])
+        Post.objects.filter(pk=self.post.pk).update(text='Тихая правка')
+        post = Post.objects.for_feed().get(pk=self.post.pk)
+        self.assertNotIn('Тихая правка', cached_posts([post])[0])
+        post.text = 'Правка через форму'
+        post.save()
+        post = Post.objects.for_feed().get(pk=self.post.pk)
+        self.assertIn('Правка через форму', cached_posts([post])[0])
+
+    def test_conditional_get_returns_not_modified(self):
+        """Неизменившиеся страницы отдают 304 по ETag без рендера."""
+        urls = {
+            reverse('posts:group_posts', kwargs={'slug': 'slug'}): 0,
+            reverse('posts:profile', kwargs={'username': 'auth'}): 0,
+            # Области страницы поста зависят от его автора
+            reverse('posts:post_detail', kwargs={'post_id': self.post.pk}): 1,
+        }
+        for url, expected in urls.items():
+            with self.subTest(url=url):
+                response = self.client.get(url)
+                etag = response['ETag']
+                self.assertFalse(response.has_header('Last-Modified'))
+                with CaptureQueriesContext(connection) as queries:
+                    response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+                self.assertEqual(response.status_code, 304)
+                self.assertEqual(len(queries), expected)
+                response = self.authorized_client.get(
+                    url, HTTP_IF_NONE_MATCH=etag)
+                self.assertEqual(response.status_code, 200)
+
+    def test_group_change_and_delete_break_etag(self):
+        """Перенос поста в другую группу и удаление меняют ETag."""
+        other = Group.objects.create(
+            title='other', slug='other', description='description')
+        url = reverse('posts:group_posts', kwargs={'slug': 'other'})
+        etag = self.client.get(url)['ETag']
+        post = Post.objects.get(pk=self.post.pk)
+        post.group = other
+        post.save()
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        etag = response['ETag']
+        post.delete()
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+
+    def test_changes_break_etag(self):
+        """Комментарий и подписка меняют ETag страниц."""
+        detail = reverse('posts:post_detail', kwargs={'post_id': self.post.pk})
+        profile = reverse('posts:profile', kwargs={'username': 'auth'})
+        etags = {
+            url: self.client.get(url)['ETag'] for url in (detail, profile)}
+        Comment.objects.create(post=self.post, author=self.user, text='Да')
+        reader = User.objects.create_user(username='reader')
+        Follow.objects.create(user=reader, author=self.user)
+        for url, etag in etags.items():
+            with self.subTest(url=url):
+                response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+                self.assertEqual(response.status_code, 200)
+
+    def test_user_rename_invalidates_pages(self):
+        """Смена имени автора или комментатора сбрасывает страницы,
+        где оно выводится; вход в систему - нет."""
+        reader = User.objects.create_user(username='reader')
+        Comment.objects.create(post=self.post, author=reader, text='Да')
+        detail = reverse('posts:post_detail', kwargs={'post_id': self.post.pk})
+        urls = (
+            reverse('posts:index'),
+            reverse('posts:group_posts', kwargs={'slug': 'slug'}),
+            detail,
+        )
+        for url in urls:
+            self.client.get(url)
+        scopes = ['global', 'group:slug', f'post:{self.post.pk}']
+        before = feed_cache.versions(scopes)
+        self.authorized_client.force_login(reader)
+        self.assertEqual(feed_cache.versions(scopes), before)
+        author = User.objects.get(pk=self.user.pk)
+        author.first_name = 'Лев'
+        author.save()
+        for url in urls:
+            with self.subTest(url=url):
+                self.assertContains(self.client.get(url), 'Лев')
+        reader.username = 'writer'
+        reader.save()
+        self.assertContains(self.client.get(detail), 'writer')
+
+    def test_group_slug_change_and_delete_break_etag(self):
+        """Смена адреса и удаление группы меняют ETag страниц её постов."""
+        urls = (
+            reverse('posts:profile', kwargs={'username': 'auth'}),
+            reverse('posts:post_detail', kwargs={'post_id': self.post.pk}),
+        )
+        group = Group.objects.get(pk=self.group.pk)
+        for change in ('slug', 'delete'):
+            etags = {url: self.client.get(url)['ETag'] for url in urls}
+            if change == 'slug':
+                group.slug = 'new-slug'
+                group.save()
+            else:
+                group.delete()
+            for url, etag in etags.items():
+                with self.subTest(url=url, change=change):
+                    response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+                    self.assertEqual(response.status_code, 200)
+
+
+class CacheCommitTests(TransactionTestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(username='auth')
+
+    def test_versions_bumped_again_after_commit(self):
+        """Страница, собранная до коммита, не читается после него."""
+        scopes = ['global', 'author:auth']
+        with transaction.atomic():
+            Post.objects.create(text='Пост', author=self.user)
+            # Параллельный запрос видел бы здесь старые данные
+            inside = feed_cache.versions(scopes)
+        after = feed_cache.versions(scopes)
+        self.assertNotEqual(inside, after)
+
 
 class FollowViewsTest(TestCase):
     @classmethod
@@ -321,3 +591,43 @@ class FollowViewsTest(TestCase):
         )
         post_object = response.context['page_obj']
         self.assertNotIn(post, post_object)
+
+
+class FeedQueriesTest(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.author = User.objects.create_user(username='author')
+        cls.reader = User.objects.create_user(username='reader')
+        cls.group = Group.objects.create(
+            title='Тестовая группа',
+            slug='test-slug',
+            description='Тестовое описание группы',
+        )
+        Follow.objects.create(user=cls.reader, author=cls.author)
+
+    def setUp(self):
+        self.client.force_login(self.reader)
+
+    def count_queries(self, url):
+        cache.clear()
+        with CaptureQueriesContext(connection) as queries:
+            self.client.get(url)
+        return len(queries)
+
+    def test_feed_queries_do_not_grow_with_posts(self):
+        """Число запросов ленты не зависит от числа постов на странице"""
+        urls = (
+            reverse('posts:index'),
+            reverse('posts:group_posts', kwargs={'slug': 'test-slug'}),
+            reverse('posts:profile', kwargs={'username': 'author'}),
+            reverse('posts:follow_index'),
+        )
+        Post.objects.create(text='Пост', author=self.author, group=self.group)
+        single = {url: self.count_queries(url) for url in urls}
+        for i in range(9):
+            Post.objects.create(
+                text=f'Пост {i}', author=self.author, group=self.group)
+        for url in urls:
+            with self.subTest(url=url):
+                self.assertEqual(self.count_queries(url), single[url])
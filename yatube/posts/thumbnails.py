@@ -0,0 +1,201 @@
+"""Подготовка превью картинок постов вне пути ответа.
+
+Наборы превью, которые выводят шаблоны, описаны в
+settings.POST_IMAGE_VARIANTS: каждый набор режется в нескольких
+ширинах и форматах для srcset. Превью режутся после отправки ответа на запрос,
+сохранивший пост с картинкой. Бэкенд sorl-thumbnail из этого модуля
+никогда не режет картинку при рендере: если превью ещё не готово,
+он ставит его в очередь и отдаёт исходное изображение, а страница
+с таким изображением не попадает в кеш.
+"""
+import logging
+import threading
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from PIL import features
+from sorl.thumbnail import default
+from sorl.thumbnail.base import ThumbnailBackend
+from sorl.thumbnail.conf import defaults as sorl_defaults
+from sorl.thumbnail.conf import settings as sorl_settings
+from sorl.thumbnail.helpers import deserialize, serialize
+from sorl.thumbnail.images import ImageFile
+from sorl.thumbnail.kvstores.base import KVStoreBase, add_prefix
+
+logger = logging.getLogger(__name__)
+
+_local = threading.local()
+
+
+def formats():
+    """Форматы превью; WebP - только если Pillow собран с libwebp."""
+    return [
+        image_format for image_format in settings.POST_IMAGE_VARIANT_FORMATS
+        if image_format != 'WEBP' or features.check('webp')
+    ]
+
+
+def variant_set(name):
+    """Превью набора: список (формат, ширина, геометрия, опции)."""
+    spec = settings.POST_IMAGE_VARIANTS[name]
+    ratio_width, ratio_height = spec['ratio']
+    return [
+        (
+            image_format,
+            width,
+            f'{width}x{round(width * ratio_height / ratio_width)}',
+            dict(spec['options'], format=image_format),
+        )
+        for image_format in formats()
+        for width in spec['widths']
+    ]
+
+
+def all_variants():
+    """Все превью, которые режутся для каждой картинки поста."""
+    return [
+        (geometry, options)
+        for name in settings.POST_IMAGE_VARIANTS
+        for _, _, geometry, options in variant_set(name)
+    ]
+
+
+def generate(name, variants=None):
+    """Режет все превью картинки. Возвращает число готовых превью."""
+    variants = variants or all_variants()
+    for geometry, options in variants:
+        ThumbnailBackend.get_thumbnail(
+            default.backend, name, geometry, **options)
+    return len(variants)
+
+
+def generate_entries(name):
+    """Режет превью в дочернем процессе и возвращает записи kvstore.
+
+    Возвращает пару (число превью, записи kvstore). Записи сохраняет
+    родитель через save_entries: в процесс-локальном кеше (locmem)
+    записи дочернего процесса до родителя не дошли бы.
+    """
+    _local.kv_writes = {}
+    try:
+        return generate(name), _local.kv_writes
+    finally:
+        _local.kv_writes = None
+
+
+def save_entries(entries):
+    """Пишет в кеш записи kvstore, собранные generate_entries."""
+    thumbnails_prefix = add_prefix('', identity='thumbnails')
+    for key, value in entries.items():
+        known = cache.get(key) if key.startswith(thumbnails_prefix) else None
+        if known:
+            # Список превью картинки дополняется, а не перезаписывается
+            value = serialize(sorted(
+                set(deserialize(known)) | set(deserialize(value))))
+        cache.set(key, value, None)
+
+
+def _run(name, variants):
+    try:
+        generate(name, variants)
+    except Exception:
+        logger.exception('Не удалось подготовить превью %s', name)
+
+
+def _enqueue(name, variants):
+    queue = getattr(_local, 'queue', None)
+    if queue is None:
+        # Вне запроса (команды, shell) ждать отправки ответа незачем
+        _run(name, variants)
+    else:
+        queue.setdefault(name, variants)
+
+
+def schedule(name, variants=None):
+    """Ставит картинку в очередь на нарезку после коммита транзакции."""
+    transaction.on_commit(lambda: _enqueue(name, variants))
+
+
+def start_request():
+    """Заводит очередь нарезки для запроса текущего потока."""
+    _local.queue = {}
+
+
+def finish_request():
+    """Режет превью из очереди: ответ к этому моменту уже отправлен."""
+    queue, _local.queue = getattr(_local, 'queue', None) or {}, None
+    for name, variants in queue.items():
+        _run(name, variants)
+
+
+def start_render():
+    """Сбрасывает отметку о неготовых превью перед рендером страницы."""
+    _local.incomplete = False
+
+
+def render_incomplete():
+    """Выводила ли страница оригинал вместо неготового превью."""
+    return getattr(_local, 'incomplete', False)
+
+
+class PregeneratedThumbnailBackend(ThumbnailBackend):
+    """Бэкенд sorl, который отдаёт только готовые превью."""
+
+    def get_ready(self, file_, geometry_string, **options):
+        """Готовое превью из kvstore или None, без нарезки."""
+        source = ImageFile(file_)
+        # Те же опции по умолчанию, что и в ThumbnailBackend.get_thumbnail,
+        # иначе имя превью не совпадёт с нарезанным в фоне
+        if sorl_settings.THUMBNAIL_PRESERVE_FORMAT:
+            options.setdefault('format', self._get_format(source))
+        for key, value in self.default_options.items():
+            options.setdefault(key, value)
+        for key, attr in self.extra_options:
+            value = getattr(sorl_settings, attr)
+            if value != getattr(sorl_defaults, attr):
+                options.setdefault(key, value)
+        name = self._get_thumbnail_filename(source, geometry_string, options)
+        return default.kvstore.get(ImageFile(name, default.storage))
+
+    def get_thumbnail(self, file_, geometry_string, **options):
+        if not file_:
+            raise ValueError('falsey file_ argument in get_thumbnail()')
+        cached = self.get_ready(file_, geometry_string, **options)
+        if cached:
+            return cached
+        _local.incomplete = True
+        source = ImageFile(file_)
+        if source.exists():
+            schedule(source.name)
+        return source
+
+
+def is_ready(name, variants=None):
+    """Нарезаны ли все превью картинки."""
+    backend = PregeneratedThumbnailBackend()
+    return all(
+        backend.get_ready(name, geometry, **options)
+        for geometry, options in variants or all_variants()
+    )
+
+
+class CacheKVStore(KVStoreBase):
+    """Метаданные превью sorl в общем кеше вместо таблицы БД:
+    нарезка и проверка готовности не ходят в базу."""
+
+    def _get_raw(self, key):
+        return cache.get(key)
+
+    def _set_raw(self, key, value):
+        writes = getattr(_local, 'kv_writes', None)
+        if writes is not None:
+            writes[key] = value
+        cache.set(key, value, None)
+
+    def _delete_raw(self, *keys):
+        cache.delete_many(keys)
+
+    def _find_keys_raw(self, prefix):
+        # Кеш не умеет искать ключи по префиксу
+        return []
@@ -0,0 +1,263 @@
+"""Материализованная лента подписок (fan-out on write).
+
+Новый пост раскладывается в ленты подписчиков автора при сохранении.
+Посты авторов с очень большим числом подписчиков не раскладываются,
+а подмешиваются в ленту при чтении (fan-out on read). Когда число
+подписчиков автора пересекает TIMELINE_FANOUT_LIMIT, его записи
+убираются из лент или дописываются в них, так что каждый пост ленты
+читается ровно из одного источника.
+
+Страница ленты - слияние по (дата, id) страницы материализованной
+ленты и страниц каждого популярного автора; каждая часть читается
+по своему индексу с LIMIT.
+"""
+import heapq
+from itertools import islice
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.db.models import F
+
+from .models import Follow, Post, TimelineEntry, UserCounters
+
+BATCH_SIZE = 500
+
+
+def celebrities():
+    """Счётчики авторов, чьи посты читаются из ленты без раскладки.
+
+    Единственное определение популярного автора для записи и чтения
+    ленты: автор без строки счётчиков популярным не считается (так же
+    считает rebuild_all), иначе его пост мог бы не попасть в ленту
+    ни при раскладке, ни при чтении.
+    """
+    return UserCounters.objects.filter(
+        followers_count__gt=settings.TIMELINE_FANOUT_LIMIT)
+
+
+def is_celebrity(author_id):
+    """Автор, чьи посты читаются из ленты без раскладки."""
+    return celebrities().filter(user_id=author_id).exists()
+
+
+def _bulk_insert(entries):
+    TimelineEntry.objects.bulk_create(
+        entries, batch_size=BATCH_SIZE, ignore_conflicts=True)
+
+
+def fan_out_post(post):
+    """Кладёт новый пост в ленты всех подписчиков автора."""
+    if is_celebrity(post.author_id):
+        return
+    followers = Follow.objects.filter(
+        author_id=post.author_id).values_list('user_id', flat=True)
+    _bulk_insert(
+        TimelineEntry(user_id=user_id, post=post, pub_date=post.pub_date)
+        for user_id in followers.iterator()
+    )
+
+
+def add_author(user_id, author_id):
+    """Дописывает посты автора в ленту нового подписчика."""
+    add_authors(user_id, [author_id])
+
+
+def add_authors(user_id, author_ids):
+    """Дописывает посты нескольких авторов одним запросом."""
+    posts = Post.objects.filter(author_id__in=author_ids).exclude(
+        author_id__in=celebrities().filter(
+            user_id__in=author_ids).values('user')
+    ).values_list('pk', 'pub_date')
+    _bulk_insert(
+        TimelineEntry(user_id=user_id, post_id=pk, pub_date=pub_date)
+        for pk, pub_date in posts.iterator()
+    )
+
+
+def remove_author(user_id, author_id):
+    """Убирает посты автора из ленты отписавшегося пользователя."""
+    remove_authors(user_id, [author_id])
+
+
+def remove_authors(user_id, author_ids):
+    TimelineEntry.objects.filter(
+        user_id=user_id, post__author_id__in=author_ids).delete()
+
+
+def rebuild(user_id):
+    """Пересобирает ленту пользователя с нуля."""
+    TimelineEntry.objects.filter(user_id=user_id).delete()
+    authors = Follow.objects.filter(
+        user_id=user_id).values_list('author_id', flat=True)
+    for author_id in authors:
+        add_author(user_id, author_id)
+
+
+def rebuild_all():
+    """Пересобирает все ленты одним INSERT ... SELECT вместо запроса
+    на каждую пару читатель - автор."""
+    with transaction.atomic(), connection.cursor() as cursor:
+        TimelineEntry.objects.all().delete()
+        cursor.execute(
+            f'INSERT INTO {TimelineEntry._meta.db_table} '
+            '(user_id, post_id, pub_date) '
+            'SELECT follow.user_id, post.id, post.pub_date '
+            f'FROM {Follow._meta.db_table} follow '
+            f'JOIN {Post._meta.db_table} post '
+            'ON post.author_id = follow.author_id '
+            f'LEFT JOIN {UserCounters._meta.db_table} counters '
+            'ON counters.user_id = follow.author_id '
+            'WHERE COALESCE(counters.followers_count, 0) <= %s',
+            [settings.TIMELINE_FANOUT_LIMIT],
+        )
+        return cursor.rowcount
+
+
+def _backfill(author_ids):
+    """Дописывает посты авторов в ленты всех их подписчиков."""
+    placeholders = ', '.join(['%s'] * len(author_ids))
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f'INSERT INTO {TimelineEntry._meta.db_table} '
+            '(user_id, post_id, pub_date) '
+            'SELECT follow.user_id, post.id, post.pub_date '
+            f'FROM {Follow._meta.db_table} follow '
+            f'JOIN {Post._meta.db_table} post '
+            'ON post.author_id = follow.author_id '
+            f'WHERE follow.author_id IN ({placeholders}) '
+            f'AND NOT EXISTS (SELECT 1 FROM {TimelineEntry._meta.db_table} '
+            'entry WHERE entry.user_id = follow.user_id '
+            'AND entry.post_id = post.id)',
+            list(author_ids),
+        )
+
+
+def followers_changed(author_ids, delta):
+    """Переключает раскладку авторов, у которых после сдвига счётчика
+    подписчиков на delta число подписчиков пересекло
+    TIMELINE_FANOUT_LIMIT. Вызывается после обновления счётчиков."""
+    limit = settings.TIMELINE_FANOUT_LIMIT
+    # Счётчики уже сдвинуты: ищем тех, кто был по другую сторону
+    if delta > 0:
+        bounds = {'followers_count__gt': limit,
+                  'followers_count__lte': limit + delta}
+    else:
+        bounds = {'followers_count__gt': limit + delta,
+                  'followers_count__lte': limit}
+    crossed = list(UserCounters.objects.filter(
+        user_id__in=author_ids, **bounds).values_list('user_id', flat=True))
+    if not crossed:
+        return
+    if delta > 0:
+        TimelineEntry.objects.filter(post__author_id__in=crossed).delete()
+    else:
+        _backfill(crossed)
+
+
+def followed_celebrities(user):
+    """Авторы из подписок пользователя, чьи посты читаются напрямую."""
+    return celebrities().filter(
+        user__following__user=user).values_list('user_id', flat=True)
+
+
+def timeline_posts(user):
+    """Посты материализованной ленты в порядке индекса записей ленты."""
+    return Post.objects.filter(timeline_entries__user=user).annotate(
+        feed_date=F('timeline_entries__pub_date'),
+        feed_id=F('timeline_entries__post_id'),
+    )
+
+
+def author_posts(author_id):
+    """Посты автора без раскладки с теми же полями позиции в ленте."""
+    return Post.objects.filter(author_id=author_id).annotate(
+        feed_date=F('pub_date'), feed_id=F('id'))
+
+
+def _position(obj):
+    if isinstance(obj, dict):
+        return obj['feed_date'], obj['feed_id']
+    return obj.feed_date, obj.feed_id
+
+
+class FollowFeed:
+    """Лента подписок из нескольких выборок, слитых по (дата, id).
+
+    Части не пересекаются, поэтому срез ленты - слияние таких же
+    срезов частей. Поддерживает то, что нужно Paginator и
+    CursorPaginator (с полями курсора CURSOR_FIELDS): count(), срезы,
+    order_by() и filter(), а также values() и for_feed().
+    """
+
+    ordered = True
+
+    def __init__(self, parts, ascending=False):
+        self.parts = parts
+        self.ascending = ascending
+
+    def _each(self, method, *args, **kwargs):
+        return FollowFeed(
+            [getattr(part, method)(*args, **kwargs) for part in self.parts],
+            ascending=self.ascending,
+        )
+
+    def count(self):
+        return sum(part.count() for part in self.parts)
+
+    def __len__(self):
+        return self.count()
+
+    def order_by(self, *fields):
+        feed = self._each('order_by', *fields)
+        feed.ascending = not fields[0].startswith('-')
+        return feed
+
+    def filter(self, *args, **kwargs):
+        return self._each('filter', *args, **kwargs)
+
+    def values(self, *fields):
+        return self._each('values', *fields, 'feed_date', 'feed_id')
+
+    def for_feed(self):
+        return self._each('for_feed')
+
+    def __iter__(self):
+        return iter(self[:])
+
+    def __getitem__(self, key):
+        if not isinstance(key, slice):
+            objects = self[key:key + 1]
+            if not objects:
+                raise IndexError(key)
+            return objects[0]
+        if len(self.parts) == 1:
+            # Без популярных авторов срез целиком делает база
+            return list(self.parts[0][key])
+        start, stop = key.start or 0, key.stop
+        parts = [part if stop is None else part[:stop] for part in self.parts]
+        merged = heapq.merge(
+            *parts, key=_position, reverse=not self.ascending)
+        return list(islice(merged, start, stop))
+
+    @property
+    def cursor_only(self):
+        """Срез со смещением из нескольких частей читает из каждой
+        все строки до конца среза, поэтому такую ленту листают только
+        курсором."""
+        return len(self.parts) > 1
+
+
+# Поля позиции в ленте подписок для CursorPaginator
+CURSOR_FIELDS = {'date_field': 'feed_date', 'id_field': 'feed_id'}
+
+
+def feed_for(user):
+    """Лента подписок: материализованная часть плюс авторы,
+    для которых раскладка не делалась."""
+    ordering = ('-feed_date', '-feed_id')
+    return FollowFeed([
+        queryset.order_by(*ordering) for queryset in (
+            timeline_posts(user),
+            *map(author_posts, followed_celebrities(user)),
+        )
+    ])
@@ -1,6 +1,6 @@
 from django.urls import path
 
-from . import views
+from . import api, views
 
 app_name = 'posts'
 
@@ -16,8 +16,12 @@ urlpatterns = [
     # Страница редактирования постов
     path('posts/<post_id>/edit/', views.post_edit, name='post_edit'),
     # Комментарии
+    path('posts/<int:post_id>/comments/', views.post_comments,
+         name='post_comments'),
     path('posts/<int:post_id>/comment/', views.add_comment,
          name='add_comment'),
+    # Поиск по постам и комментариям
+    path('search/', views.search, name='search'),
     # Посты с подпиской
     path('follow/', views.follow_index, name='follow_index'),
     # Подписка
@@ -32,6 +36,28 @@ urlpatterns = [
         views.profile_unfollow,
         name='profile_unfollow'
     ),
+    # JSON API для чтения лент
+    path('api/posts/', api.posts, name='api_posts'),
+    path('api/posts/<int:post_id>/', api.post_detail, name='api_post_detail'),
+    path(
+        'api/posts/<int:post_id>/comments/',
+        api.post_comments,
+        name='api_post_comments'
+    ),
+    path('api/group/<slug:slug>/', api.group_posts, name='api_group_posts'),
+    path(
+        'api/profile/<str:username>/',
+        api.profile_posts,
+        name='api_profile_posts'
+    ),
+    path('api/follow/', api.follow_posts, name='api_follow_posts'),
+    # Подписка и отписка на нескольких авторов одним запросом
+    path('api/follows/', api.follows, name='api_follows'),
+    path(
+        'api/follows/suggestions/',
+        api.follow_suggestions,
+        name='api_follow_suggestions'
+    ),
     # Главная страница
     path('', views.index, name='index'),
 ]
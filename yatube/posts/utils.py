@@ -1,9 +1,220 @@
+import base64
+
+from django.conf import settings
 from django.core.paginator import Paginator
+from django.db.models import Q
+from django.utils.dateparse import parse_datetime
+from django.utils.functional import cached_property
+
+from .models import Comment
 
 POSTS_PER_PAGE = 10
+COMMENTS_PER_PAGE = 20
+CURSOR_PARAM = 'cursor'
+# Курсор и порядок комментариев на странице поста
+COMMENTS_CURSOR_PARAM = 'comments_cursor'
+COMMENTS_ORDER_PARAM = 'comments_order'
+NEWEST = 'newest'
+OLDEST = 'oldest'
+# Номера страниц вокруг текущей и у краёв навигации
+PAGES_ON_EACH_SIDE = 2
+PAGES_ON_ENDS = 1
+# Пропуск в навигации вместо номеров страниц
+ELLIPSIS = None
+# Направления перехода по курсору
+NEXT = 'n'
+PREVIOUS = 'p'
+
+
+def encode_cursor(obj, direction, date_field='pub_date', id_field='pk'):
+    """Упаковывает позицию объекта в ленте в непрозрачный токен.
+
+    Объект - модель или словарь из .values() с полями даты и id.
+    """
+    if isinstance(obj, dict):
+        date = obj[date_field]
+        pk = obj['id' if id_field == 'pk' else id_field]
+    else:
+        date, pk = getattr(obj, date_field), getattr(obj, id_field)
+    raw = f'{direction}|{date.isoformat()}|{pk}'
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip('=')
+
+
+def decode_cursor(token):
+    """Распаковывает токен курсора, для битого токена возвращает None."""
+    try:
+        raw = base64.urlsafe_b64decode(token + '=' * (-len(token) % 4))
+        direction, date, pk = raw.decode().split('|')
+        date = parse_datetime(date)
+        pk = int(pk)
+    except ValueError:
+        return None
+    if direction not in (NEXT, PREVIOUS) or date is None:
+        return None
+    return direction, date, pk
+
+
+class CursorPage:
+    """Страница ленты, выбранная по курсору без OFFSET и COUNT(*)."""
+
+    is_cursor = True
+
+    def __init__(self, object_list, paginator, has_next, has_previous):
+        self.object_list = object_list
+        self.paginator = paginator
+        self._has_next = has_next
+        self._has_previous = has_previous
+
+    def __repr__(self):
+        return f'<CursorPage ({len(self)} objects)>'
+
+    def __len__(self):
+        return len(self.object_list)
+
+    def __getitem__(self, index):
+        return self.object_list[index]
+
+    def __iter__(self):
+        return iter(self.object_list)
+
+    def has_next(self):
+        return self._has_next
+
+    def has_previous(self):
+        return self._has_previous
+
+    def has_other_pages(self):
+        return self.has_next() or self.has_previous()
+
+    @property
+    def next_cursor(self):
+        if not self.has_next():
+            return None
+        return self.paginator.encode(self.object_list[-1], NEXT)
+
+    @property
+    def previous_cursor(self):
+        if not self.has_previous():
+            return None
+        return self.paginator.encode(self.object_list[0], PREVIOUS)
+
+
+class CursorPaginator:
+    """Keyset-пагинация по паре (дата, id): стоимость страницы
+    не зависит от её глубины. По умолчанию новые объекты идут первыми,
+    ascending=True листает от старых к новым."""
+
+    def __init__(self, queryset, per_page, date_field='pub_date',
+                 ascending=False, id_field='pk'):
+        self.queryset = queryset
+        self.per_page = per_page
+        self.date_field = date_field
+        self.id_field = id_field
+        self.ascending = ascending
+
+    @cached_property
+    def count(self):
+        """Общее число объектов, считается только по запросу."""
+        return self.queryset.count()
+
+    def encode(self, obj, direction):
+        return encode_cursor(obj, direction, self.date_field, self.id_field)
+
+    def get_page(self, token=None):
+        cursor = decode_cursor(token) if token else None
+        if cursor is None:
+            objects, has_more = self._fetch(self._ordered())
+            return CursorPage(objects, self, has_more, False)
+        direction, date, pk = cursor
+        if direction == NEXT:
+            queryset = self._ordered().filter(self._beyond(date, pk))
+            objects, has_more = self._fetch(queryset)
+            return CursorPage(objects, self, has_more, True)
+        queryset = self._ordered(reverse=True).filter(
+            self._beyond(date, pk, reverse=True))
+        objects, has_more = self._fetch(queryset)
+        if not has_more:
+            # Дошли до начала ленты - отдаём полную первую страницу
+            return self.get_page()
+        objects.reverse()
+        return CursorPage(objects, self, True, True)
+
+    def _beyond(self, date, pk, reverse=False):
+        """Объекты после позиции (дата, id) в порядке ленты
+        или, с reverse, перед ней."""
+        lookup = 'gt' if self.ascending != reverse else 'lt'
+        return (
+            Q(**{f'{self.date_field}__{lookup}': date})
+            | Q(**{self.date_field: date, f'{self.id_field}__{lookup}': pk})
+        )
+
+    def _ordered(self, reverse=False):
+        if self.ascending != reverse:
+            return self.queryset.order_by(self.date_field, self.id_field)
+        return self.queryset.order_by(
+            f'-{self.date_field}', f'-{self.id_field}')
+
+    def _fetch(self, queryset):
+        """Берёт на один объект больше, чтобы узнать о следующей
+        странице без COUNT(*)."""
+        objects = list(queryset[:self.per_page + 1])
+        return objects[:self.per_page], len(objects) > self.per_page
+
+
+def page_window(page, on_each_side=PAGES_ON_EACH_SIDE,
+                on_ends=PAGES_ON_ENDS):
+    """Номера страниц для навигации: края и окно вокруг текущей,
+    пропуски помечены ELLIPSIS. Длина не зависит от числа страниц."""
+    num_pages = page.paginator.num_pages
+    number = page.number
+    window = range(
+        max(number - on_each_side, 1),
+        min(number + on_each_side, num_pages) + 1,
+    )
+    head = range(1, min(on_ends, window.start - 1) + 1)
+    tail = range(max(num_pages - on_ends + 1, window.stop), num_pages + 1)
+    pages = list(head)
+    # Пропуск ровно одной страницы показываем её номером
+    if head and window.start > head.stop:
+        pages.append(
+            head.stop if window.start == head.stop + 1 else ELLIPSIS)
+    pages.extend(window)
+    if tail and tail.start > window.stop:
+        pages.append(
+            window.stop if tail.start == window.stop + 1 else ELLIPSIS)
+    pages.extend(tail)
+    return pages
+
+
+def comments_order(order=None):
+    """NEWEST или OLDEST; по умолчанию - как в Comment.Meta.ordering."""
+    if order in (NEWEST, OLDEST):
+        return order
+    return NEWEST if Comment._meta.ordering[0].startswith('-') else OLDEST
+
+
+def get_comments_page(post, token=None, order=None):
+    """Страница комментариев поста по курсору. Запрос идёт по индексу
+    (post, -created) и не зависит от числа комментариев."""
+    paginator = CursorPaginator(
+        post.comment.select_related('author').only(
+            'text', 'created', 'post_id', 'author__username'),
+        COMMENTS_PER_PAGE,
+        date_field='created',
+        ascending=comments_order(order) == OLDEST,
+    )
+    return paginator.get_page(token)
 
 
-def get_paginator(queryset, request):
+def get_paginator(queryset, request, cursor=None, **cursor_fields):
+    if cursor is None:
+        cursor = (
+            CURSOR_PARAM in request.GET
+            or settings.POSTS_CURSOR_PAGINATION
+        )
+    if cursor:
+        paginator = CursorPaginator(queryset, POSTS_PER_PAGE, **cursor_fields)
+        return paginator.get_page(request.GET.get(CURSOR_PARAM))
     paginator = Paginator(queryset, POSTS_PER_PAGE)
     page_number = request.GET.get('page')
     return paginator.get_page(page_number)
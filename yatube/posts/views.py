@@ -1,14 +1,32 @@
+from urllib.parse import urlencode
+
+from django.http import Http404, HttpResponse, JsonResponse
 from django.shortcuts import get_object_or_404, render, redirect
-from .models import Comment, Follow, Group, Post, User
+from django.template.loader import render_to_string
+from .models import Group, Post, User
 from django.contrib.auth.decorators import login_required
+
+from core.middleware import query_budget
+from core.routers import replica_reads
+
+from . import archive, counters, following, suggestions
+from .cache import cache_feed, conditional_feed, post_scopes
 from .forms import CommentForm, PostForm
-from .utils import get_paginator
-from django.views.decorators.cache import cache_page
+from .search import SearchPaginator
+from .timeline import CURSOR_FIELDS, feed_for
+from .utils import (COMMENTS_CURSOR_PARAM, COMMENTS_ORDER_PARAM, CURSOR_PARAM,
+                    comments_order, get_comments_page, get_paginator)
 
+# Ленты читают страницу одним запросом с подтянутыми связями:
+# больше десятка запросов - признак N+1
+FEED_QUERY_BUDGET = 10
 
-@cache_page(20, key_prefix='index_page')
+
+@query_budget(FEED_QUERY_BUDGET)
+@replica_reads
+@cache_feed('global')
 def index(request):
-    post_list = Post.objects.all()
+    post_list = Post.objects.for_feed()
     paginat = get_paginator(post_list, request)
     context = {
         'page_obj': paginat,
@@ -16,9 +34,13 @@ def index(request):
     return render(request, 'posts/index.html', context)
 
 
+@query_budget(FEED_QUERY_BUDGET)
+@replica_reads
+@conditional_feed('group:{slug}')
+@cache_feed('group:{slug}')
 def group_posts(request, slug):
     group = get_object_or_404(Group, slug=slug)
-    posts = group.posts.select_related('group').all()
+    posts = group.posts.for_feed()
     paginat = get_paginator(posts, request)
     context = {
         'group': group,
@@ -27,9 +49,29 @@ def group_posts(request, slug):
     return render(request, 'posts/group_list.html', context)
 
 
+@query_budget(FEED_QUERY_BUDGET)
+def search(request):
+    query = request.GET.get('q', '').strip()
+    page = None
+    if query:
+        page = SearchPaginator(query).get_page(request.GET.get(CURSOR_PARAM))
+    context = {
+        'query': query,
+        'page_obj': page,
+        'page_params': urlencode({'q': query}) + '&',
+    }
+    return render(request, 'posts/search.html', context)
+
+
+@query_budget(FEED_QUERY_BUDGET)
+@replica_reads
+@conditional_feed('author:{username}')
+@cache_feed('author:{username}')
 def profile(request, username):
-    author = get_object_or_404(User, username=username)
-    posts = author.posts.all()
+    author = get_object_or_404(
+        User.objects.select_related('counters'), username=username)
+    counters.for_user(author)
+    posts = archive.author_feed(author)
     paginat = get_paginator(posts, request)
     following = request.user.is_authenticated and request.user.follower.filter(
         author=author)
@@ -41,24 +83,46 @@ def profile(request, username):
     return render(request, 'posts/profile.html', context)
 
 
+@query_budget(FEED_QUERY_BUDGET)
+@replica_reads
+@conditional_feed(post_scopes)
+@cache_feed(post_scopes, anonymous_only=True)
 def post_detail(request, post_id):
-    post = get_object_or_404(Post, pk=post_id)
-    comment = post.comment.all()
+    post = archive.get_post_or_404(post_id, detail=True)
+    counters.for_user(post.author)
     form = CommentForm()
-    comment = Comment.objects.filter(post_id=post_id)
+    order = comments_order(request.GET.get(COMMENTS_ORDER_PARAM))
+    comments = get_comments_page(
+        post, request.GET.get(COMMENTS_CURSOR_PARAM), order)
     author = post.author
     context = {
         'post': post,
         'author': author,
         'form': form,
-        'comment': comment,
+        'comments': comments,
+        'comments_order': order,
     }
     return render(request, 'posts/post_detail.html', context)
 
 
+@query_budget(FEED_QUERY_BUDGET)
+@cache_feed('post:{post_id}')
+def post_comments(request, post_id):
+    """Следующая страница комментариев поста фрагментом HTML."""
+    post = archive.get_post_or_404(post_id)
+    order = comments_order(request.GET.get(COMMENTS_ORDER_PARAM))
+    context = {
+        'post': post,
+        'comments': get_comments_page(
+            post, request.GET.get(CURSOR_PARAM), order),
+        'comments_order': order,
+    }
+    return render(request, 'posts/includes/comment_list.html', context)
+
+
 @login_required
 def post_create(request):
-    form = PostForm(request.POST or None)
+    form = PostForm(request.POST or None, files=request.FILES or None)
     if request.method == "POST":
         if form.is_valid():
             post = form.save(False)
@@ -94,43 +158,68 @@ def post_edit(request, post_id):
     return render(request, 'posts/create_post.html', context)
 
 
+def wants_json(request):
+    return 'application/json' in request.META.get('HTTP_ACCEPT', '')
+
+
 @login_required
 def add_comment(request, post_id):
     post = get_object_or_404(Post, pk=post_id)
     form = CommentForm(request.POST or None)
+    comment = None
     if form.is_valid():
         comment = form.save(commit=False)
         comment.author = request.user
         comment.post = post
         comment.save()
-    return redirect('posts:post_detail', post_id=post_id)
-
-
+    if not request.is_ajax():
+        return redirect('posts:post_detail', post_id=post_id)
+    # Запрос со страницы поста: вместо перерисовки всей страницы
+    # отдаём только новый комментарий
+    if comment is None:
+        return JsonResponse({'errors': form.errors}, status=400)
+    html = render_to_string(
+        'posts/includes/comment_item.html', {'comment': comment}, request)
+    if wants_json(request):
+        return JsonResponse({
+            'id': comment.pk,
+            'author': request.user.username,
+            'text': comment.text,
+            'created': comment.created,
+            'html': html,
+        }, status=201)
+    return HttpResponse(html, status=201)
+
+
+@query_budget(FEED_QUERY_BUDGET)
 @login_required
+@replica_reads
 def follow_index(request):
-    posts = Post.objects.select_related('author').filter(
-        author__following__user=request.user
-    )
-    paginat = get_paginator(posts, request)
+    posts = feed_for(request.user).for_feed()
+    paginat = get_paginator(
+        posts, request, cursor=posts.cursor_only or None, **CURSOR_FIELDS)
     context = {
         'page_obj': paginat,
         'follow': True,
+        'suggestions': suggestions.for_user(request.user),
     }
     return render(request, 'posts/follow.html', context)
 
 
+def _follow_redirect(done, username):
+    """Редирект на профиль; 404, если такого автора нет."""
+    if not done and not User.objects.filter(username=username).exists():
+        raise Http404('Автор не найден')
+    return redirect('posts:profile', username=username)
+
+
 @login_required
 def profile_follow(request, username):
-    author = get_object_or_404(User, username=username)
-    if author != request.user:
-        Follow.objects.get_or_create(user=request.user, author=author)
-    return redirect('posts:profile', username=username)
+    done = following.follow(request.user, [username])
+    return _follow_redirect(done, username)
 
 
 @login_required
 def profile_unfollow(request, username):
-    author = get_object_or_404(User, username=username)
-    is_follower = Follow.objects.filter(user=request.user, author=author)
-    if is_follower.exists():
-        is_follower.delete()
-    return redirect('posts:profile', username=author)
+    done = following.unfollow(request.user, [username])
+    return _follow_redirect(done, username)
@@ -0,0 +1,59 @@
+// Комментарии без перезагрузки страницы: сервер отвечает на отправку
+// формы и на "Показать ещё" готовыми HTML-фрагментами. Без JavaScript
+// форма и ссылка работают как обычно.
+document.addEventListener('DOMContentLoaded', function () {
+  var list = document.getElementById('comments');
+  if (!list) {
+    return;
+  }
+  var headers = {'X-Requested-With': 'XMLHttpRequest'};
+
+  var form = document.querySelector('form[data-comment-form]');
+  if (form) {
+    form.addEventListener('submit', function (event) {
+      event.preventDefault();
+      fetch(form.action, {
+        method: 'POST',
+        body: new FormData(form),
+        headers: headers,
+        credentials: 'same-origin'
+      }).then(function (response) {
+        if (!response.ok) {
+          throw new Error(response.status);
+        }
+        return response.text();
+      }).then(function (html) {
+        if (list.dataset.order !== 'oldest') {
+          list.insertAdjacentHTML('afterbegin', html);
+        } else if (!list.querySelector('a[data-comments-more]')) {
+          // От старых к новым комментарий встаёт в конец, а если
+          // не все страницы загружены - придёт с последней из них
+          list.insertAdjacentHTML('beforeend', html);
+        }
+        form.reset();
+      }).catch(function () {
+        form.submit();
+      });
+    });
+  }
+
+  list.addEventListener('click', function (event) {
+    var link = event.target.closest('a[data-comments-more]');
+    if (!link) {
+      return;
+    }
+    event.preventDefault();
+    fetch(link.dataset.commentsMore, {headers: headers})
+      .then(function (response) {
+        if (!response.ok) {
+          throw new Error(response.status);
+        }
+        return response.text();
+      }).then(function (html) {
+        link.parentElement.remove();
+        list.insertAdjacentHTML('beforeend', html);
+      }).catch(function () {
+        window.location = link.href;
+      });
+  });
+});
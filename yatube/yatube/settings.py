@@ -12,6 +12,8 @@ https://docs.djangoproject.com/en/2.2/ref/settings/
 
 import os
 
+from core.cache import cache_config
+
 # Build paths inside the project like this: os.path.join(BASE_DIR, ...)
 BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
 
@@ -50,7 +52,9 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'core.instrumentation.InstrumentationMiddleware',
     'django.middleware.security.SecurityMiddleware',
+    'core.routers.ReplicaPinningMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
@@ -58,16 +62,36 @@ MIDDLEWARE = [
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
+if DEBUG:
+    # Бюджет SQL-запросов проверяется только при разработке
+    MIDDLEWARE.insert(
+        MIDDLEWARE.index('core.routers.ReplicaPinningMiddleware') + 1,
+        'core.middleware.QueryBudgetMiddleware',
+    )
 
 ROOT_URLCONF = 'yatube.urls'
 
 TEMPLATES_DIR = os.path.join(BASE_DIR, 'templates')
+TEMPLATE_LOADERS = [
+    'django.template.loaders.filesystem.Loader',
+    'django.template.loaders.app_directories.Loader',
+]
+# Профилирование рендера шаблонов и include (manage.py profile_templates)
+TEMPLATE_PROFILING = os.getenv('YATUBE_TEMPLATE_PROFILING') == '1'
+if TEMPLATE_PROFILING:
+    TEMPLATE_LOADERS = [
+        ('core.instrumentation.ProfilingLoader', TEMPLATE_LOADERS)]
+elif not DEBUG:
+    # Шаблоны разбираются один раз на процесс, а не на каждый запрос
+    TEMPLATE_LOADERS = [
+        ('django.template.loaders.cached.Loader', TEMPLATE_LOADERS)]
 TEMPLATES = [
     {
-        'BACKEND': 'django.template.backends.django.DjangoTemplates',
+        'BACKEND': 'core.instrumentation.InstrumentedDjangoTemplates',
+        'NAME': 'django',
         'DIRS': [TEMPLATES_DIR],
-        'APP_DIRS': True,
         'OPTIONS': {
+            'loaders': TEMPLATE_LOADERS,
             'context_processors': [
                 'django.template.context_processors.debug',
                 'django.template.context_processors.request',
@@ -89,9 +113,41 @@ DATABASES = {
     'default': {
         'ENGINE': 'django.db.backends.sqlite3',
         'NAME': os.path.join(BASE_DIR, 'db.sqlite3'),
+        # Соединение живёт между запросами, а не открывается заново
+        'CONN_MAX_AGE': 60,
     }
 }
 
+# PRAGMA для каждого соединения SQLite (core/sqlite.py),
+# YATUBE_SQLITE_TUNING=0 оставляет умолчания SQLite
+SQLITE_PRAGMAS = {
+    'journal_mode': 'WAL',
+    'synchronous': 'NORMAL',
+    # Отрицательное значение - в килобайтах: 64 МБ кеша страниц
+    'cache_size': -64000,
+    'mmap_size': 256 * 1024 * 1024,
+    'busy_timeout': 5000,
+}
+if os.getenv('YATUBE_SQLITE_TUNING') == '0':
+    SQLITE_PRAGMAS = {}
+
+# Реплики для чтения лент, файлы через запятую:
+# YATUBE_REPLICAS=/var/tmp/replica1.sqlite3,/var/tmp/replica2.sqlite3
+# Локально их заполняет manage.py sync_replicas
+DATABASE_REPLICAS = []
+for number, path in enumerate(
+        filter(None, os.getenv('YATUBE_REPLICAS', '').split(',')), 1):
+    DATABASES[f'replica{number}'] = {
+        'ENGINE': 'django.db.backends.sqlite3',
+        'NAME': path,
+        'CONN_MAX_AGE': 60,
+        'TEST': {'MIRROR': 'default'},
+    }
+    DATABASE_REPLICAS.append(f'replica{number}')
+DATABASE_ROUTERS = ['core.routers.ReplicaRouter']
+# Сколько секунд после записи пользователь читает с основной базы
+REPLICA_PIN_SECONDS = 10
+
 
 # Password validation
 # https://docs.djangoproject.com/en/2.2/ref/settings/#auth-password-validators
@@ -148,8 +204,69 @@ MEDIA_URL = '/media/'
 
 MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
 
+# Общий для всех воркеров кеш задаётся URL-ом, например
+# file:///var/tmp/yatube-cache или redis://127.0.0.1:6379/1,
+# подробнее в core/cache.py
 CACHES = {
-    'default': {
-        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
-    }
+    'default': cache_config(os.getenv('YATUBE_CACHE_URL', 'locmem://')),
+}
+
+# Keyset-пагинация лент по курсору вместо номеров страниц.
+# Включается для отдельных запросов параметром ?cursor=
+POSTS_CURSOR_PAGINATION = False
+
+# Авторы с большим числом подписчиков не раскладываются по лентам
+# при публикации, их посты подмешиваются в ленту при чтении
+TIMELINE_FANOUT_LIMIT = 1000
+
+# Посты старше стольких дней archive_posts переносит в архивные
+# таблицы, чтобы горячая таблица постов оставалась небольшой
+ARCHIVE_AFTER_DAYS = 365
+
+# Сколько SQL-запросов может выполнить один view (None - не считать);
+# view может задать свой бюджет декоратором core.middleware.query_budget.
+# Считается только при DEBUG. В строгом режиме превышение бюджета
+# роняет запрос, иначе пишется в лог
+QUERY_BUDGET = 30 if DEBUG else None
+QUERY_BUDGET_STRICT = DEBUG
+
+# Доля запросов, для которых замеряются SQL, кеш и шаблоны
+# (заголовок Server-Timing); время ответа считается для всех
+INSTRUMENTATION_SAMPLE_RATE = 1.0 if DEBUG else 0.1
+# Токен, с которым Prometheus забирает метрики (заголовок
+# Authorization: Bearer <токен>). Без токена /metrics/ отдаёт 404
+METRICS_TOKEN = os.getenv('YATUBE_METRICS_TOKEN')
+
+# Время жизни страниц лент в кеше. Свежесть обеспечивают версии
+# областей кеша, которые повышаются сигналами при изменении данных
+FEED_CACHE_TIMEOUT = 60 * 60 * 24
+
+# Превью режутся после отправки ответа, шаблоны берут только готовые
+THUMBNAIL_BACKEND = 'posts.thumbnails.PregeneratedThumbnailBackend'
+THUMBNAIL_KVSTORE = 'posts.thumbnails.CacheKVStore'
+# Наборы превью картинок постов для {% responsive_image %}: пропорции,
+# ширины для srcset, опции sorl и атрибут sizes тега <img>
+POST_IMAGE_VARIANTS = {
+    'feed': {
+        'ratio': (960, 339),
+        'widths': (480, 720, 960),
+        'options': {'crop': '', 'padding': True, 'upscale': True},
+        'sizes': '(max-width: 576px) 100vw, 960px',
+        'lazy': True,
+    },
+    'detail': {
+        'ratio': (960, 339),
+        'widths': (480, 720, 960),
+        'options': {'crop': 'center', 'upscale': True},
+        'sizes': '(max-width: 768px) 100vw, 75vw',
+        'lazy': False,
+    },
 }
+# Форматы в порядке предпочтения, последний понимают все браузеры
+POST_IMAGE_VARIANT_FORMATS = ('WEBP', 'JPEG')
+
+# Загружаемые картинки уменьшаются, теряют метаданные и перекодируются
+POST_IMAGE_MAX_SIZE = 1920
+POST_IMAGE_MAX_UPLOAD_SIZE = 20 * 1024 * 1024
+POST_IMAGE_FORMAT = 'WEBP'
+POST_IMAGE_QUALITY = 82
@@ -3,6 +3,8 @@ from django.urls import include, path
 from django.conf import settings
 from django.conf.urls.static import static
 
+from core.views import cache_stats, metrics
+
 handler500 = 'core.views.server_error'
 handler404 = 'core.views.page_not_found'
 handler403 = 'core.views.permission_denied'
@@ -13,6 +15,8 @@ urlpatterns = [
     path('auth/', include('users.urls')),
     path('auth/', include('django.contrib.auth.urls')),
     path('about/', include('about.urls', namespace='about')),
+    path('cache-stats/', cache_stats, name='cache_stats'),
+    path('metrics/', metrics, name='metrics'),
 ]
 
 if settings.DEBUG: